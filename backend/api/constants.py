@@ -1,4 +1,35 @@
+AUTHOR_STATS_DEFAULT_DAYS = 30
+AUTHOR_STATS_MAX_DAYS = 366
+IMAGE_CONTENT_TYPES = {
+    'image/gif': 'gif',
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+}
+IMAGE_UPLOAD_CHUNK_SIZE = 64 * 1024
+IMAGE_UPLOAD_MAX_SIZE = 8 * 1024 * 1024
 MAX_PAGE_SIZE = 10
 MAX_USERS_PAGE_SIZE = 4
 MIN_INGREDIENT_AMOUNT = 1
 PAGE_SIZE = 6
+RECIPE_BATCH_MAX_SIZE = 100
+RECIPE_STREAM_HEARTBEAT = 15
+RECIPE_STREAM_HISTORY = 1000
+RECIPE_STREAM_MAX_AGE = 600
+RECIPE_STREAM_MAX_CONNECTIONS = 10000
+RECIPE_STREAM_MAX_USER_CONNECTIONS = 5
+RECIPE_STREAM_QUEUE_SIZE = 64
+RECIPE_STREAM_RETRY = 3000
+SIMILAR_RECIPES_LIMIT = 6
+SNAPSHOT_BATCH_SIZE = 500
+RECIPE_ORDERING_CHOICES = (
+    ('popular', 'Популярные'),
+    ('trending', 'Популярные за последние дни'),
+    ('views', 'Самые просматриваемые'),
+)
+RECIPE_ORDERING_FIELDS = {
+    'popular': 'rank__popular',
+    'trending': 'rank__trending',
+    'views': 'rank__views_count',
+}
+VIEWER_STATE_TIMEOUT = 60 * 60
@@ -1,14 +1,24 @@
+from django.db.models import Exists, F, OuterRef
 from django_filters import rest_framework as filters
 from rest_framework.filters import SearchFilter
 
+from api.constants import RECIPE_ORDERING_CHOICES, RECIPE_ORDERING_FIELDS
+from recipes.caches import tag_map
 from recipes.models import Ingredient, Recipe
 
 
+def tag_choices():
+    return tag_map.choices()
+
+
 class RecipeFilter(filters.FilterSet):
     is_favorited = filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(method='filter_tags',
+                                        choices=tag_choices)
+    ordering = filters.ChoiceFilter(method='filter_ordering',
+                                    choices=RECIPE_ORDERING_CHOICES)
 
     class Meta:
         model = Recipe
@@ -26,6 +36,16 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shopping_carts__user=user)
         return queryset
 
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=tag_map.get_ids(value))))
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.filter(rank__isnull=False).order_by(
+            F(RECIPE_ORDERING_FIELDS[value]).desc(), '-rank__recipe_id')
+
 
 class IngredientFilter(SearchFilter):
     search_param = 'name'
@@ -0,0 +1,77 @@
+import base64
+import io
+import json
+import math
+import os
+import tracemalloc
+
+from django.core.management import BaseCommand
+from django.test.client import (BOUNDARY, MULTIPART_CONTENT, RequestFactory,
+                                encode_multipart)
+from PIL import Image
+from rest_framework.test import force_authenticate
+
+from api.views import UserViewSet
+from users.models import User
+
+AVATAR_URL = '/api/users/me/avatar/'
+DEFAULT_SIZE_MB = 5
+
+
+def noise_png(size):
+    """PNG из случайного шума: почти не сжимается, весит около size байт."""
+    side = int(math.sqrt(size / 3))
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=0)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пиковое потребление памяти при загрузке аватара '
+            'в base64, multipart/form-data и сырым телом запроса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=float, default=DEFAULT_SIZE_MB,
+                            help='Размер изображения, МБ.')
+
+    def handle(self, *args, **options):
+        content = noise_png(int(options['size'] * 1024 * 1024))
+        user = User.objects.create_user(
+            username='upload-benchmark', email='upload-benchmark@example.com',
+            first_name='Upload', last_name='Benchmark')
+        view = UserViewSet.as_view({'put': 'avatar'},
+                                   **UserViewSet.avatar.kwargs)
+        self.stdout.write(f'Изображение: {len(content) / 2 ** 20:.1f} МБ')
+        self.stdout.write(f'{"способ":>10} {"статус":>7} {"пик, МБ":>8}')
+        try:
+            for name, request in self.requests(content):
+                force_authenticate(request, user)
+                tracemalloc.start()
+                response = view(request)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                request.close()
+                user.refresh_from_db()
+                user.avatar.delete()
+                self.stdout.write(f'{name:>10} {response.status_code:>7} '
+                                  f'{peak / 2 ** 20:>8.1f}')
+        finally:
+            user.delete()
+
+    @staticmethod
+    def requests(content):
+        factory = RequestFactory()
+        encoded = base64.b64encode(content).decode()
+        yield 'base64', factory.put(
+            AVATAR_URL,
+            json.dumps({'avatar': f'data:image/png;base64,{encoded}'}),
+            content_type='application/json')
+        del encoded
+        upload = io.BytesIO(content)
+        upload.name = 'avatar.png'
+        yield 'multipart', factory.generic(
+            'PUT', AVATAR_URL, encode_multipart(BOUNDARY, {'avatar': upload}),
+            content_type=MULTIPART_CONTENT)
+        yield 'raw', factory.put(AVATAR_URL, content,
+                                 content_type='image/png')
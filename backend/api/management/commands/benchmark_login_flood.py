@@ -0,0 +1,112 @@
+import logging
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+from django.test import Client, override_settings
+
+DEFAULT_DURATION = 10
+DEFAULT_LOGINS = 16
+DEFAULT_PATH = '/api/recipes/'
+DEFAULT_READERS = 2
+LOGIN_PATH = '/api/auth/token/login/'
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    return sorted(values)[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Измеряет задержку чтения рецептов во время волны входов: '
+            'без волны, с хешированием в потоках запросов и в пуле')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=DEFAULT_PATH,
+                            help='Адрес запросов чтения.')
+        parser.add_argument('--readers', type=int, default=DEFAULT_READERS,
+                            help='Потоков чтения.')
+        parser.add_argument('--logins', type=int, default=DEFAULT_LOGINS,
+                            help='Потоков входа.')
+        parser.add_argument('--duration', type=float,
+                            default=DEFAULT_DURATION,
+                            help='Секунд на каждый вариант.')
+
+    def read(self, path, stop, latencies):
+        client = Client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get(path)
+            latencies.append(time.perf_counter() - started)
+        close_old_connections()
+
+    def login(self, stop, statuses):
+        # Подбор по разным адресам и учетным записям: ограничения частоты
+        # не срабатывают, хешируется каждый запрос.
+        client = Client()
+        rng = random.Random()
+        while not stop.is_set():
+            response = client.post(
+                LOGIN_PATH,
+                {'email': f'flood{rng.randrange(10 ** 9)}@example.com',
+                 'password': 'password'},
+                content_type='application/json',
+                REMOTE_ADDR=f'10.{rng.randrange(256)}.'
+                            f'{rng.randrange(256)}.{rng.randrange(256)}')
+            statuses.append(response.status_code)
+        close_old_connections()
+
+    def measure(self, options, logins):
+        stop = threading.Event()
+        latencies = []
+        statuses = []
+        threads = [
+            threading.Thread(target=self.read,
+                             args=(options['path'], stop, latencies))
+            for _ in range(options['readers'])
+        ] + [
+            threading.Thread(target=self.login, args=(stop, statuses))
+            for _ in range(logins)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, statuses
+
+    def handle(self, *args, **options):
+        # Каждый отклоненный вход иначе пишется в журнал предупреждением.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        # Прогрев: первые запросы и запуск пула не попадают в измерения.
+        Client().get(options['path'])
+        Client().post(LOGIN_PATH, {'email': 'warmup@example.com',
+                                   'password': 'password'},
+                      content_type='application/json')
+        inline = dict(settings.PASSWORD_HASHING, WORKERS=0)
+        variants = (
+            ('без входов', settings.PASSWORD_HASHING, 0),
+            ('входы, в потоках', inline, options['logins']),
+            ('входы, в пуле', settings.PASSWORD_HASHING, options['logins']),
+        )
+        self.stdout.write(
+            f'{"вариант":<18} {"чтений/с":>9} {"p50, мс":>8} '
+            f'{"p95, мс":>8} {"p99, мс":>8} {"входов/с":>9} {"429":>6}')
+        for label, hashing, logins in variants:
+            with override_settings(PASSWORD_HASHING=hashing):
+                latencies, statuses = self.measure(options, logins)
+            rejected = statuses.count(429)
+            self.stdout.write(
+                f'{label:<18} '
+                f'{len(latencies) / options["duration"]:>9.1f} '
+                f'{statistics.median(latencies or [0]) * 1000:>8.1f} '
+                f'{percentile(latencies, 0.95) * 1000:>8.1f} '
+                f'{percentile(latencies, 0.99) * 1000:>8.1f} '
+                f'{(len(statuses) - rejected) / options["duration"]:>9.1f} '
+                f'{rejected:>6}')
@@ -0,0 +1,113 @@
+import json
+
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.views import RecipeViewSet, UserViewSet
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from users.models import Subscription
+
+DEFAULT_MAX_ROWS = 1000
+CHECKED_NODES = ('Seq Scan', 'Sort')
+
+
+def recipe_list_queryset(user, params=None):
+    """Собирает страницу списка рецептов так же, как RecipeViewSet.list."""
+    request = Request(RequestFactory().get('/api/recipes/', params or {}))
+    request.user = user
+    view = RecipeViewSet(request=request, action='list', format_kwarg=None,
+                         args=(), kwargs={})
+    queryset = view.filter_queryset(view.get_queryset())
+    return queryset[:view.paginator.get_page_size(request)]
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы выполнения горячих запросов: падает, если '
+            'план содержит полный просмотр или сортировку большой таблицы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-rows', type=int, default=DEFAULT_MAX_ROWS,
+                            help='Допустимое число строк в Seq Scan/Sort.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Выполнять запросы (EXPLAIN ANALYZE).')
+        parser.add_argument('--seed', action='store_true',
+                            help='Предварительно заполнить базу данными.')
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка планов требует PostgreSQL.')
+        if options['seed']:
+            call_command('seed_recipes', stdout=self.stdout)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        failures = []
+        for name, queryset in self.hot_queries():
+            plan = self.explain(queryset, options['analyze'])
+            if options['verbose_plans']:
+                self.stdout.write(json.dumps(plan, indent=2))
+            problems = [
+                f'{node["Node Type"]} '
+                f'({node.get("Relation Name") or node.get("Sort Key")}): '
+                f'{node["Plan Rows"]} строк'
+                for node in walk(plan)
+                if node['Node Type'] in CHECKED_NODES
+                and node['Plan Rows'] > options['max_rows']
+            ]
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FAIL {name}'))
+                for problem in problems:
+                    self.stdout.write(f'     {problem}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK   {name}'))
+        if failures:
+            raise CommandError(
+                f'Неудачные планы: {", ".join(failures)}')
+
+    @staticmethod
+    def explain(queryset, analyze):
+        sql, params = queryset.query.sql_with_params()
+        options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN ({options}) {sql}', params)
+            result = cursor.fetchone()[0]
+        if isinstance(result, str):
+            result = json.loads(result)
+        return result[0]['Plan']
+
+    def hot_queries(self):
+        favorite = Favorite.objects.order_by().first()
+        cart = ShoppingCart.objects.order_by().first()
+        subscription = Subscription.objects.order_by().first()
+        recipe = Recipe.objects.order_by().first()
+        tag = Tag.objects.order_by().first()
+        if not all((favorite, cart, subscription, recipe, tag)):
+            raise CommandError('База данных пуста, запустите с --seed.')
+        user = favorite.user
+        yield 'recipes: список', recipe_list_queryset(user)
+        yield 'recipes: автор', recipe_list_queryset(
+            user, {'author': recipe.author_id})
+        yield 'recipes: тег', recipe_list_queryset(user, {'tags': tag.slug})
+        yield 'recipes: избранное', recipe_list_queryset(
+            user, {'is_favorited': 1})
+        yield 'recipes: список покупок', recipe_list_queryset(
+            cart.user, {'is_in_shopping_cart': 1})
+        yield 'recipes: популярные', recipe_list_queryset(
+            user, {'ordering': 'popular'})
+        yield 'recipes: набирающие популярность', recipe_list_queryset(
+            user, {'ordering': 'trending'})
+        yield 'recipes: скачать список покупок', (
+            RecipeViewSet.get_shopping_cart_ingredients(cart.user))
+        yield 'users: подписки', (
+            UserViewSet.get_subscriptions_queryset(subscription.user)[:10])
+        yield 'users: подписчики', Subscription.objects.filter(
+            author=subscription.author_id).values('user')[:10]
@@ -0,0 +1,90 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.warmup import primed_host
+
+DEFAULT_PATHS = ('/api/recipes/', '/api/tags/', '/api/ingredients/',
+                 '/api/users/')
+DEFAULT_RUNS = 3
+# Выполняется в отдельном процессе: импорт приложения и первые запросы
+# измеряются в холодном интерпретаторе.
+PROBE = '''
+import json
+import sys
+import time
+from wsgiref.util import setup_testing_defaults
+
+BROWSER_ENCODINGS = 'gzip, deflate, br, zstd'
+started = time.perf_counter()
+from foodgram_backend.wsgi import application
+loaded = time.perf_counter()
+
+
+def get(url):
+    path, _, query = url.partition('?')
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query,
+               'HTTP_HOST': sys.argv[1],
+               'HTTP_ACCEPT_ENCODING': BROWSER_ENCODINGS}
+    setup_testing_defaults(environ)
+    started = time.perf_counter()
+    response = application(environ, lambda status, headers, info=None: None)
+    b''.join(response)
+    response.close()
+    return time.perf_counter() - started
+
+
+first = [get(url) for url in sys.argv[2:]]
+second = [get(url) for url in sys.argv[2:]]
+print(json.dumps({'load': loaded - started, 'first': first,
+                  'second': second}))
+'''
+
+
+class Command(BaseCommand):
+    help = ('Измеряет время загрузки приложения и первых запросов '
+            'рабочего процесса без прогрева и с прогревом')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Адрес запроса, можно несколько раз.')
+        parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+                            help='Запусков процесса на каждый вариант.')
+        parser.add_argument('--host', help='Заголовок Host запросов.')
+
+    def probe(self, warmup, host, paths):
+        environment = dict(os.environ, WARMUP_ENABLED=str(warmup),
+                           DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, host, *paths], env=environment,
+            cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        host = options['host'] or primed_host() or 'localhost'
+        results = {}
+        for warmup in (False, True):
+            probes = [self.probe(warmup, host, paths)
+                      for _ in range(options['runs'])]
+            results[warmup] = [statistics.median(
+                probe['load'] for probe in probes)] + [
+                statistics.median(probe[key][index] for probe in probes)
+                for key in ('first', 'second')
+                for index in range(len(paths))]
+        rows = ['загрузка приложения'] + [
+            f'{label} {path}' for label in ('первый', 'второй')
+            for path in paths]
+        width = max(map(len, rows))
+        self.stdout.write(f'{"мс, медиана":<{width}} {"без прогрева":>13} '
+                          f'{"с прогревом":>12}')
+        for row, cold, warm in zip(rows, results[False], results[True]):
+            self.stdout.write(f'{row:<{width}} {cold * 1000:>13.1f} '
+                              f'{warm * 1000:>12.1f}')
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from api.constants import SNAPSHOT_BATCH_SIZE
+from api.snapshots import refresh_snapshots
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает сохраненные снимки рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Перестроить все снимки, а не только '
+                                 'сброшенные.')
+        parser.add_argument('--batch-size', type=int,
+                            default=SNAPSHOT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('id')
+        if not options['all']:
+            recipes = recipes.filter(snapshot__isnull=True)
+        refreshed = refresh_snapshots(recipes.values_list('id', flat=True),
+                                      options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено снимков: {refreshed}'))
@@ -1,14 +1,43 @@
+from functools import partial
+
+from foodgram_backend.counts import CachedCountPaginator
 from rest_framework.pagination import PageNumberPagination
 
 from .constants import MAX_PAGE_SIZE, MAX_USERS_PAGE_SIZE, PAGE_SIZE
 
+ESTIMATED_COUNT_HEADER = 'X-Count-Estimated'
+EXACT_COUNT_VALUES = ('1', 'true')
+
+
+class CachedCountPagination(PageNumberPagination):
+    """
+    Пагинация с кэшированным count. Для больших таблиц без фильтров count
+    оценочный: тогда в ответе есть заголовок X-Count-Estimated, а точное
+    число можно запросить параметром exact_count=1.
+    """
+
+    exact_count_query_param = 'exact_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        exact = request.query_params.get(
+            self.exact_count_query_param, '').lower() in EXACT_COUNT_VALUES
+        self.django_paginator_class = partial(CachedCountPaginator,
+                                              exact=exact)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.page.paginator.estimated:
+            response[ESTIMATED_COUNT_HEADER] = 'true'
+        return response
+
 
-class RecipePagination(PageNumberPagination):
+class RecipePagination(CachedCountPagination):
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
     max_page_size = MAX_PAGE_SIZE
 
 
-class UserPagination(PageNumberPagination):
+class UserPagination(CachedCountPagination):
     page_size = MAX_USERS_PAGE_SIZE
     page_size_query_param = 'limit'
@@ -0,0 +1,110 @@
+"""
+Потоковая загрузка изображений.
+
+В отличие от base64 в JSON, тело запроса не собирается в памяти целиком:
+файл по частям пишется во временный файл на диске, а тип и размер
+проверяются по мере поступления данных.
+"""
+import uuid
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.exceptions import APIException, UnsupportedMediaType
+from rest_framework.parsers import BaseParser, DataAndFiles, MultiPartParser
+
+from api.constants import (IMAGE_CONTENT_TYPES, IMAGE_UPLOAD_CHUNK_SIZE,
+                           IMAGE_UPLOAD_MAX_SIZE)
+
+IMAGE_SIGNATURES = {
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/webp': (b'RIFF',),
+}
+# RIFF-контейнер: за длиной в байтах 4-8 следует тип содержимого.
+IMAGE_FORM_TYPES = {
+    'image/webp': (8, b'WEBP'),
+}
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой.'
+    default_code = 'payload_too_large'
+
+
+def check_size(size):
+    if size is not None and size > IMAGE_UPLOAD_MAX_SIZE:
+        raise PayloadTooLarge(
+            f'Размер изображения не должен превышать '
+            f'{IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)} МБ.')
+
+
+def has_signature(content_type, data):
+    if not data.startswith(IMAGE_SIGNATURES[content_type]):
+        return False
+    offset, form_type = IMAGE_FORM_TYPES.get(content_type, (0, b''))
+    return data[offset:offset + len(form_type)] == form_type
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет изображение на диск, проверяя тип и размер на лету."""
+
+    chunk_size = IMAGE_UPLOAD_CHUNK_SIZE
+
+    def new_file(self, field_name, file_name, content_type, content_length,
+                 charset=None, content_type_extra=None):
+        if content_type not in IMAGE_CONTENT_TYPES:
+            raise UnsupportedMediaType(content_type)
+        check_size(content_length)
+        self.received = 0
+        super().new_file(field_name, file_name, content_type,
+                         content_length, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not has_signature(self.content_type, raw_data):
+            raise UnsupportedMediaType(
+                self.content_type,
+                'Содержимое файла не соответствует его типу.')
+        self.received += len(raw_data)
+        check_size(self.received)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class ImageMultiPartParser(MultiPartParser):
+    """multipart/form-data, в котором файлы проходят ImageUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request.upload_handlers = [ImageUploadHandler(request._request)]
+        return super().parse(stream, media_type, parser_context)
+
+
+class ImageUploadParser(BaseParser):
+    """
+    Тело запроса — само изображение, например PUT с Content-Type image/png.
+    Файл попадает в поле upload_field_name представления.
+    """
+
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        view = parser_context['view']
+        content_type = media_type.split(';')[0].strip()
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0) or None
+        handler = ImageUploadHandler(request._request)
+        field_name = getattr(view, 'upload_field_name', 'image')
+        handler.new_file(
+            field_name,
+            f'{uuid.uuid4().hex}.{IMAGE_CONTENT_TYPES.get(content_type)}',
+            content_type, content_length)
+        received = 0
+        while chunk := stream.read(handler.chunk_size):
+            handler.receive_data_chunk(chunk, received)
+            received += len(chunk)
+        image = handler.file_complete(received)
+        # Как и для форм, Django закроет и удалит файл после ответа.
+        request._request._files = MultiValueDict({field_name: [image]})
+        return DataAndFiles({}, {field_name: image})
@@ -1,12 +1,26 @@
+from datetime import timedelta
+
+from django.contrib.auth import authenticate
 from django.db import transaction
+from django.db.models import QuerySet, prefetch_related_objects
+from django.utils import timezone
+from djoser.serializers import \
+    TokenCreateSerializer as BaseTokenCreateSerializer
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from api.constants import MIN_INGREDIENT_AMOUNT
+from api.constants import (AUTHOR_STATS_DEFAULT_DAYS, AUTHOR_STATS_MAX_DAYS,
+                           MIN_INGREDIENT_AMOUNT, RECIPE_BATCH_MAX_SIZE)
+from api.fields import ImageUploadField
+from api.viewer_state import get_viewer_state
+from recipes import shopping_cart
+from recipes.constants import MIN_COOKING_TIME
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from recipes.pantry import sync_recipe
+from recipes.similarity import index_recipe
 from users.models import Subscription, User
 
 
@@ -17,7 +31,7 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
 
 
 class UserAvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField(max_length=None, use_url=True)
+    avatar = ImageUploadField(max_length=None, use_url=True)
 
     class Meta:
         model = User
@@ -29,6 +43,19 @@ class UserAvatarSerializer(serializers.ModelSerializer):
         return value
 
 
+class TokenCreateSerializer(BaseTokenCreateSerializer):
+
+    def validate(self, attrs):
+        # Базовый сериализатор после неудачного authenticate проверяет
+        # пароль еще раз, и каждая неверная попытка стоит двух хешей.
+        self.user = authenticate(request=self.context.get('request'),
+                                 email=attrs.get('email'),
+                                 password=attrs.get('password'))
+        if self.user is None:
+            self.fail('invalid_credentials')
+        return attrs
+
+
 class UserCreateSerializer(BaseUserCreateSerializer):
     class Meta(BaseUserCreateSerializer.Meta):
         model = User
@@ -46,10 +73,8 @@ class UserDetailSerializer(BaseUserSerializer):
                   'avatar', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request
-                and request.user.is_authenticated
-                and request.user.subscriptions.filter(author=obj).exists())
+        return obj.id in get_viewer_state(
+            self.context.get('request')).subscribed_ids
 
 
 class UserListSerializer(BaseUserSerializer):
@@ -69,12 +94,19 @@ class UserSerializer(UserDetailSerializer):
         fields = UserDetailSerializer.Meta.fields + ('recipes_count',
                                                      'recipes')
 
+    @staticmethod
+    def visible_recipes(obj):
+        # Подписки выбирают рецепты через prefetch_related уже без скрытых.
+        if 'recipes' in getattr(obj, '_prefetched_objects_cache', {}):
+            return obj.recipes.all()
+        return obj.recipes.filter(is_hidden=False)
+
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return self.visible_recipes(obj).count()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes = obj.recipes.all()
+        recipes = self.visible_recipes(obj)
         recipes_limit = request.query_params.get('recipes_limit')
         if recipes_limit and recipes_limit.isdigit():
             recipes = recipes[:int(recipes_limit)]
@@ -109,10 +141,10 @@ class PasswordChangeSerializer(serializers.Serializer):
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(),
-                                              required=True)
-    author = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(),
-                                                required=True)
+    user = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(is_hidden=False), required=True)
+    author = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(is_hidden=False), required=True)
 
     class Meta:
         model = Subscription
@@ -173,7 +205,54 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeSnapshotSerializer(serializers.ModelSerializer):
+    """Часть RecipeReadSerializer, не зависящая от пользователя."""
+
+    author = UserListSerializer(read_only=True)
+    tags = TagSerializer(many=True, read_only=True)
+    ingredients = IngredientInRecipeSerializer(source='recipe_ingredients',
+                                               many=True, read_only=True)
+    image = Base64ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'name', 'text', 'author', 'tags', 'ingredients',
+                  'image', 'cooking_time')
+
+    @classmethod
+    def render(cls, recipes):
+        prefetch_related_objects(recipes, 'author', 'tags',
+                                 'recipe_ingredients__ingredient')
+        return {recipe.id: cls(recipe).data for recipe in recipes}
+
+
+def fill_snapshots(recipes):
+    """Строит недостающие снимки и сохраняет их, если их никто не обновил."""
+    missing = [recipe for recipe in recipes if recipe.snapshot is None]
+    if not missing:
+        return
+    snapshots = RecipeSnapshotSerializer.render(missing)
+    for recipe in missing:
+        recipe.snapshot = snapshots[recipe.id]
+    Recipe.objects.filter(snapshot__isnull=True).bulk_update(
+        missing, ['snapshot'])
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, QuerySet) else data)
+        fill_snapshots(recipes)
+        return super().to_representation(recipes)
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
+    """
+    Рецепт для чтения. Общая для всех пользователей часть берется из
+    снимка Recipe.snapshot, а по запросу вычисляются только ссылки и
+    отметки текущего пользователя.
+    """
+
     author = UserDetailSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientInRecipeSerializer(source='recipe_ingredients',
@@ -187,16 +266,103 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'text', 'author', 'tags', 'ingredients',
                   'image', 'cooking_time', 'is_favorited',
                   'is_in_shopping_cart')
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return (request.user.is_authenticated
-                and obj.favorites.filter(user=request.user).exists())
+        return obj.id in get_viewer_state(
+            self.context.get('request')).favorite_ids
 
     def get_is_in_shopping_cart(self, obj):
+        return obj.id in get_viewer_state(
+            self.context.get('request')).shopping_cart_ids
+
+    def absolute_url(self, url):
         request = self.context.get('request')
-        return (request.user.is_authenticated
-                and obj.shopping_carts.filter(user=request.user).exists())
+        return request.build_absolute_uri(url) if request and url else url
+
+    def to_representation(self, instance):
+        fill_snapshots([instance])
+        snapshot = instance.snapshot
+        author = snapshot['author']
+        result = {}
+        for field in self._readable_fields:
+            if field.field_name not in snapshot:
+                result[field.field_name] = field.to_representation(
+                    field.get_attribute(instance))
+            else:
+                result[field.field_name] = snapshot[field.field_name]
+        result['image'] = self.absolute_url(snapshot['image'])
+        result['author'] = {
+            **author,
+            'avatar': self.absolute_url(author['avatar']),
+            'is_subscribed': author['id'] in get_viewer_state(
+                self.context.get('request')).subscribed_ids,
+        }
+        return result
+
+
+class RecipeDetailSerializer(RecipeReadSerializer):
+    views_count = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('views_count',)
+
+    def get_views_count(self, obj):
+        rank = getattr(obj, 'rank', None)
+        return rank.views_count if rank else 0
+
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    coverage = serializers.SerializerMethodField()
+    missing_count = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('coverage',
+                                                     'missing_count')
+
+    def get_coverage(self, obj):
+        matched, total = self.context['pantry'][obj.id]
+        return round(matched / total, 2)
+
+    def get_missing_count(self, obj):
+        matched, total = self.context['pantry'][obj.id]
+        return total - matched
+
+
+class PantryQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False)
+    tags = serializers.ListField(child=serializers.SlugField(),
+                                 required=False)
+    cooking_time = serializers.IntegerField(min_value=MIN_COOKING_TIME,
+                                            required=False)
+
+
+class RecipeBatchQuerySerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                allow_empty=False,
+                                max_length=RECIPE_BATCH_MAX_SIZE)
+
+
+class AuthorStatsQuerySerializer(serializers.Serializer):
+
+    def get_fields(self):
+        # from — ключевое слово, поэтому поля не объявлены атрибутами класса.
+        return {'from': serializers.DateField(required=False),
+                'to': serializers.DateField(required=False)}
+
+    def validate(self, data):
+        end = data.get('to') or timezone.localdate()
+        start = data.get('from') or end - timedelta(
+            days=AUTHOR_STATS_DEFAULT_DAYS - 1)
+        if start > end:
+            raise serializers.ValidationError(
+                {'from': 'Начало периода позже его конца.'})
+        if (end - start).days >= AUTHOR_STATS_MAX_DAYS:
+            raise serializers.ValidationError(
+                {'from': f'Период не может быть длиннее '
+                         f'{AUTHOR_STATS_MAX_DAYS} дней.'})
+        return {'from': start, 'to': end}
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -204,7 +370,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                                               queryset=Tag.objects.all())
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeCreateSerializer(many=True)
-    image = Base64ImageField(required=False)
+    image = ImageUploadField(required=False)
 
     class Meta:
         model = Recipe
@@ -244,6 +410,9 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         ]
         IngredientInRecipe.objects.bulk_create(ingredients_list)
+        ingredient_ids = [ingredient['id'].id for ingredient in ingredients]
+        index_recipe(recipe.id, ingredient_ids)
+        sync_recipe(recipe, ingredient_ids, [tag.id for tag in tags])
 
     @transaction.atomic
     def create(self, validated_data):
@@ -258,15 +427,29 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        shopping_cart.lock_recipe(instance.id)
+        old_amounts = shopping_cart.recipe_amounts(instance.id)
         instance.recipe_ingredients.all().delete()
         instance = super().update(instance, validated_data)
         self.tags_and_ingredients_set(instance, tags, ingredients)
+        shopping_cart.change_recipe(
+            instance.id, old_amounts,
+            {ingredient['id'].id: ingredient['amount']
+             for ingredient in ingredients})
         return instance
 
     def to_representation(self, instance):
         return RecipeReadSerializer(instance, context=self.context).data
 
 
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = ImageUploadField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
@@ -299,3 +482,15 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         return RecipeMinifiedSerializer(instance.recipe,
                                         context=self.context).data
+
+
+class ShoppingCartTotalSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField(source='ingredient__name')
+    measurement_unit = serializers.CharField(
+        source='ingredient__measurement_unit')
+    amount = serializers.IntegerField(source='total_amount')
+
+    class Meta:
+        model = ShoppingCartTotal
+        fields = ('id', 'name', 'measurement_unit', 'amount')
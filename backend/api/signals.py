@@ -0,0 +1,76 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from api.snapshots import SNAPSHOT_USER_FIELDS, mark_stale, refresh_on_commit
+from api.stream import publish_recipe_event
+from api.viewer_state import bump_viewer_state
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscription, User
+
+
+@receiver(pre_save, sender=Recipe)
+def clear_recipe_snapshot(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    # Старый снимок не должен читаться ни до, ни после фиксации изменений.
+    if not raw and update_fields is None:
+        instance.snapshot = None
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_snapshot(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_on_commit(instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_recipe_to_streams(sender, instance, raw=False,
+                              update_fields=None, **kwargs):
+    if not raw and (update_fields is None or 'snapshot' not in update_fields):
+        publish_recipe_event(instance.id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def mark_tag_recipes_stale(sender, instance, created=False, raw=False,
+                           **kwargs):
+    if not created and not raw:
+        mark_stale(Recipe.objects.filter(tags=instance.id))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def mark_ingredient_recipes_stale(sender, instance, created=False,
+                                  raw=False, **kwargs):
+    if not created and not raw:
+        mark_stale(Recipe.objects.filter(
+            recipe_ingredients__ingredient=instance.id))
+
+
+@receiver(pre_save, sender=User)
+def mark_author_recipes_stale(sender, instance, raw=False, update_fields=None,
+                              **kwargs):
+    # Смена пароля или is_active не трогает снимки рецептов автора.
+    fields = SNAPSHOT_USER_FIELDS
+    if update_fields is not None:
+        fields = fields & set(update_fields)
+    if raw or instance.pk is None or not fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values(*fields).first()
+    if old is None or all(
+            sender._meta.get_field(field).get_prep_value(
+                getattr(instance, field)) == old[field]
+            for field in fields):
+        return
+    mark_stale(Recipe.objects.filter(author=instance.id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def bump_user_viewer_state(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_viewer_state([instance.user_id])
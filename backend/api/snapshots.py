@@ -0,0 +1,52 @@
+"""
+Обновление снимков Recipe.snapshot.
+
+После изменения рецепта его снимок перестраивается сразу после фиксации
+транзакции. Переименование тега или ингредиента и изменение профиля
+автора затрагивают много рецептов, поэтому их снимки сбрасываются одним
+UPDATE, а строятся заново при первом чтении или командой
+refresh_recipe_snapshots.
+"""
+from django.db import transaction
+from foodgram_backend.compression import response_cache
+
+from api.constants import SNAPSHOT_BATCH_SIZE
+from api.serializers import RecipeSnapshotSerializer
+from recipes.models import Recipe
+
+SNAPSHOT_USER_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar'))
+
+
+def refresh_snapshots(recipe_ids, batch_size=SNAPSHOT_BATCH_SIZE):
+    recipe_ids = list(recipe_ids)
+    refreshed = 0
+    for start in range(0, len(recipe_ids), batch_size):
+        recipes = list(Recipe.objects.filter(
+            id__in=recipe_ids[start:start + batch_size]))
+        snapshots = RecipeSnapshotSerializer.render(recipes)
+        for recipe in recipes:
+            recipe.snapshot = snapshots[recipe.id]
+        Recipe.objects.bulk_update(recipes, ['snapshot'])
+        refreshed += len(recipes)
+    response_cache.invalidate_model(Recipe)
+    return refreshed
+
+
+def refresh_on_commit(recipe_id):
+    transaction.on_commit(lambda: refresh_snapshots([recipe_id]))
+
+
+def mark_stale(queryset):
+    """
+    Сбрасывает снимки сразу и еще раз после фиксации транзакции, чтобы
+    отбросить снимки, построенные параллельными чтениями по старым данным.
+    """
+    recipe_ids = queryset.values('id')
+    Recipe.objects.filter(id__in=recipe_ids).update(snapshot=None)
+
+    def clear_snapshots():
+        Recipe.objects.filter(id__in=recipe_ids).update(snapshot=None)
+        response_cache.invalidate_model(Recipe)
+
+    transaction.on_commit(clear_snapshots)
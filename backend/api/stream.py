@@ -0,0 +1,317 @@
+"""
+Поток Server-Sent Events о новых и измененных рецептах авторов,
+на которых подписан пользователь.
+
+Каждое соединение — одна асинхронная задача с ограниченной очередью.
+Рабочий процесс держит общий RecipeHub: после фиксации изменения рецепта
+событие получает номер (время в микросекундах), попадает в журнал
+последних событий и раздается подписчикам автора. Другим процессам
+событие передается через шину инвалидации, и каждый из них сериализует
+рецепт сам.
+
+Клиент, переподключившийся с заголовком Last-Event-ID, получает
+пропущенные события из журнала. Если журнал их уже не содержит, события
+могли быть потеряны шиной или клиент не успевал их читать, поток
+отправляет событие reset: клиенту нужно перечитать данные через API.
+
+Потоки обслуживает отдельный сервер ASGI (asgi.py вызывает
+recipe_hub.start). Процессы WSGI только публикуют номера событий в шину,
+не читая подписки и не сериализуя рецепты. Django 4.2 не сообщает потоку
+об ушедшем клиенте, поэтому asgi.py оборачивает приложение в
+watch_disconnect; кроме того, поток закрывается через
+RECIPE_STREAM_MAX_AGE секунд, и клиент переподключается с Last-Event-ID.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from foodgram_backend.invalidation import bus
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.constants import (RECIPE_STREAM_HEARTBEAT, RECIPE_STREAM_HISTORY,
+                           RECIPE_STREAM_MAX_AGE,
+                           RECIPE_STREAM_MAX_CONNECTIONS,
+                           RECIPE_STREAM_MAX_USER_CONNECTIONS,
+                           RECIPE_STREAM_QUEUE_SIZE, RECIPE_STREAM_RETRY)
+from api.serializers import RecipeMinifiedSerializer
+from recipes.models import Recipe
+from users.models import Subscription
+
+EVENT_MODEL = 'api.recipe_event'
+RESET = object()
+
+
+class Event:
+
+    def __init__(self, event_id, author_id, data):
+        self.id = event_id
+        self.author_id = author_id
+        self.data = data
+
+
+class Listener:
+    """Очередь событий одного соединения в цикле событий ASGI."""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(RECIPE_STREAM_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Медленный клиент: вместо роста очереди закрываем поток,
+            # клиент переподключится и догонит журнал или перечитает API.
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+
+class RecipeHub:
+
+    def __init__(self, history=RECIPE_STREAM_HISTORY):
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=history)
+        self.listeners = defaultdict(set)
+        self.last_id = 0
+        self.forgotten_id = 0
+        self.serving = False
+
+    def start(self):
+        """
+        Включает журнал и раздачу событий в процессе сервера ASGI. Событий
+        до запуска в журнале нет: по старому Last-Event-ID отправится reset.
+        """
+        with self.lock:
+            self.serving = True
+            self.forgotten_id = self.last_id = max(self.last_id,
+                                                   time.time_ns() // 1000)
+
+    @property
+    def connections(self):
+        return sum(map(len, self.listeners.values()))
+
+    def connect(self, listener):
+        with self.lock:
+            if (self.connections >= RECIPE_STREAM_MAX_CONNECTIONS
+                    or len(self.listeners[listener.user_id])
+                    >= RECIPE_STREAM_MAX_USER_CONNECTIONS):
+                return False
+            self.listeners[listener.user_id].add(listener)
+            return True
+
+    def disconnect(self, listener):
+        with self.lock:
+            listeners = self.listeners[listener.user_id]
+            listeners.discard(listener)
+            if not listeners:
+                del self.listeners[listener.user_id]
+
+    def next_id(self):
+        with self.lock:
+            self.last_id = max(time.time_ns() // 1000, self.last_id + 1)
+            return self.last_id
+
+    def publish(self, event_ids):
+        """Рассылает события по словарю id рецепта → номер события."""
+        recipes = Recipe.objects.filter(id__in=event_ids, is_hidden=False)
+        followers = defaultdict(set)
+        for user_id, author_id in Subscription.objects.filter(
+                author__in=recipes.values('author')
+        ).values_list('user_id', 'author_id'):
+            followers[author_id].add(user_id)
+        events = sorted(
+            (Event(event_ids[recipe.id], recipe.author_id,
+                   RecipeMinifiedSerializer(recipe).data)
+             for recipe in recipes), key=lambda event: event.id)
+        with self.lock:
+            for event in events:
+                if len(self.history) == self.history.maxlen:
+                    self.forgotten_id = max(self.forgotten_id,
+                                            self.history[0].id)
+                self.history.append(event)
+                self.last_id = max(self.last_id, event.id)
+                for user_id in followers[event.author_id]:
+                    for listener in self.listeners.get(user_id, ()):
+                        listener.loop.call_soon_threadsafe(listener.put,
+                                                           event)
+
+    def reset(self):
+        """События могли быть потеряны: все потоки должны перечитать API."""
+        with self.lock:
+            self.history.clear()
+            self.forgotten_id = self.last_id = max(self.last_id,
+                                                   time.time_ns() // 1000)
+            for listeners in self.listeners.values():
+                for listener in listeners:
+                    listener.loop.call_soon_threadsafe(listener.put, RESET)
+
+    def replay(self, last_event_id, author_ids):
+        """Пропущенные события или None, если журнал их не сохранил."""
+        with self.lock:
+            if last_event_id < self.forgotten_id:
+                return None
+            return [event for event in self.history
+                    if event.id > last_event_id
+                    and event.author_id in author_ids]
+
+
+recipe_hub = RecipeHub()
+
+
+def publish_recipe_event(recipe_id):
+    """Публикует событие об изменении рецепта после фиксации транзакции."""
+    def publish():
+        event_id = recipe_hub.next_id()
+        if recipe_hub.serving:
+            recipe_hub.publish({recipe_id: event_id})
+        bus.publish(EVENT_MODEL, f'{recipe_id}:{event_id}')
+    transaction.on_commit(publish)
+
+
+def receive_recipe_events(keys):
+    if not recipe_hub.serving:
+        return
+    if keys is None:
+        recipe_hub.reset()
+        return
+    event_ids = {}
+    for key in keys:
+        recipe_id, event_id = map(int, key.split(':'))
+        event_ids[recipe_id] = max(event_id, event_ids.get(recipe_id, 0))
+    recipe_hub.publish(event_ids)
+
+
+bus.register(EVENT_MODEL, receive_recipe_events)
+
+
+def format_event(request, event):
+    data = dict(event.data)
+    if data.get('image'):
+        data['image'] = request.build_absolute_uri(data['image'])
+    return (f'id: {event.id}\nevent: recipe\n'
+            f'data: {json.dumps(data, ensure_ascii=False)}\n\n')
+
+
+def followed_author_ids(user):
+    return set(Subscription.objects.filter(user=user).values_list(
+        'author_id', flat=True))
+
+
+async def stream_events(request, listener, replay):
+    disconnected = request.scope.get('disconnected') or asyncio.Event()
+    closes_at = time.monotonic() + RECIPE_STREAM_MAX_AGE
+    try:
+        yield f'retry: {RECIPE_STREAM_RETRY}\n\n'
+        if replay is None:
+            yield 'event: reset\ndata: {}\n\n'
+            return
+        sent = set()
+        for event in replay:
+            sent.add(event.id)
+            yield format_event(request, event)
+        while True:
+            timeout = min(RECIPE_STREAM_HEARTBEAT,
+                          closes_at - time.monotonic())
+            if timeout <= 0 or disconnected.is_set():
+                return
+            try:
+                event = await asyncio.wait_for(listener.queue.get(),
+                                               timeout)
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+            if event is RESET:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            if event.id not in sent:
+                yield format_event(request, event)
+    finally:
+        recipe_hub.disconnect(listener)
+
+
+def parse_last_event_id(request):
+    value = (request.headers.get('Last-Event-ID')
+             or request.GET.get('last_event_id'))
+    return int(value) if value and value.isdigit() else None
+
+
+async def recipe_stream(request):
+    if not isinstance(request, ASGIRequest) or not recipe_hub.serving:
+        return JsonResponse(
+            {'detail': 'Поток событий доступен только через ASGI.'},
+            status=501)
+    try:
+        user, _ = await sync_to_async(
+            TokenAuthentication().authenticate)(request) or (None, None)
+    except AuthenticationFailed as error:
+        return JsonResponse({'detail': str(error.detail)}, status=401)
+    if user is None:
+        return JsonResponse(
+            {'detail': 'Учетные данные не были предоставлены.'}, status=401)
+    listener = Listener(user.id, asyncio.get_running_loop())
+    if not recipe_hub.connect(listener):
+        return JsonResponse({'detail': 'Слишком много открытых потоков.'},
+                            status=503, headers={'Retry-After': '30'})
+    # Подключаемся до чтения журнала, чтобы не пропустить события между
+    # ними; повторы отбрасывает stream_events.
+    last_event_id = parse_last_event_id(request)
+    replay = []
+    if last_event_id is not None:
+        try:
+            replay = recipe_hub.replay(
+                last_event_id,
+                await sync_to_async(followed_author_ids)(user))
+        except BaseException:
+            recipe_hub.disconnect(listener)
+            raise
+    return StreamingHttpResponse(
+        stream_events(request, listener, replay),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def watch_disconnect(application):
+    """
+    ASGI-обертка: после чтения тела запроса ждет http.disconnect и
+    отмечает разрыв в scope['disconnected'].
+    """
+    async def watched(scope, receive, send):
+        if scope['type'] != 'http':
+            return await application(scope, receive, send)
+        disconnected = asyncio.Event()
+        watcher = None
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        async def receive_body():
+            nonlocal watcher
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+            elif not message.get('more_body'):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await application(dict(scope, disconnected=disconnected),
+                              receive_body, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    return watched
@@ -0,0 +1,56 @@
+from rest_framework.throttling import SimpleRateThrottle, UserRateThrottle
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """Попытки входа с одного адреса."""
+
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope,
+                                    'ident': self.get_ident(request)}
+
+
+def login_email(request):
+    email = request.data.get('email')
+    if not isinstance(email, str) or not email:
+        return None
+    return email.strip().lower()
+
+
+class LoginAccountRateThrottle(SimpleRateThrottle):
+    """Попытки входа в одну учетную запись с одного адреса."""
+
+    scope = 'login_account'
+
+    def get_cache_key(self, request, view):
+        email = login_email(request)
+        if email is None:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': f'{email}:{self.get_ident(request)}'}
+
+
+class LoginAccountTotalRateThrottle(SimpleRateThrottle):
+    """
+    Попытки входа в одну учетную запись со всех адресов: перебор пароля
+    с многих адресов. Порог выше, чем у LoginAccountRateThrottle, чтобы
+    чужие попытки не блокировали вход владельцу надолго.
+    """
+
+    scope = 'login_account_total'
+
+    def get_cache_key(self, request, view):
+        email = login_email(request)
+        if email is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': email}
+
+
+class RegistrationRateThrottle(LoginRateThrottle):
+    scope = 'registration'
+
+
+class PasswordChangeRateThrottle(UserRateThrottle):
+    scope = 'password_change'
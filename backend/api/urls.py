@@ -1,7 +1,9 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .stream import recipe_stream
+from .views import (IngredientViewSet, RecipeViewSet, TagViewSet,
+                    TokenCreateView, UserViewSet)
 
 app_name = 'api'
 
@@ -13,10 +15,14 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('users', UserViewSet, basename='user')
 
 urlpatterns = [
+    path('recipes/stream/', recipe_stream, name='recipes-stream'),
     path('', include(router.urls)),
     path('users/me/avatar/',
-         UserViewSet.as_view({'put': 'avatar', 'delete': 'avatar'}),
+         UserViewSet.as_view({'put': 'avatar', 'delete': 'avatar'},
+                             **UserViewSet.avatar.kwargs),
          name='avatar'),
+    re_path(r'^auth/token/login/?$', TokenCreateView.as_view(),
+            name='login'),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
     path('recipes/<int:pk>/get-link/',
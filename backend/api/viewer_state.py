@@ -0,0 +1,71 @@
+"""
+Состояние текущего пользователя: избранное, список покупок и подписки.
+
+Состояние загружается один раз на запрос и кэшируется между запросами по
+ключу с версией, хранящейся в User.viewer_state_version. Любое сохранение
+или удаление избранного, списка покупок или подписки увеличивает версию
+(см. api.signals), поэтому устаревшие записи кэша просто перестают
+использоваться. Кэш локальный в процессе (CACHES['local']): чтение
+состояния не должно стоить запроса к общему кэшу.
+"""
+from django.core.cache import caches
+from django.db.models import F
+
+from api.constants import VIEWER_STATE_TIMEOUT
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription, User
+
+
+class ViewerState:
+
+    def __init__(self, favorite_ids=(), shopping_cart_ids=(),
+                 subscribed_ids=()):
+        self.favorite_ids = frozenset(favorite_ids)
+        self.shopping_cart_ids = frozenset(shopping_cart_ids)
+        self.subscribed_ids = frozenset(subscribed_ids)
+
+    @classmethod
+    def load(cls, user):
+        return cls(
+            Favorite.objects.filter(user=user).values_list(
+                'recipe_id', flat=True),
+            ShoppingCart.objects.filter(user=user).values_list(
+                'recipe_id', flat=True),
+            Subscription.objects.filter(user=user).values_list(
+                'author_id', flat=True),
+        )
+
+
+ANONYMOUS_STATE = ViewerState()
+
+
+def cache_key(user):
+    return f'viewer-state:{user.id}:{user.viewer_state_version}'
+
+
+def get_viewer_state(request):
+    if request is None or not request.user.is_authenticated:
+        return ANONYMOUS_STATE
+    state = getattr(request, '_viewer_state', None)
+    if state is None:
+        key = cache_key(request.user)
+        cache = caches['local']
+        state = cache.get(key)
+        if state is None:
+            state = ViewerState.load(request.user)
+            cache.set(key, state, VIEWER_STATE_TIMEOUT)
+        request._viewer_state = state
+    return state
+
+
+def bump_viewer_state(user_ids):
+    User.objects.filter(pk__in=user_ids).update(
+        viewer_state_version=F('viewer_state_version') + 1)
+
+
+def reload_viewer_state(request):
+    """Перечитывает версию пользователя, измененную во время запроса."""
+    user = request.user
+    user.viewer_state_version = User.objects.values_list(
+        'viewer_state_version', flat=True).get(pk=user.pk)
+    request._viewer_state = None
@@ -1,44 +1,78 @@
 from io import BytesIO
 
-from django.db.models import Count, Prefetch, Sum
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser.views import TokenCreateView as BaseTokenCreateView
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
+from api.constants import SIMILAR_RECIPES_LIMIT
 from api.filters import IngredientFilter, RecipeFilter
 from api.pagination import RecipePagination, UserPagination
+from api.parsers import ImageMultiPartParser, ImageUploadParser
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (FavoriteSerializer, IngredientSerializer,
-                             PasswordChangeSerializer, RecipeReadSerializer,
+from api.serializers import (AuthorStatsQuerySerializer, FavoriteSerializer,
+                             IngredientSerializer, PantryQuerySerializer,
+                             PantryRecipeSerializer, PasswordChangeSerializer,
+                             RecipeBatchQuerySerializer,
+                             RecipeDetailSerializer, RecipeImageSerializer,
+                             RecipeMinifiedSerializer, RecipeReadSerializer,
                              RecipeWriteSerializer, ShoppingCartSerializer,
+                             ShoppingCartTotalSerializer,
                              SubscriptionSerializer, TagSerializer,
                              UserAvatarSerializer, UserCreateSerializer,
                              UserDetailSerializer, UserListSerializer,
                              UserSerializer)
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from api.throttling import (LoginAccountRateThrottle,
+                            LoginAccountTotalRateThrottle, LoginRateThrottle,
+                            PasswordChangeRateThrottle,
+                            RegistrationRateThrottle)
+from api.viewer_state import reload_viewer_state
+from recipes import author_stats, deletion, shopping_cart
+from recipes.caches import tag_map
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingCartTotal, Tag)
+from recipes.pantry import pantry_index
+from recipes.similarity import similar_recipe_ids
+from recipes.view_counter import view_counter
 from users.models import Subscription, User
 
 
+class TokenCreateView(BaseTokenCreateView):
+    throttle_classes = [LoginRateThrottle, LoginAccountRateThrottle,
+                        LoginAccountTotalRateThrottle]
+
+
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.filter(is_hidden=False)
     serializer_class = UserSerializer
     pagination_class = UserPagination
+    upload_field_name = 'avatar'
+    expensive_actions = ('subscriptions',)
 
     def get_permissions(self):
         if self.action in ['create', 'list', 'retrieve']:
             self.permission_classes = [AllowAny]
-        elif self.action in ['avatar', 'me', 'set_password', 'subscribe',
-                             'subscriptions']:
+        elif self.action in ['avatar', 'me', 'set_password', 'stats',
+                             'subscribe', 'subscriptions']:
             self.permission_classes = [IsAuthenticated]
         return super().get_permissions()
 
+    def get_throttles(self):
+        if self.action == 'create':
+            return [RegistrationRateThrottle()]
+        elif self.action == 'set_password':
+            return [PasswordChangeRateThrottle()]
+        return super().get_throttles()
+
     def get_serializer_class(self):
         if self.action == 'avatar':
             return UserAvatarSerializer
@@ -55,7 +89,9 @@ class UserViewSet(viewsets.ModelViewSet):
         return UserSerializer
 
     @action(detail=False, methods=['put', 'delete'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            parser_classes=[JSONParser, ImageUploadParser,
+                            ImageMultiPartParser])
     def avatar(self, request):
         user = request.user
         if request.method == 'PUT':
@@ -63,7 +99,8 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data)
-        user.avatar.delete()
+        with transaction.atomic():
+            user.avatar.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get'],
@@ -72,6 +109,15 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='me/stats',
+            permission_classes=[IsAuthenticated])
+    def stats(self, request):
+        query = AuthorStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(author_stats.daily_stats(
+            request.user.id, query.validated_data['from'],
+            query.validated_data['to']))
+
     @action(detail=False, methods=['post'],
             permission_classes=[IsAuthenticated])
     def set_password(self, request):
@@ -86,7 +132,7 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, pk=None):
         user = request.user
-        author = get_object_or_404(User, pk=pk)
+        author = get_object_or_404(self.get_queryset(), pk=pk)
         if request.method == 'POST':
             serializer = SubscriptionSerializer(
                 data={'user': user.id, 'author': author.id},
@@ -94,6 +140,7 @@ class UserViewSet(viewsets.ModelViewSet):
             )
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            reload_viewer_state(request)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         subscription = Subscription.objects.filter(user=user,
                                                    author=author).first()
@@ -101,36 +148,94 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'errors': 'Подписка не существует.'},
                             status=status.HTTP_400_BAD_REQUEST)
         subscription.delete()
+        reload_viewer_state(request)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthenticated])
-    def subscriptions(self, request):
-        user = self.request.user
+    @staticmethod
+    def get_subscriptions_queryset(user):
         authors_id = user.subscriptions.values('author')
-        authors = User.objects.filter(id__in=authors_id).annotate(
-            recipes_count=Count('recipes')
+        return User.objects.filter(
+            id__in=authors_id, is_hidden=False
+        ).annotate(
+            recipes_count=Count('recipes',
+                                filter=Q(recipes__is_hidden=False))
         ).prefetch_related(
-            Prefetch('recipes', queryset=Recipe.objects.all().order_by('id'))
+            Prefetch('recipes', queryset=Recipe.objects.filter(
+                is_hidden=False).order_by('id'))
         ).order_by('id')
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def subscriptions(self, request):
+        authors = self.get_subscriptions_queryset(request.user)
         paginated_queryset = self.paginate_queryset(authors)
         serializer = UserSerializer(paginated_queryset, many=True,
                                     context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    def perform_destroy(self, instance):
+        deletion.hide_user(instance)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.filter(is_hidden=False)
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     pagination_class = RecipePagination
+    parser_classes = [JSONParser, ImageMultiPartParser]
+    cached_response_actions = ('list',)
+    cached_response_models = (Ingredient, Recipe, Tag, User)
+    cached_response_params = ('author', 'exact_count', 'ids', 'is_favorited',
+                              'is_in_shopping_cart', 'limit', 'ordering',
+                              'page', 'tags')
+    expensive_actions = ('download_shopping_cart', 'pantry')
 
     def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RecipeDetailSerializer
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def list(self, request, *args, **kwargs):
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        query = RecipeBatchQuerySerializer(data={'ids': [
+            recipe_id for value in request.query_params.getlist('ids')
+            for recipe_id in value.split(',') if recipe_id]})
+        query.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(query.validated_data['ids']))
+        recipes = self.filter_queryset(self.get_queryset()).in_bulk(
+            recipe_ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in recipe_ids
+             if recipe_id in recipes], many=True)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        view_counter.increment(recipe.id)
+        return Response(self.get_serializer(recipe).data)
+
+    @action(detail=True, methods=['put'],
+            parser_classes=[ImageUploadParser, ImageMultiPartParser])
+    def image(self, request, pk=None):
+        serializer = RecipeImageSerializer(self.get_object(),
+                                           data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    def perform_destroy(self, instance):
+        deletion.hide_recipe(instance)
+
+    def get_relation_recipe(self, request, pk):
+        # Скрытый до удаления рецепт можно убрать из избранного и покупок.
+        queryset = (Recipe.objects.all() if request.method == 'DELETE'
+                    else self.get_queryset())
+        return get_object_or_404(queryset, pk=pk)
+
     @staticmethod
     def handle_post_action(request, serializer_class, user, recipe):
         serializer = serializer_class(
@@ -138,13 +243,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
             context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        reload_viewer_state(request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def handle_delete_action(model_class, user, recipe):
+    def handle_delete_action(request, model_class, user, recipe):
         obj = model_class.objects.filter(user=user, recipe=recipe).first()
         if obj:
             obj.delete()
+            reload_viewer_state(request)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'errors': 'Объект не найден.'},
                         status=status.HTTP_400_BAD_REQUEST)
@@ -153,21 +260,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
         user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe = self.get_relation_recipe(request, pk)
         if request.method == 'POST':
             return self.handle_post_action(request, FavoriteSerializer,
                                            user, recipe)
-        return self.handle_delete_action(Favorite, user, recipe)
+        return self.handle_delete_action(request, Favorite, user, recipe)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
         user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe = self.get_relation_recipe(request, pk)
+        shopping_cart.lock_recipe(recipe.id)
         if request.method == 'POST':
-            return self.handle_post_action(request, ShoppingCartSerializer,
-                                           user, recipe)
-        return self.handle_delete_action(ShoppingCart, user, recipe)
+            response = self.handle_post_action(
+                request, ShoppingCartSerializer, user, recipe)
+            shopping_cart.add_recipe(user.id, recipe.id)
+            return response
+        response = self.handle_delete_action(request, ShoppingCart, user,
+                                             recipe)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            shopping_cart.remove_recipe(user.id, recipe.id)
+        return response
+
+    @action(detail=False, methods=['get'], url_path='shopping_cart/summary',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        serializer = ShoppingCartTotalSerializer(
+            self.get_shopping_cart_ingredients(request.user), many=True)
+        return Response(serializer.data)
 
     @action(detail=True, methods=['get'],
             permission_classes=[IsAuthenticated])
@@ -176,6 +298,55 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response({'short-link': recipe.short_url},
                         status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        limit = request.query_params.get('limit')
+        limit = (min(int(limit), SIMILAR_RECIPES_LIMIT)
+                 if limit and limit.isdigit() else SIMILAR_RECIPES_LIMIT)
+        recipe_ids = [recipe_id for recipe_id, _ in
+                      similar_recipe_ids(recipe.id, limit)]
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = RecipeMinifiedSerializer(
+            [recipes[recipe_id] for recipe_id in recipe_ids
+             if recipe_id in recipes],
+            many=True, context={'request': request})
+        return Response(serializer.data)
+
+    @staticmethod
+    def get_pantry_params(request):
+        params = request.query_params
+        data = {'ingredients': [
+            ingredient for value in params.getlist('ingredients')
+            for ingredient in value.split(',') if ingredient]}
+        if 'tags' in params:
+            data['tags'] = params.getlist('tags')
+        if 'cooking_time' in params:
+            data['cooking_time'] = params['cooking_time']
+        return data
+
+    @action(detail=False, methods=['get'])
+    def pantry(self, request):
+        query = PantryQuerySerializer(data=self.get_pantry_params(request))
+        query.is_valid(raise_exception=True)
+        tag_ids = None
+        if 'tags' in query.validated_data:
+            tag_ids = tag_map.get_ids(query.validated_data['tags'])
+        results = pantry_index.search(
+            query.validated_data['ingredients'], tag_ids=tag_ids,
+            max_cooking_time=query.validated_data.get('cooking_time'))
+        page = self.paginate_queryset(results)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        serializer = PantryRecipeSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page
+             if recipe_id in recipes],
+            many=True,
+            context={'request': request,
+                     'pantry': {recipe_id: (matched, total)
+                                for recipe_id, matched, total in page}})
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
@@ -185,13 +356,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def get_shopping_cart_ingredients(user):
-        shopping_cart_items = (ShoppingCart.objects.filter(user=user)
-                               .select_related('recipe'))
-        return IngredientInRecipe.objects.filter(
-            recipe__in=shopping_cart_items.values('recipe')
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(total_amount=Sum('amount'))
+        totals = ShoppingCartTotal.objects.filter(user=user).values(
+            'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'total_amount'
+        ).order_by('ingredient__name')
+        hidden = shopping_cart.hidden_amounts(user.id)
+        if not hidden:
+            return totals
+        ingredients = []
+        for ingredient in totals:
+            ingredient['total_amount'] -= hidden.get(
+                ingredient['ingredient_id'], 0)
+            if ingredient['total_amount'] > 0:
+                ingredients.append(ingredient)
+        return ingredients
 
     @staticmethod
     def create_shopping_cart_file(ingredients):
@@ -217,6 +395,9 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [IngredientFilter]
     search_fields = ['^name']
     pagination_class = None
+    cached_response_actions = ('list', 'retrieve')
+    cached_response_models = (Ingredient,)
+    cached_response_params = ('name',)
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -224,3 +405,5 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [AllowAny]
+    cached_response_actions = ('list', 'retrieve')
+    cached_response_models = (Tag,)
@@ -0,0 +1,85 @@
+"""Шаги прогрева API: маршруты, сериализаторы и кэши справочников."""
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import URLResolver, get_resolver
+from foodgram_backend.compression import COMPRESSORS
+from foodgram_backend.warmup import register
+
+from api.serializers import (IngredientSerializer, RecipeDetailSerializer,
+                             RecipeMinifiedSerializer, RecipeReadSerializer,
+                             TagSerializer, UserDetailSerializer,
+                             UserListSerializer, UserSerializer)
+from recipes.caches import tag_map
+
+PRIMED_PATHS = ('/api/tags/', '/api/ingredients/',
+                '/api/recipes/?page=1&limit=6')
+WARMED_SERIALIZERS = (
+    IngredientSerializer,
+    RecipeDetailSerializer,
+    RecipeMinifiedSerializer,
+    RecipeReadSerializer,
+    TagSerializer,
+    UserDetailSerializer,
+    UserListSerializer,
+    UserSerializer,
+)
+
+
+def compile_patterns(patterns):
+    for pattern in patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            pattern.reverse_dict
+            compile_patterns(pattern.url_patterns)
+
+
+@register('urls')
+def resolve_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    compile_patterns(resolver.url_patterns)
+
+
+@register('serializers')
+def build_serializers():
+    # Поля строятся заново для каждого экземпляра, но первое построение
+    # заполняет кэши _meta моделей и импортирует зависимости полей.
+    for serializer_class in WARMED_SERIALIZERS:
+        serializer_class().fields
+
+
+@register('tags', per_worker=True)
+def load_tags():
+    tag_map.load()
+
+
+def primed_host():
+    """Первый явный адрес из ALLOWED_HOSTS — публичный адрес сайта."""
+    return next((host for host in settings.ALLOWED_HOSTS
+                 if host and host != '*' and not host.startswith('.')),
+                None)
+
+
+@register('responses', per_worker=True)
+def prime_responses():
+    """
+    Кладет в кэш ответов справочники и первую страницу рецептов — как
+    их запрашивает фронтенд у анонимного пользователя. Каждый путь
+    запрашивается один раз: для основного адреса и лучшего сжатия, которое
+    принимают браузеры. Остальные варианты кэшируются первым запросом.
+    """
+    host = primed_host()
+    if host is None:
+        return
+    coding = next(iter(COMPRESSORS), None)
+    handler = WSGIHandler()
+    for path in PRIMED_PATHS:
+        path, _, query = path.partition('?')
+        environ = {'PATH_INFO': path, 'QUERY_STRING': query,
+                   'HTTP_HOST': host}
+        if coding:
+            environ['HTTP_ACCEPT_ENCODING'] = coding
+        setup_testing_defaults(environ)
+        handler(environ, lambda status, headers, exc_info=None: None).close()
@@ -0,0 +1,318 @@
+"""
+Допуск запросов API под перегрузкой.
+
+Без контроля перегруженный сервер ставит в очередь все запросы, и дешевые
+чтения ждут вместе с тяжелыми, пока не истечет таймаут. AdmissionMiddleware
+делит запросы к представлениям DRF на классы по убыванию приоритета:
+
+- cheap — обычные чтения;
+- write — изменения;
+- expensive — тяжелые чтения: действия из expensive_actions ViewSet,
+  например скачивание списка покупок и подписки.
+
+Для каждого класса считаются запросы в работе и сглаженная задержка; если
+nginx передает X-Request-Start, в задержку входит и ожидание в очереди.
+Пока задержка класса выше его цели в LATENCY_TARGETS, запросы классов с
+меньшим приоритетом сразу получают 503 с Retry-After, а не встают в
+очередь. Число одновременных запросов класса ограничено MAX_IN_FLIGHT.
+Кроме того, каждый пользователь тратит жетоны своего ведра по стоимости
+класса и при пустом ведре получает 429. Допуск идет до аутентификации,
+поэтому токен сверяется с базой через кэш процесса: ведро пользователя
+получает только существующий токен, остальные запросы — ведро адреса.
+
+Готовый ответ из кэша CompressionMiddleware отдает раньше, без допуска;
+промах кэша проходит допуск как обычное чтение.
+
+Состояние лежит в разделяемой памяти, созданной в мастер-процессе gunicorn
+до fork, и общее для всех рабочих процессов; показатели отдает /metrics
+в текстовом формате Prometheus.
+"""
+import hashlib
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+CHEAP = 'cheap'
+WRITE = 'write'
+EXPENSIVE = 'expensive'
+ROUTES = (CHEAP, WRITE, EXPENSIVE)
+FIELDS = ('latency', 'updated', 'admitted', 'shed', 'throttled')
+MAX_QUEUE_DELAY = 60
+TOKEN_CACHE_TIMEOUT = 60
+
+
+def route_class(request, view_func):
+    """Класс запроса к представлению DRF или None для остальных."""
+    view = getattr(view_func, 'cls', None)
+    if view is None:
+        return None
+    if request.method not in SAFE_METHODS:
+        return WRITE
+    actions = getattr(view_func, 'actions', None) or {}
+    if actions.get(request.method.lower()) in getattr(
+            view, 'expensive_actions', ()):
+        return EXPENSIVE
+    return CHEAP
+
+
+def token_user(authorization):
+    """Владелец токена из заголовка Authorization или None."""
+    keyword, _, key = authorization.partition(' ')
+    if keyword != 'Token' or len(key) != 40 or not key.isalnum():
+        return None
+    cache = caches['local']
+    user_id = cache.get(f'admission-token:{key}')
+    if user_id is None:
+        user_id = Token.objects.filter(key=key).values_list(
+            'user_id', flat=True).first()
+        # Несуществующие токены не кэшируются: случайный токен в каждом
+        # запросе вытеснил бы из кэша настоящие.
+        if user_id is not None:
+            cache.set(f'admission-token:{key}', user_id,
+                      TOKEN_CACHE_TIMEOUT)
+    return user_id
+
+
+def client_key(request):
+    user_id = token_user(request.META.get('HTTP_AUTHORIZATION', ''))
+    if user_id is not None:
+        return f'user:{user_id}'
+    # Последний адрес в X-Forwarded-For добавил nginx, его не подделать.
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    return 'address:' + (forwarded.rsplit(',', 1)[-1].strip()
+                         or request.META.get('REMOTE_ADDR', ''))
+
+
+def queue_delay(request, now):
+    """Ожидание запроса до рабочего процесса по X-Request-Start nginx."""
+    value = request.META.get('HTTP_X_REQUEST_START', '')
+    try:
+        started = float(value.removeprefix('t='))
+    except ValueError:
+        return 0
+    delay = now - started
+    return delay if 0 < delay < MAX_QUEUE_DELAY else 0
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shared_lock = None
+        self.stats = None
+        self.buckets = None
+        self.owners = None
+        self.running = None
+        self.pid = None
+        self.row = None
+
+    @property
+    def options(self):
+        return settings.ADMISSION
+
+    def prepare(self):
+        """
+        Создает разделяемое состояние; вызванный до fork, делит его между
+        процессами.
+        """
+        with self.lock:
+            if self.stats is None:
+                self.shared_lock = multiprocessing.Lock()
+                self.stats = multiprocessing.RawArray(
+                    'd', len(ROUTES) * len(FIELDS))
+                self.buckets = multiprocessing.RawArray(
+                    'd', 2 * self.options['BUCKETS'])
+                self.owners = multiprocessing.RawArray(
+                    'q', self.options['MAX_PROCESSES'])
+                self.running = multiprocessing.RawArray(
+                    'q', self.options['MAX_PROCESSES'] * len(ROUTES))
+
+    def claim_row(self):
+        """
+        Строка запросов в работе текущего процесса. Запросы процесса,
+        убитого посреди запроса, не должны считаться вечно, поэтому
+        каждый процесс считает свои, а release освобождает строку.
+        """
+        if self.pid == os.getpid():
+            return self.row
+        self.pid = os.getpid()
+        self.row = None
+        for row, owner in enumerate(self.owners):
+            if owner in (0, self.pid):
+                self.owners[row] = self.pid
+                self.clear_row(row)
+                self.row = row
+                break
+        return self.row
+
+    def clear_row(self, row):
+        for route in range(len(ROUTES)):
+            self.running[row * len(ROUTES) + route] = 0
+
+    def release(self, pid):
+        """Освобождает строку завершившегося процесса."""
+        if self.stats is None:
+            return
+        with self.shared_lock:
+            for row, owner in enumerate(self.owners):
+                if owner == pid:
+                    self.owners[row] = 0
+                    self.clear_row(row)
+
+    def index(self, route, field):
+        return ROUTES.index(route) * len(FIELDS) + FIELDS.index(field)
+
+    def get(self, route, field):
+        return self.stats[self.index(route, field)]
+
+    def add(self, route, field, value=1):
+        self.stats[self.index(route, field)] += value
+
+    def in_flight(self, route):
+        column = ROUTES.index(route)
+        return sum(self.running[row * len(ROUTES) + column]
+                   for row, owner in enumerate(self.owners) if owner)
+
+    def is_overloaded(self, route, now):
+        """Задержка класса выше цели, и она не устарела."""
+        return (now - self.get(route, 'updated')
+                < self.options['LATENCY_WINDOW']
+                and self.get(route, 'latency')
+                > self.options['LATENCY_TARGETS'][route])
+
+    def should_shed(self, route, now):
+        limit = self.options['MAX_IN_FLIGHT'].get(route)
+        if limit and self.in_flight(route) >= limit:
+            return True
+        return any(self.is_overloaded(other, now)
+                   for other in ROUTES[:ROUTES.index(route)])
+
+    def take_tokens(self, key, cost, now):
+        """Списывает жетоны; при нехватке — секунды до пополнения."""
+        rate = self.options['USER_RATE']
+        burst = self.options['USER_BURST']
+        # Хеш с секретом: подобрать ключ, попадающий в чужое ведро, нельзя.
+        digest = hashlib.blake2b(
+            key.encode(), digest_size=8,
+            key=settings.SECRET_KEY.encode()[:64]).digest()
+        slot = 2 * (int.from_bytes(digest, 'big')
+                    % self.options['BUCKETS'])
+        tokens, updated = self.buckets[slot], self.buckets[slot + 1]
+        tokens = burst if not updated else min(
+            burst, tokens + (now - updated) * rate)
+        self.buckets[slot + 1] = now
+        if tokens < cost:
+            self.buckets[slot] = tokens
+            return math.ceil((cost - tokens) / rate)
+        self.buckets[slot] = tokens - cost
+        return 0
+
+    def admit(self, route, key):
+        """None, если запрос допущен, иначе готовый отказ."""
+        self.prepare()
+        now = time.time()
+        with self.shared_lock:
+            if self.should_shed(route, now):
+                self.add(route, 'shed')
+                return JsonResponse(
+                    {'detail': 'Сервер перегружен, повторите запрос позже.'},
+                    status=503, headers={'Retry-After': str(
+                        self.options['RETRY_AFTER'])})
+            wait = self.take_tokens(key, self.options['COSTS'][route], now)
+            if wait:
+                self.add(route, 'throttled')
+                return JsonResponse(
+                    {'detail': 'Слишком много запросов, повторите попытку '
+                               'позже.'},
+                    status=429, headers={'Retry-After': str(wait)})
+            self.add(route, 'admitted')
+            row = self.claim_row()
+            if row is not None:
+                self.running[row * len(ROUTES) + ROUTES.index(route)] += 1
+        return None
+
+    def finish(self, route, latency):
+        now = time.time()
+        weight = self.options['LATENCY_WEIGHT']
+        with self.shared_lock:
+            if self.row is not None and self.pid == os.getpid():
+                self.running[self.row * len(ROUTES)
+                             + ROUTES.index(route)] -= 1
+            index = self.index(route, 'latency')
+            if now - self.get(route, 'updated') < self.options[
+                    'LATENCY_WINDOW']:
+                latency = (1 - weight) * self.stats[index] + weight * latency
+            self.stats[index] = latency
+            self.stats[self.index(route, 'updated')] = now
+
+    def snapshot(self):
+        self.prepare()
+        with self.shared_lock:
+            return {route: {'in_flight': self.in_flight(route),
+                            **{field: self.get(route, field)
+                               for field in FIELDS}} for route in ROUTES}
+
+
+controller = AdmissionController()
+
+
+class AdmissionMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.admission = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request.admission is not None:
+                route, started = request.admission
+                controller.finish(route, time.time() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.ADMISSION['ENABLED']:
+            return None
+        route = route_class(request, view_func)
+        if route is None:
+            return None
+        rejection = controller.admit(route, client_key(request))
+        if rejection is None:
+            now = time.time()
+            request.admission = (route, now - queue_delay(request, now))
+        return rejection
+
+
+METRICS = (
+    ('in_flight', 'gauge', 'Запросы в работе'),
+    ('latency', 'gauge', 'Сглаженная задержка, секунды'),
+    ('admitted', 'counter', 'Допущенные запросы'),
+    ('shed', 'counter', 'Отклоненные с 503 запросы'),
+    ('throttled', 'counter', 'Отклоненные с 429 запросы'),
+)
+
+
+def metrics(request):
+    """Показатели допуска в текстовом формате Prometheus."""
+    snapshot = controller.snapshot()
+    lines = []
+    for field, kind, description in METRICS:
+        name = f'foodgram_admission_{field}'
+        if field == 'latency':
+            name += '_seconds'
+        elif kind == 'counter':
+            name += '_total'
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        convert = float if field == 'latency' else int
+        lines += [f'{name}{{route="{route}"}} {convert(values[field])}'
+                  for route, values in snapshot.items()]
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4')
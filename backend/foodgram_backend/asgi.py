@@ -1,7 +1,21 @@
 import os
 
+import django
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_asgi_application()
+
+from foodgram_backend import warmup  # noqa: E402
+
+from api.stream import recipe_hub, watch_disconnect  # noqa: E402
+
+# Django 5.0 сам отменяет ответ при разрыве соединения.
+if django.VERSION < (5, 0):
+    application = watch_disconnect(application)
+recipe_hub.start()
+
+# Сервер ASGI может загружать приложение уже внутри цикла событий, где
+# синхронные запросы к базе запрещены: только шаги кода.
+warmup.load_app(per_worker=False)
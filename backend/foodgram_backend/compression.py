@@ -0,0 +1,279 @@
+"""
+Сжатие ответов и кэш готовых сжатых ответов.
+
+CompressionMiddleware сжимает текстовые ответы длиннее
+MIN_COMPRESSED_SIZE в лучший из поддерживаемых клиентом форматов: brotli
+и zstd, если установлены пакеты brotli и zstandard, иначе gzip.
+
+Представления могут разрешить кэширование: ViewSet перечисляет в
+cached_response_actions действия, ответы которых одинаковы для всех
+анонимных пользователей, в cached_response_models — модели, от которых
+они зависят, а в cached_response_params — параметры запроса, с которыми
+ответ кэшируется: запросы с произвольными параметрами не вытесняют из
+кэша полезные ответы. Для анонимных GET-запросов к таким действиям сжатое тело
+хранится в памяти процесса, и повторный запрос не доходит ни до
+сериализатора, ни до компрессора. Изменение любой из моделей удаляет
+зависящие от нее ответы, в том числе в других процессах через шину
+инвалидации; остальное ограничено RESPONSE_CACHE_TIMEOUT.
+"""
+import gzip
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript',
+                      'application/xml', 'text/')
+GZIP_LEVEL = 6
+MIN_COMPRESSED_SIZE = 1024
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_TIMEOUT = 300
+UNCOMPRESSED_TYPES = ('text/event-stream',)
+ZSTD_LEVEL = 3
+
+
+class GzipCompressor:
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED,
+                                           zlib.MAX_WBITS | 16)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+def compress(coding, data):
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if coding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+COMPRESSORS = OrderedDict(
+    (coding, compressor) for coding, compressor, module in (
+        ('br', BrotliCompressor, brotli),
+        ('zstd', ZstdCompressor, zstandard),
+        ('gzip', GzipCompressor, gzip),
+    ) if module is not None)
+
+
+def negotiate(accept_encoding):
+    """Лучший формат из Accept-Encoding или None — без сжатия."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().lower().partition(';')
+        weight = 1.0
+        name, _, value = params.strip().partition('=')
+        if name == 'q':
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0
+        weights[coding.strip()] = weight
+    best = max(
+        ((weights.get(coding, weights.get('*', 0)), -position, coding)
+         for position, coding in enumerate(COMPRESSORS)), default=None)
+    return best[2] if best and best[0] > 0 else None
+
+
+def compress_stream(coding, chunks):
+    compressor = COMPRESSORS[coding]()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').lower()
+    return (content_type.startswith(COMPRESSIBLE_TYPES)
+            and not content_type.startswith(UNCOMPRESSED_TYPES)
+            and not response.has_header('Content-Encoding')
+            and 200 <= response.status_code < 300
+            and response.status_code != 206)
+
+
+def compress_response(response, coding):
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if coding is None or not is_compressible(response):
+        return response
+    if response.streaming:
+        if response.is_async:
+            return response
+        response.streaming_content = compress_stream(
+            coding, response.streaming_content)
+        del response.headers['Content-Length']
+    else:
+        if len(response.content) < MIN_COMPRESSED_SIZE:
+            return response
+        content = compress(coding, response.content)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response.headers['Content-Length'] = str(len(content))
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = 'W/' + etag
+    response.headers['Content-Encoding'] = coding
+    return response
+
+
+class ResponseCache:
+    """Готовые ответы в памяти процесса с ограничением по объему."""
+
+    def __init__(self, timeout=RESPONSE_CACHE_TIMEOUT,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] <= time.monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, headers, content, labels, generation):
+        """Сохраняет ответ, если с начала запроса ничего не изменилось."""
+        if len(content) > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.remove(key)
+            self.entries[key] = (headers, content, labels,
+                                 time.monotonic() + self.timeout)
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def invalidate(self, labels=None):
+        with self.lock:
+            self.generation += 1
+            if labels is None:
+                self.entries.clear()
+                self.size = 0
+                return
+            for key in [key for key, entry in self.entries.items()
+                        if entry[2] & labels]:
+                self.remove(key)
+
+    def invalidate_model(self, model):
+        self.invalidate(frozenset([model._meta.label_lower]))
+
+
+response_cache = ResponseCache()
+
+
+def cached_response_labels(request, view_func):
+    """Модели, от которых зависит кэшируемый ответ, или None."""
+    if (request.method != 'GET'
+            or 'HTTP_AUTHORIZATION' in request.META
+            or settings.SESSION_COOKIE_NAME in request.COOKIES):
+        return None
+    view = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    if actions.get('get') not in getattr(view, 'cached_response_actions',
+                                         ()):
+        return None
+    if not set(request.GET).issubset(getattr(view, 'cached_response_params',
+                                             ())):
+        return None
+    return frozenset(model._meta.label_lower
+                     for model in view.cached_response_models)
+
+
+class CompressionMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.response_coding = negotiate(
+            request.headers.get('Accept-Encoding', ''))
+        request.response_cache = None
+        response = self.get_response(request)
+        if getattr(response, 'from_response_cache', False):
+            return response
+        response = compress_response(response, request.response_coding)
+        if request.response_cache is not None and response.status_code == 200:
+            key, labels, generation = request.response_cache
+            if not response.streaming and not response.cookies:
+                response_cache.set(key, list(response.items()),
+                                   response.content, labels, generation)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        labels = cached_response_labels(request, view_func)
+        if labels is None:
+            return None
+        key = (request.scheme, request.get_host(), request.path,
+               urlencode(sorted(request.GET.lists()), doseq=True),
+               request.response_coding)
+        cached = response_cache.get(key)
+        if cached is None:
+            request.response_cache = (key, labels,
+                                      response_cache.generation)
+            return None
+        headers, content = cached
+        response = HttpResponse(content, headers=headers)
+        response.from_response_cache = True
+        return response
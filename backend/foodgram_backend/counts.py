@@ -0,0 +1,217 @@
+"""
+Быстрый подсчет строк в больших таблицах.
+
+COUNT(*) по таблице с миллионами строк в PostgreSQL — полный просмотр.
+Для запросов без условий число строк берется из статистики планировщика
+(pg_class.reltuples), если оно не меньше ESTIMATED_COUNT_THRESHOLD;
+небольшие таблицы и отфильтрованные запросы считаются точно.
+
+Точные подсчеты кэшируются в памяти процесса по SQL-запросу: одинаковые
+фильтры дают одинаковый запрос. Запись хранит таблицы, которые упомянуты
+в запросе, и удаляется при изменении любой из них (сигналы моделей и шина
+инвалидации), а массовые UPDATE и DELETE без сигналов покрывает
+COUNT_CACHE_TIMEOUT.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.lookups import Exact
+from django.utils.functional import cached_property
+
+COUNT_CACHE_MAX_SIZE = 10_000
+COUNT_CACHE_TIMEOUT = 60
+ESTIMATED_COUNT_THRESHOLD = 100_000
+HIDDEN_FIELD = 'is_hidden'
+
+
+def table_estimate(model, using='default'):
+    """Оценка числа строк таблицы модели или None, если ее нет."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(model._meta.db_table)])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+def hides_only(query):
+    """Единственное условие запроса — is_hidden=False по его таблице."""
+    if query.where.negated or len(query.where.children) != 1:
+        return False
+    lookup = query.where.children[0]
+    target = getattr(getattr(lookup, 'lhs', None), 'target', None)
+    return (isinstance(lookup, Exact) and lookup.rhs is False
+            and target is not None and target.name == HIDDEN_FIELD
+            and lookup.lhs.alias == query.get_initial_alias())
+
+
+def count_estimate(queryset, threshold=ESTIMATED_COUNT_THRESHOLD):
+    """
+    Оценка для запроса без условий по большой таблице, иначе None.
+
+    Запрос, скрывающий только объекты в очереди на удаление, оценивается
+    так же, за вычетом скрытых: их мало, и их считает частичный индекс.
+    Для готового списка, а не запроса, оценки нет.
+    """
+    if not isinstance(queryset, QuerySet):
+        return None
+    query = queryset.query
+    hidden = bool(query.where) and hides_only(query)
+    if (query.where and not hidden) or query.distinct or query.is_sliced:
+        return None
+    estimate = table_estimate(queryset.model, queryset.db)
+    if estimate is None or estimate < threshold:
+        return None
+    if hidden:
+        estimate -= queryset.model._base_manager.using(queryset.db).filter(
+            **{HIDDEN_FIELD: True}).count()
+    return max(estimate, 0)
+
+
+def estimated_count(queryset, threshold=ESTIMATED_COUNT_THRESHOLD):
+    estimate = count_estimate(queryset, threshold)
+    return queryset.count() if estimate is None else estimate
+
+
+class CountCache:
+
+    def __init__(self, timeout=COUNT_CACHE_TIMEOUT,
+                 max_size=COUNT_CACHE_MAX_SIZE):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = 0
+
+    @cached_property
+    def tables(self):
+        return [model._meta.db_table
+                for model in apps.get_models(include_auto_created=True)]
+
+    def key(self, queryset):
+        sql, params = queryset.order_by().query.get_compiler(
+            queryset.db).as_sql()
+        return queryset.db, sql, tuple(map(str, params))
+
+    def referenced_tables(self, using, sql):
+        quote_name = connections[using].ops.quote_name
+        return frozenset(table for table in self.tables
+                         if quote_name(table) in sql)
+
+    def count(self, queryset):
+        key = self.key(queryset)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] > now:
+                self.entries.move_to_end(key)
+                return entry[0]
+        # Запись, удаленная во время подсчета, могла устареть — не сохраняем.
+        generation = self.generation
+        count = queryset.count()
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = (
+                    count, self.referenced_tables(key[0], key[1]),
+                    now + self.timeout)
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return count
+
+    def invalidate(self, tables=None):
+        """Удаляет подсчеты по таблицам или все, если tables — None."""
+        with self.lock:
+            self.generation += 1
+            if tables is None:
+                self.entries.clear()
+                return
+            for key in [key for key, entry in self.entries.items()
+                        if entry[1] & tables]:
+                del self.entries[key]
+
+    def invalidate_model(self, model):
+        self.invalidate(frozenset([model._meta.db_table]))
+
+
+count_cache = CountCache()
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        return estimated_count(self.object_list)
+
+
+class EstimatedPage(Page):
+    """Страница, у которой наличие следующей известно по выборке."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = has_next
+
+    def has_next(self):
+        return self.next_exists
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Пагинатор с кэшем подсчетов и оценкой для больших таблиц.
+
+    При exact=True оценка не используется. Если count — оценка, номер
+    страницы не ограничивается ею, а наличие следующей страницы
+    определяется выборкой на одну запись больше.
+    """
+
+    def __init__(self, *args, exact=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact = exact
+
+    @cached_property
+    def estimate(self):
+        return None if self.exact else count_estimate(self.object_list)
+
+    @property
+    def estimated(self):
+        return self.estimate is not None
+
+    @cached_property
+    def count(self):
+        if self.estimated:
+            return self.estimate
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        return count_cache.count(self.object_list)
+
+    def validate_number(self, number):
+        if not self.estimated:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        if not self.estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('Страница не содержит результатов')
+        return EstimatedPage(object_list[:self.per_page], number, self,
+                             len(object_list) > self.per_page)
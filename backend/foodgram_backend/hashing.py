@@ -0,0 +1,249 @@
+"""
+Хеширование паролей в ограниченном пуле процессов.
+
+PBKDF2 намеренно долго считается на процессоре. Волна входов или подбор
+паролей по утекшим базам занимает этим расчетом все рабочие процессы, и
+чтение рецептов ждет процессор. PooledPBKDF2PasswordHasher считает хеши
+в отдельных процессах с пониженным приоритетом, а число одновременных
+расчетов (WORKERS) и ожидающих очереди (QUEUE) ограничено на всю машину:
+семафоры создаются в мастер-процессе gunicorn до fork. Запрос сверх
+очереди или не дождавшийся расчета за TIMEOUT секунд сразу получает
+HashingBusy, на который HashingBusyMiddleware отвечает 429.
+
+Процесс, убитый с занятым разрешением, не вернул бы его семафору, и после
+нескольких таких смертей пул отказывал бы всем до перезапуска мастера.
+Поэтому разрешения каждого процесса учитываются в разделяемой таблице,
+и release из child_exit gunicorn возвращает разрешения умершего процесса.
+
+Процессы пула запускаются через forkserver и импортируют главный модуль
+запустившей их программы: как и для любого multiprocessing, скрипт,
+который хеширует пароли, должен проверять __name__ == '__main__'.
+
+Хеши совместимы с PBKDF2PasswordHasher: алгоритм и формат те же, меняется
+только место расчета. Устаревший хеш после успешного входа обновляется
+фоновым потоком (rehasher), а не во время запроса.
+"""
+import base64
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.utils.encoding import force_bytes
+
+logger = logging.getLogger(__name__)
+
+REHASH_QUEUE_SIZE = 100
+# Строка таблицы разрешений: pid, в очереди, считают.
+OWNER, ADMITTED, RUNNING, ROW_SIZE = range(4)
+
+
+class HashingBusy(Exception):
+    """Пул хеширования занят, запрос нужно повторить позже."""
+
+
+class HashingPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = None
+        self.admitted = None
+        self.shared_lock = None
+        self.holders = None
+        self.executor = None
+        self.pid = None
+
+    @property
+    def options(self):
+        return settings.PASSWORD_HASHING
+
+    def prepare(self):
+        """
+        Создает семафоры; вызванный до fork, делит их между процессами.
+        """
+        with self.lock:
+            if self.running is None:
+                workers = self.options['WORKERS']
+                self.running = multiprocessing.BoundedSemaphore(workers)
+                self.admitted = multiprocessing.BoundedSemaphore(
+                    workers + self.options['QUEUE'])
+                self.shared_lock = multiprocessing.Lock()
+                self.holders = multiprocessing.RawArray(
+                    'q', ROW_SIZE * self.options['MAX_PROCESSES'])
+
+    def rows(self):
+        return range(0, len(self.holders), ROW_SIZE)
+
+    def hold(self, column, delta):
+        """Учитывает разрешения текущего процесса."""
+        pid = os.getpid()
+        with self.shared_lock:
+            free = None
+            for row in self.rows():
+                if self.holders[row + OWNER] == pid:
+                    break
+                if free is None and not self.holders[row + OWNER]:
+                    free = row
+            else:
+                # В переполненной таблице разрешение не учитывается.
+                if delta < 0 or free is None:
+                    return
+                row = free
+                self.holders[row + OWNER] = pid
+            self.holders[row + column] += delta
+            if not (self.holders[row + ADMITTED]
+                    or self.holders[row + RUNNING]):
+                self.holders[row + OWNER] = 0
+
+    def release(self, pid):
+        """Возвращает семафорам разрешения завершившегося процесса."""
+        if self.holders is None:
+            return
+        admitted = running = 0
+        with self.shared_lock:
+            for row in self.rows():
+                if self.holders[row + OWNER] == pid:
+                    admitted += self.holders[row + ADMITTED]
+                    running += self.holders[row + RUNNING]
+                    for column in range(ROW_SIZE):
+                        self.holders[row + column] = 0
+        for _ in range(running):
+            self.running.release()
+        for _ in range(admitted):
+            self.admitted.release()
+
+    def get_executor(self):
+        """Пул процессов — свой в каждом рабочем процессе."""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.executor = ProcessPoolExecutor(
+                    self.options['WORKERS'],
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=os.nice, initargs=(self.options['NICE'],))
+            return self.executor
+
+    def reset_executor(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.pid = self.executor = None
+        executor.shutdown(wait=False)
+
+    def run(self, func, *args):
+        if not self.options['WORKERS']:
+            return func(*args)
+        self.prepare()
+        if not self.admitted.acquire(block=False):
+            raise HashingBusy
+        self.hold(ADMITTED, 1)
+        try:
+            if not self.running.acquire(timeout=self.options['TIMEOUT']):
+                raise HashingBusy
+            self.hold(RUNNING, 1)
+            try:
+                executor = self.get_executor()
+                try:
+                    return executor.submit(func, *args).result()
+                except BrokenProcessPool:
+                    logger.exception('Пул хеширования паролей остановлен')
+                    self.reset_executor(executor)
+                    raise HashingBusy
+            finally:
+                self.hold(RUNNING, -1)
+                self.running.release()
+        finally:
+            self.hold(ADMITTED, -1)
+            self.admitted.release()
+
+
+pool = HashingPool()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2PasswordHasher, считающий хеши в пуле процессов."""
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        digest = pool.run(hashlib.pbkdf2_hmac, self.digest().name,
+                          force_bytes(password), force_bytes(salt),
+                          iterations)
+        encoded = base64.b64encode(digest).decode('ascii').strip()
+        return f'{self.algorithm}${iterations}${salt}${encoded}'
+
+
+class Rehasher:
+    """Обновляет устаревшие хеши паролей в фоновом потоке."""
+
+    def __init__(self, size=REHASH_QUEUE_SIZE):
+        self.queue = queue.Queue(size)
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def schedule(self, user, raw_password):
+        """
+        Ставит хеш в очередь. Переполненная очередь и занятый пул не
+        страшны: хеш обновится при следующем входе.
+        """
+        if user.pk is None:
+            return
+        self.ensure_started()
+        try:
+            self.queue.put_nowait((type(user), user.pk, user.password,
+                                   raw_password))
+        except queue.Full:
+            pass
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.queue = queue.Queue(self.queue.maxsize)
+            threading.Thread(target=self.run, name='password-rehash',
+                             daemon=True).start()
+
+    def run(self):
+        while True:
+            model, pk, encoded, raw_password = self.queue.get()
+            try:
+                # Пароль, смененный за это время, не перезаписываем.
+                model._default_manager.filter(pk=pk, password=encoded).update(
+                    password=make_password(raw_password))
+            except HashingBusy:
+                pass
+            except Exception:
+                logger.exception('Не удалось обновить хеш пароля')
+            finally:
+                close_old_connections()
+
+
+rehasher = Rehasher()
+
+
+class HashingBusyMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        return JsonResponse(
+            {'detail': 'Слишком много запросов, повторите попытку позже.'},
+            status=429,
+            headers={'Retry-After': str(settings.PASSWORD_HASHING[
+                'RETRY_AFTER'])})
@@ -0,0 +1,264 @@
+"""
+Шина инвалидации кэшей между процессами и узлами.
+
+После фиксации транзакции изменение модели публикуется компактным
+событием {"m": модель, "pk": id, "n": узел, "s": номер}. В каждом рабочем
+процессе поток-слушатель собирает события за короткое окно, объединяет их
+по моделям и вызывает зарегистрированные обработчики. Если события могли
+быть потеряны (разрыв соединения, пропуск номера, ротация файла),
+обработчики получают None и сбрасывают кэши целиком.
+
+Транспорт — PostgreSQL LISTEN/NOTIFY, а для SQLite и тестов — общий
+файл, в который события дописываются построчно.
+"""
+import fcntl
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+MAX_PKS_PER_MODEL = 1000
+
+
+class MissedEvents(Exception):
+    """События могли быть потеряны, нужен полный сброс кэшей."""
+
+
+class PostgresTransport:
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.listener = None
+
+    def publish(self, payload):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [self.channel, payload])
+
+    def connect(self):
+        import psycopg2
+
+        database = settings.DATABASES['default']
+        self.listener = psycopg2.connect(
+            dbname=database['NAME'], user=database['USER'],
+            password=database['PASSWORD'], host=database['HOST'],
+            port=database['PORT'])
+        self.listener.set_session(autocommit=True)
+        with self.listener.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+    def receive(self, timeout):
+        try:
+            if self.listener is None:
+                self.connect()
+                raise MissedEvents
+            if select.select([self.listener], [], [], timeout) == (
+                    [], [], []):
+                return []
+            self.listener.poll()
+        except MissedEvents:
+            raise
+        except Exception:
+            logger.exception('Соединение шины инвалидации разорвано')
+            self.close()
+            time.sleep(timeout)
+            raise MissedEvents
+        notifies = self.listener.notifies
+        payloads = [notify.payload for notify in notifies]
+        notifies.clear()
+        return payloads
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+
+class FileTransport:
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offset = None
+
+    def publish(self, payload):
+        with open(self.path, 'a', encoding='utf-8') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            spool.write(payload + '\n')
+            spool.flush()
+            if spool.tell() > self.max_bytes:
+                spool.truncate(0)
+
+    def receive(self, timeout):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if self.offset is None or size < self.offset:
+            self.offset = size
+            raise MissedEvents
+        if size == self.offset:
+            time.sleep(timeout)
+            return []
+        with open(self.path, encoding='utf-8') as spool:
+            spool.seek(self.offset)
+            data = spool.read()
+        complete, _, _ = data.rpartition('\n')
+        if not complete:
+            return []
+        self.offset += len(complete.encode('utf-8')) + 1
+        return complete.split('\n')
+
+    def close(self):
+        self.offset = None
+
+
+class InvalidationBus:
+
+    def __init__(self):
+        self.node = uuid.uuid4().hex[:12]
+        self.sequence = itertools.count(1)
+        self.handlers = defaultdict(list)
+        self.last_sequences = {}
+        self.thread = None
+        self.stopping = threading.Event()
+        self.ready = threading.Event()
+        self._transport = None
+
+    @property
+    def options(self):
+        return settings.INVALIDATION_BUS
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            name = self.options['TRANSPORT']
+            if name == 'postgres' and connection.vendor == 'postgresql':
+                self._transport = PostgresTransport(self.options['CHANNEL'])
+            elif name:
+                self._transport = FileTransport(self.options['PATH'],
+                                                self.options['MAX_BYTES'])
+        return self._transport
+
+    def register(self, model, handler):
+        """
+        Регистрирует обработчик изменений модели. Обработчик получает
+        множество первичных ключей или None, если нужно сбросить всё.
+        """
+        self.handlers[model].append(handler)
+
+    def publish(self, model, pk):
+        if self.transport is None:
+            return
+        payload = json.dumps({'m': model, 'pk': pk, 'n': self.node,
+                              's': next(self.sequence)},
+                             separators=(',', ':'))
+        try:
+            self.transport.publish(payload)
+        except Exception:
+            logger.exception('Не удалось опубликовать событие инвалидации')
+
+    def publish_on_commit(self, model, pk):
+        transaction.on_commit(lambda: self.publish(model, pk))
+
+    def start_listener(self):
+        if (self.transport is None
+                or (self.thread is not None and self.thread.is_alive())):
+            return
+        self.stopping.clear()
+        self.ready.clear()
+        self.thread = threading.Thread(target=self.listen,
+                                       name='invalidation-bus', daemon=True)
+        self.thread.start()
+
+    def stop_listener(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self._transport is not None:
+            self._transport.close()
+
+    def wait_ready(self, timeout):
+        """Ждет подключения слушателя и первого сброса кэшей."""
+        if self.thread is not None:
+            self.ready.wait(timeout)
+
+    def after_fork(self):
+        """
+        Готовит копию шины в дочернем процессе: у процесса свой узел
+        и нумерация событий, иначе соседние процессы отбрасывали бы события
+        друг друга как свои. Слушатель родителя должен быть остановлен
+        до fork, его соединение не наследуется.
+        """
+        self.node = uuid.uuid4().hex[:12]
+        self.sequence = itertools.count(1)
+        self.last_sequences = {}
+        self.thread = None
+        self.stopping = threading.Event()
+        self.ready = threading.Event()
+        self._transport = None
+
+    def listen(self):
+        while not self.stopping.is_set():
+            try:
+                self.dispatch(self.collect())
+                close_old_connections()
+            except MissedEvents:
+                self.flush()
+                self.ready.set()
+            except Exception:
+                logger.exception('Ошибка в слушателе шины инвалидации')
+                self.flush()
+
+    def collect(self):
+        """Собирает события за окно объединения: модель → ключи."""
+        poll_interval = self.options['POLL_INTERVAL']
+        window = self.options['COALESCE_WINDOW']
+        changes = defaultdict(set)
+        deadline = None
+        while not self.stopping.is_set():
+            timeout = (poll_interval if deadline is None
+                       else max(deadline - time.monotonic(), 0))
+            for payload in self.transport.receive(timeout):
+                event = json.loads(payload)
+                if self.is_missed(event):
+                    raise MissedEvents
+                if event['n'] != self.node:
+                    changes[event['m']].add(event['pk'])
+            if changes and deadline is None:
+                deadline = time.monotonic() + window
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return changes
+
+    def is_missed(self, event):
+        last = self.last_sequences.get(event['n'])
+        self.last_sequences[event['n']] = event['s']
+        return last is not None and event['s'] != last + 1
+
+    def dispatch(self, changes):
+        for model, pks in changes.items():
+            for handler in self.handlers[model]:
+                handler(pks if len(pks) <= MAX_PKS_PER_MODEL else None)
+
+    def flush(self):
+        for handlers in self.handlers.values():
+            for handler in handlers:
+                try:
+                    handler(None)
+                except Exception:
+                    logger.exception('Ошибка при сбросе кэша')
+
+
+bus = InvalidationBus()
@@ -39,6 +39,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram_backend.compression.CompressionMiddleware',
+    'foodgram_backend.hashing.HashingBusyMiddleware',
+    'foodgram_backend.admission.AdmissionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -101,6 +104,50 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    'foodgram_backend.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Пул хеширования паролей, см. foodgram_backend.hashing; WORKERS=0 —
+# хешировать в процессе запроса без ограничений. Синхронный рабочий
+# процесс gunicorn занят, пока ждет хеш, поэтому WORKERS + QUEUE должно
+# быть меньше GUNICORN_WORKERS: остальные процессы отвечают на чтение.
+# По умолчанию хеши считаются на всех ядрах, а gunicorn запускает
+# 2 * ядра + 1 процессов (gunicorn.conf.py).
+CPU_COUNT = os.cpu_count() or 1
+PASSWORD_HASHING = {
+    'WORKERS': int(os.getenv('PASSWORD_HASHING_WORKERS', CPU_COUNT)),
+    'QUEUE': int(os.getenv('PASSWORD_HASHING_QUEUE',
+                           max(CPU_COUNT // 2, 1))),
+    'TIMEOUT': float(os.getenv('PASSWORD_HASHING_TIMEOUT', 2)),
+    'NICE': 10,
+    'RETRY_AFTER': 1,
+    'MAX_PROCESSES': 64,
+}
+
+# Общий кэш рабочих процессов: в нем счетчики ограничений частоты DRF,
+# иначе у каждого процесса свой счетчик и лимит умножается на их число.
+# Таблицу создает manage.py createcachetable. Состояние пользователя
+# (api.viewer_state) хранится в памяти процесса: ключ содержит версию,
+# так что копии в разных процессах не расходятся.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+        },
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 LANGUAGE_CODE = 'ru-RU'
 
 TIME_ZONE = 'Europe/Moscow'
@@ -117,6 +164,15 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'foodgram_backend.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework'
                                 '.DjangoFilterBackend'],
@@ -127,11 +183,22 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination'
                                 '.PageNumberPagination',
     'PAGE_SIZE': PAGE_SIZE,
+    # Адрес клиента — последний в X-Forwarded-For, его добавляет nginx.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.getenv('LOGIN_THROTTLE_RATE', '20/min'),
+        'login_account': os.getenv('LOGIN_ACCOUNT_THROTTLE_RATE', '5/min'),
+        'login_account_total': os.getenv(
+            'LOGIN_ACCOUNT_TOTAL_THROTTLE_RATE', '100/hour'),
+        'password_change': '5/hour',
+        'registration': os.getenv('REGISTRATION_THROTTLE_RATE', '10/hour'),
+    },
 }
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
+        'token_create': 'api.serializers.TokenCreateSerializer',
         'user_create': 'api.serializers.UserCreateSerializer',
         'user': 'api.serializers.UserSerializer',
         'current_user': 'api.serializers.UserSerializer',
@@ -144,3 +211,47 @@ DJOSER = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+INVALIDATION_BUS = {
+    'TRANSPORT': os.getenv('INVALIDATION_BUS_TRANSPORT', 'postgres'),
+    'CHANNEL': 'foodgram_invalidation',
+    'PATH': os.getenv('INVALIDATION_BUS_PATH',
+                      '/tmp/foodgram-invalidation.jsonl'),
+    'MAX_BYTES': 1024 * 1024,
+    'COALESCE_WINDOW': 0.05,
+    'POLL_INTERVAL': 1,
+}
+
+# Число хеш-секций, на которые миграции делят пустые таблицы избранного,
+# списков покупок и ингредиентов рецептов; 0 — не секционировать.
+# Заполненные таблицы переводит команда partition_relations.
+RELATION_PARTITIONS = int(os.getenv('RELATION_PARTITIONS', 0))
+
+VIEW_COUNTER_FLUSH_INTERVAL = int(os.getenv('VIEW_COUNTER_FLUSH_INTERVAL',
+                                            10))
+
+# Прогрев процесса при запуске wsgi/asgi, см. foodgram_backend.warmup.
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'True').lower() == 'true'
+
+# Допуск запросов API под перегрузкой, см. foodgram_backend.admission.
+# Задержки — в секундах; MAX_IN_FLIGHT 0 — без ограничения; жетоны ведра
+# пользователя пополняются со скоростью USER_RATE в секунду до USER_BURST,
+# запрос тратит COSTS жетонов своего класса. Ведра лежат в общей памяти,
+# по 16 байт на каждое из BUCKETS.
+ADMISSION = {
+    'ENABLED': os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true',
+    'LATENCY_TARGETS': {'cheap': 0.3, 'write': 1, 'expensive': 3},
+    'LATENCY_WEIGHT': 0.2,
+    'LATENCY_WINDOW': 5,
+    'MAX_IN_FLIGHT': {
+        'cheap': 0,
+        'write': 0,
+        'expensive': int(os.getenv('ADMISSION_MAX_EXPENSIVE', 2)),
+    },
+    'RETRY_AFTER': 2,
+    'COSTS': {'cheap': 1, 'write': 2, 'expensive': 5},
+    'USER_RATE': float(os.getenv('ADMISSION_USER_RATE', 10)),
+    'USER_BURST': float(os.getenv('ADMISSION_USER_BURST', 50)),
+    'BUCKETS': int(os.getenv('ADMISSION_BUCKETS', 65536)),
+    'MAX_PROCESSES': 64,
+}
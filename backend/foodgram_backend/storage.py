@@ -0,0 +1,125 @@
+"""
+Хранилище медиафайлов с адресацией по содержимому.
+
+Файл сохраняется под именем <каталог>/<xx>/<sha256><расширение>, где xx —
+первые символы хеша. Одинаковые изображения хранятся один раз, а URL
+файла никогда не меняет содержимое, поэтому nginx отдает такие файлы
+с бессрочным Cache-Control.
+
+Файл может использоваться несколькими записями, поэтому delete() лишь
+планирует проверку: после фиксации транзакции файл удаляется, только если
+на него больше не ссылается ни одно поле моделей, хранящее файлы здесь.
+
+Загрузка, попавшая на уже существующий файл, ссылается на него только после
+фиксации своей транзакции. Поэтому она оставляет рядом отметку <имя>.claim,
+и файл с отметкой моложе CLAIM_TIMEOUT секунд не удаляется. Отметку и
+удаление разделяет блокировка файла .lock в каталоге хранилища, общая для
+всех процессов; запросы к базе данных под ней не выполняются. Новый файл
+записывается во временный и появляется под своим именем атомарно через
+os.link.
+"""
+import fcntl
+import hashlib
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import FileField
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+CLAIM_SUFFIX = '.claim'
+CLAIM_TIMEOUT = 600
+LOCK_NAME = '.lock'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def file_fields():
+    """Поля моделей, файлы которых хранятся в default_storage."""
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if (isinstance(field, FileField)
+                    and field.storage is default_storage):
+                yield model, field.name
+
+
+def is_referenced(name):
+    """Ссылается ли на файл хоть одна запись; поля файлов проиндексированы."""
+    return any(model._default_manager.filter(**{field: name}).exists()
+               for model, field in file_fields())
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def hashed_name(self, name, content):
+        directory, file_name = os.path.split(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(file_name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def claim(self, name):
+        with open(self.path(name + CLAIM_SUFFIX), 'a'):
+            os.utime(self.path(name + CLAIM_SUFFIX))
+
+    def is_claimed(self, name):
+        try:
+            claimed_at = os.path.getmtime(self.path(name + CLAIM_SUFFIX))
+        except FileNotFoundError:
+            return False
+        return time.time() - claimed_at < CLAIM_TIMEOUT
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        with self.locked():
+            if self.exists(name):
+                self.claim(name)
+                return name
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        try:
+            with self.locked():
+                try:
+                    os.link(self.path(temporary), self.path(name))
+                except FileExistsError:
+                    self.claim(name)
+        finally:
+            os.remove(self.path(temporary))
+        return name
+
+    def delete(self, name):
+        if name:
+            transaction.on_commit(lambda: self.delete_unreferenced(name))
+
+    def delete_unreferenced(self, name):
+        # Ссылки проверяются до блокировки: загрузка, которая сошлется на
+        # файл позже, успеет оставить отметку, а ее проверяют под блокировкой.
+        if is_referenced(name):
+            return
+        with self.locked():
+            if self.is_claimed(name):
+                return
+            super().delete(name)
+            super().delete(name + CLAIM_SUFFIX)
@@ -2,10 +2,13 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
+from foodgram_backend.admission import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls', namespace='api')),
+    # nginx не проксирует /metrics: показатели доступны только изнутри.
+    path('metrics', metrics, name='metrics'),
 ]
 
 
@@ -0,0 +1,96 @@
+"""
+Прогрев процесса до приема запросов.
+
+Первые запросы нового рабочего процесса платят за ленивые импорты,
+компиляцию шаблонов URL, построение полей сериализаторов и пустые кэши.
+Приложения регистрируют шаги прогрева через register:
+
+- шаги кода выполняются один раз при загрузке приложения; в gunicorn
+  с preload_app это мастер-процесс, и результат наследуют все рабочие;
+- шаги данных (per_worker=True) заполняют кэши и выполняются в каждом
+  рабочем процессе после fork: кэши мастера не получают событий шины
+  инвалидации и могли устареть к моменту запуска процесса.
+
+Под gunicorn (gunicorn.conf.py задает WARMUP_AFTER_FORK) загрузка
+приложения выполняет только шаги кода, а слушатель шины и шаги данных
+запускает after_fork в каждом рабочем процессе.
+
+Ошибка шага пишется в журнал и не мешает процессу принять запросы.
+"""
+import logging
+import os
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+
+from .invalidation import bus
+
+logger = logging.getLogger(__name__)
+
+AFTER_FORK_ENV = 'WARMUP_AFTER_FORK'
+BUS_READY_TIMEOUT = 5
+
+WarmupStep = namedtuple('WarmupStep', 'name func per_worker')
+
+steps = []
+
+
+def register(name, per_worker=False):
+    """Декоратор шага прогрева."""
+    def decorator(func):
+        steps.append(WarmupStep(name, func, per_worker))
+        return func
+    return decorator
+
+
+def run(per_worker=None):
+    """
+    Выполняет шаги прогрева: все, только шаги данных (per_worker=True)
+    или только шаги кода (False). Возвращает [(шаг, секунды)].
+    """
+    if not settings.WARMUP_ENABLED:
+        return []
+    timings = []
+    try:
+        for step in steps:
+            if per_worker is not None and step.per_worker != per_worker:
+                continue
+            started = time.perf_counter()
+            try:
+                step.func()
+            except Exception:
+                logger.exception('Шаг прогрева %s не выполнен', step.name)
+                continue
+            timings.append((step.name, time.perf_counter() - started))
+    finally:
+        if per_worker is not False:
+            # Соединения мастера не должны достаться процессам после fork.
+            connections.close_all()
+    logger.info('Прогрев: %s', ', '.join(
+        f'{name} {seconds * 1000:.0f} мс' for name, seconds in timings))
+    return timings
+
+
+def start_process(per_worker=None):
+    """Запускает слушатель шины и прогревает процесс."""
+    bus.start_listener()
+    # Первое подключение слушателя сбрасывает кэши — прогреваем после него.
+    bus.wait_ready(BUS_READY_TIMEOUT)
+    return run(per_worker)
+
+
+def load_app(per_worker=None):
+    """Прогрев при загрузке приложения из wsgi.py или asgi.py."""
+    if os.getenv(AFTER_FORK_ENV):
+        return run(per_worker=False)
+    return start_process(per_worker)
+
+
+def after_fork():
+    """Готовит рабочий процесс, созданный из прогретого мастера."""
+    bus.after_fork()
+    bus.start_listener()
+    bus.wait_ready(BUS_READY_TIMEOUT)
+    return run(per_worker=True)
@@ -0,0 +1,53 @@
+"""
+Настройки gunicorn.
+
+Приложение загружается и прогревается в мастер-процессе (preload_app):
+импорты, шаблоны URL и сериализаторы готовы до fork, и рабочие процессы,
+в том числе перезапущенные по max_requests, начинают с них. Шаги данных
+мастер не выполняет: каждый рабочий процесс запускает свой слушатель шины
+инвалидации и заполняет кэши данных до первого запроса.
+Семафоры пула хеширования паролей и состояние допуска запросов
+создаются до fork и общие для всех рабочих процессов.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS',
+                        2 * (os.cpu_count() or 1) + 1))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+# Мастер при загрузке приложения выполняет только шаги прогрева кода:
+# шаги данных и слушатель шины все равно повторяет post_fork.
+os.environ['WARMUP_AFTER_FORK'] = '1'
+
+
+def pre_fork(server, worker):
+    from foodgram_backend.admission import controller
+    from foodgram_backend.hashing import pool
+    from foodgram_backend.invalidation import bus
+
+    bus.stop_listener()
+    # Ограничения пула хеширования паролей и состояние допуска запросов
+    # общие для всех процессов.
+    pool.prepare()
+    controller.prepare()
+
+
+def post_fork(server, worker):
+    from foodgram_backend import warmup
+
+    timings = warmup.after_fork()
+    server.log.info('Рабочий процесс %s прогрет: %s', worker.pid, ', '.join(
+        f'{name} {seconds * 1000:.0f} мс' for name, seconds in timings))
+
+
+def child_exit(server, worker):
+    from foodgram_backend.admission import controller
+    from foodgram_backend.hashing import pool
+
+    # Процесс мог быть убит посреди запроса: его запросы уже не в работе,
+    # а разрешения пула хеширования нужно вернуть.
+    controller.release(worker.pid)
+    pool.release(worker.pid)
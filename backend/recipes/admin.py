@@ -1,13 +1,44 @@
 from django.contrib import admin
-from django.db.models import Count
+from django.db import transaction
+from foodgram_backend.counts import EstimatedCountPaginator
 
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from . import deletion, shopping_cart
+from .models import (DeletionTask, Favorite, Ingredient, IngredientInRecipe,
+                     Recipe, ShoppingCart, Tag)
+from .pantry import sync_recipe
+from .similarity import index_recipe
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без точного COUNT(*) по всей таблице."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class DeferredDeletionAdmin(admin.ModelAdmin):
+    """
+    Удаление через очередь: объект скрывается, а связанные строки
+    удаляет purge_deleted. Страница подтверждения не собирает каскад.
+    """
+
+    hide = None
+
+    def get_deleted_objects(self, objs, request):
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        self.hide(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.hide(obj)
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
-    search_fields = ('name',)
+    search_fields = ('^name',)
 
 
 @admin.register(Tag)
@@ -16,29 +47,96 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ('name', 'slug')
 
 
-@admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_count', 'short_url')
-    search_fields = ('name', 'author__username', 'author__email')
-    list_filter = ('tags',)
+class IngredientInRecipeInline(admin.TabularInline):
+    model = IngredientInRecipe
+    autocomplete_fields = ('ingredient',)
+    extra = 0
+    min_num = 1
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(favorites_count=Count('favorites'))
-        return queryset
 
-    @admin.display(description='Добавлено раз')
+@admin.register(Recipe)
+class RecipeAdmin(DeferredDeletionAdmin, LargeTableAdmin):
+    list_display = ('name', 'author', 'favorites_count', 'short_url',
+                    'is_hidden')
+    list_select_related = ('author', 'rank')
+    search_fields = ('^name', '=author__username', '=author__email')
+    list_filter = ('is_hidden', 'tags')
+    hide = staticmethod(deletion.hide_recipe)
+    autocomplete_fields = ('author', 'tags')
+    inlines = (IngredientInRecipeInline,)
+
+    @admin.display(description='Добавлено раз',
+                   ordering='rank__favorites_count')
     def favorites_count(self, obj):
-        return obj.favorites_count
+        rank = getattr(obj, 'rank', None)
+        return rank.favorites_count if rank else 0
+
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        shopping_cart.lock_recipe(recipe.id)
+        old_amounts = shopping_cart.recipe_amounts(recipe.id)
+        super().save_related(request, form, formsets, change)
+        new_amounts = shopping_cart.recipe_amounts(recipe.id)
+        shopping_cart.change_recipe(recipe.id, old_amounts, new_amounts)
+        index_recipe(recipe.id, list(new_amounts))
+        sync_recipe(recipe, list(new_amounts),
+                    recipe.tags.values_list('id', flat=True))
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
-    search_fields = ('user__username', 'recipe__name')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('=user__username', '^recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
-    search_fields = ('user__username', 'recipe__name')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('=user__username', '^recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.get(pk=obj.pk)
+            shopping_cart.remove_recipe(old.user_id, old.recipe_id)
+        super().save_model(request, obj, form, change)
+        shopping_cart.add_recipe(obj.user_id, obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            shopping_cart.remove_recipe(obj.user_id, obj.recipe_id)
+            super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for cart in queryset:
+            shopping_cart.remove_recipe(cart.user_id, cart.recipe_id)
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(DeletionTask)
+class DeletionTaskAdmin(admin.ModelAdmin):
+    list_display = ('object_repr', 'model', 'object_id', 'progress',
+                    'requested_at', 'finished_at', 'error')
+    list_filter = ('model', ('finished_at', admin.EmptyFieldListFilter))
+    search_fields = ('object_repr', '=object_id')
+    readonly_fields = ('model', 'object_id', 'object_repr', 'requested_at',
+                       'finished_at', 'total_rows', 'deleted_rows', 'error')
+
+    @admin.display(description='Выполнено')
+    def progress(self, obj):
+        if obj.finished_at:
+            return '100%'
+        if not obj.total_rows:
+            return 'ожидает'
+        percent = min(obj.deleted_rows * 100 // obj.total_rows, 99)
+        return f'{percent}% ({obj.deleted_rows} из {obj.total_rows})'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,221 @@
+"""
+Дневная статистика авторов: добавления рецептов автора в избранное
+и в списки покупок и новые подписчики.
+
+Избранное, списки покупок и подписки хранят дату создания, а
+AuthorDailyStats — число существующих связей, созданных в каждый день.
+Сигналы не меняют строку дня в запросе: у популярного автора она стала бы
+общей блокировкой для всех его читателей. Вместо этого создание связи
+добавляет в AuthorStatsDelta строку с +1, удаление — с -1 для дня
+создания, а rollup_author_stats периодически сводит их в AuthorDailyStats.
+Статистика за период читает не больше одной строки на день и еще не
+сведенные изменения, сколько бы связей ни было у автора.
+
+Связи, созданные до появления дат, не учитываются, пока
+backfill_author_stats не проставит им даты и не пересчитает статистику.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .constants import AUTHOR_STATS_BATCH_SIZE
+from .models import (AuthorDailyStats, AuthorStatsDelta, Favorite, Recipe,
+                     ShoppingCart)
+from users.models import Subscription, User
+
+STATS_FIELDS = {
+    Favorite: 'favorites',
+    ShoppingCart: 'shopping_carts',
+    Subscription: 'subscribers',
+}
+AUTHOR_LOOKUPS = {
+    Favorite: 'recipe__author_id',
+    ShoppingCart: 'recipe__author_id',
+    Subscription: 'author_id',
+}
+ROLLUP_LOCK = 'recipes.author_stats'
+
+
+def relation_author_id(instance):
+    if isinstance(instance, Subscription):
+        return instance.author_id
+    return Recipe.objects.filter(pk=instance.recipe_id).values_list(
+        'author_id', flat=True).first()
+
+
+def add_deltas(deltas):
+    """Записывает изменения {(автор, день): {поле: разница}} одним INSERT."""
+    AuthorStatsDelta.objects.bulk_create(
+        AuthorStatsDelta(author_id=author_id, day=day, **values)
+        for (author_id, day), values in deltas.items() if any(values.values()))
+
+
+def record(instance, delta):
+    """Учитывает создание (+1) или удаление (-1) связи."""
+    if instance.created is None:
+        return
+    author_id = relation_author_id(instance)
+    if author_id is not None:
+        add_deltas({(author_id, timezone.localdate(instance.created)):
+                    {STATS_FIELDS[type(instance)]: delta}})
+
+
+def lock_rollup():
+    """Сводка и пересчет статистики не идут одновременно."""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))',
+                       [ROLLUP_LOCK])
+
+
+def summed_deltas(queryset):
+    """Суммы изменений по автору и дню."""
+    return {
+        (row['author_id'], row['day']): {
+            field: row[f'{field}_sum'] for field in STATS_FIELDS.values()}
+        for row in queryset.values('author_id', 'day').annotate(**{
+            f'{field}_sum': Sum(field) for field in STATS_FIELDS.values()
+        }).order_by()
+    }
+
+
+def apply_deltas(deltas):
+    AuthorDailyStats.objects.bulk_create(
+        [AuthorDailyStats(author_id=author_id, day=day)
+         for (author_id, day), values in deltas.items()
+         if any(value > 0 for value in values.values())],
+        ignore_conflicts=True)
+    for (author_id, day), values in deltas.items():
+        changes = {field: Greatest(F(field) + value, Value(0))
+                   for field, value in values.items() if value}
+        if changes:
+            AuthorDailyStats.objects.filter(
+                author_id=author_id, day=day).update(**changes)
+
+
+def rollup(batch_size=AUTHOR_STATS_BATCH_SIZE):
+    """Сводит накопленные изменения в AuthorDailyStats, возвращает их число."""
+    rolled = 0
+    while True:
+        with transaction.atomic():
+            lock_rollup()
+            ids = list(AuthorStatsDelta.objects.order_by('pk').values_list(
+                'pk', flat=True)[:batch_size])
+            if not ids:
+                return rolled
+            deltas = AuthorStatsDelta.objects.filter(pk__in=ids)
+            apply_deltas(summed_deltas(deltas))
+            deltas.delete()
+        rolled += len(ids)
+
+
+def daily_stats(author_id, start, end):
+    """Ряды по дням с start по end включительно и суммы за период."""
+    rows = {
+        row['day']: row for row in AuthorDailyStats.objects.filter(
+            author_id=author_id, day__range=(start, end)
+        ).values('day', *STATS_FIELDS.values())
+    }
+    pending = summed_deltas(AuthorStatsDelta.objects.filter(
+        author_id=author_id, day__range=(start, end)))
+    series = []
+    totals = dict.fromkeys(STATS_FIELDS.values(), 0)
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        row = rows.get(day, {})
+        delta = pending.get((author_id, day), {})
+        values = {field: max(row.get(field, 0) + delta.get(field, 0), 0)
+                  for field in totals}
+        for field, value in values.items():
+            totals[field] += value
+        series.append({'date': day, **values})
+    return {'from': start, 'to': end, 'totals': totals, 'series': series}
+
+
+def estimated_created(model):
+    """Самая ранняя возможная дата создания связи без даты."""
+    if model is Subscription:
+        return Greatest(
+            Subquery(User.objects.filter(pk=OuterRef('user_id'))
+                     .values('date_joined')[:1]),
+            Subquery(User.objects.filter(pk=OuterRef('author_id'))
+                     .values('date_joined')[:1]))
+    return Greatest(
+        Subquery(Recipe.objects.filter(pk=OuterRef('recipe_id'))
+                 .values('pub_date')[:1]),
+        Subquery(User.objects.filter(pk=OuterRef('user_id'))
+                 .values('date_joined')[:1]))
+
+
+def relation_counts(model, author_ids):
+    author_lookup = AUTHOR_LOOKUPS[model]
+    return model.objects.filter(
+        **{f'{author_lookup}__in': author_ids}, created__isnull=False
+    ).values_list(
+        author_lookup, TruncDate('created')
+    ).annotate(count=Count('id')).order_by()
+
+
+def count_relations(author_ids):
+    """
+    Считает связи авторов и удаляет их несведенные изменения. В PostgreSQL
+    это один запрос с одним снимком данных: связь, зафиксированная до него,
+    посчитана, а ее изменение удалено; зафиксированная после — не посчитана,
+    а изменение останется до сводки.
+    """
+    if connection.vendor != 'postgresql':
+        AuthorStatsDelta.objects.filter(author_id__in=author_ids).delete()
+        return [(field, *row) for model, field in STATS_FIELDS.items()
+                for row in relation_counts(model, author_ids)]
+    table = connection.ops.quote_name(AuthorStatsDelta._meta.db_table)
+    parts = []
+    params = [list(author_ids)]
+    for model, field in STATS_FIELDS.items():
+        queryset = relation_counts(model, author_ids)
+        sql, query_params = queryset.query.get_compiler(
+            queryset.db).as_sql()
+        parts.append(f'SELECT %s, counts.* FROM ({sql}) AS counts')
+        params += [field, *query_params]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH removed AS (DELETE FROM {table} '
+            f'WHERE author_id = ANY(%s)) ' + ' UNION ALL '.join(parts),
+            params)
+        return cursor.fetchall()
+
+
+def expected_stats(author_ids):
+    stats = {}
+    for field, author_id, day, count in count_relations(author_ids):
+        stats.setdefault((author_id, day), {})[field] = count
+    return stats
+
+
+@transaction.atomic
+def rebuild_stats(author_ids):
+    """
+    Проставляет даты связям без них и пересчитывает статистику авторов.
+
+    Датой связи без даты считается самый ранний возможный момент: позже
+    публикации рецепта и регистрации пользователей. Запись связей не
+    останавливается: даты проставляются построчно, а подсчет и удаление
+    несведенных изменений идут одним запросом. Сводка на время пересчета
+    ждет, чтобы не изменить статистику между подсчетом и сохранением.
+    """
+    author_ids = list(author_ids)
+    lock_rollup()
+    filled = 0
+    for model, author_lookup in AUTHOR_LOOKUPS.items():
+        filled += model.objects.filter(
+            **{f'{author_lookup}__in': author_ids}, created__isnull=True
+        ).update(created=estimated_created(model))
+    stats = expected_stats(author_ids)
+    AuthorDailyStats.objects.filter(author_id__in=author_ids).delete()
+    AuthorDailyStats.objects.bulk_create(
+        AuthorDailyStats(author_id=author_id, day=day, **counts)
+        for (author_id, day), counts in stats.items())
+    return filled
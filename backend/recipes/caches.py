@@ -0,0 +1,39 @@
+"""Кэши справочников в памяти процесса."""
+import threading
+import time
+
+from .constants import TAG_MAP_TTL
+from .models import Tag
+
+
+class TagMap:
+    """Соответствие slug → id тегов, общее для всех запросов процесса."""
+
+    def __init__(self, ttl=TAG_MAP_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.ids = {}
+
+    def load(self):
+        with self.lock:
+            if (self.loaded_at is None
+                    or time.monotonic() - self.loaded_at > self.ttl):
+                self.ids = dict(
+                    Tag.objects.order_by().values_list('slug', 'id'))
+                self.loaded_at = time.monotonic()
+            return self.ids
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def choices(self):
+        return [(slug, slug) for slug in sorted(self.load())]
+
+    def get_ids(self, slugs):
+        ids = self.load()
+        return [ids[slug] for slug in slugs if slug in ids]
+
+
+tag_map = TagMap()
@@ -1,7 +1,27 @@
+AUTHOR_STATS_BATCH_SIZE = 500
 MAX_LENGTH_INGREDIENT = 128
+MAX_LENGTH_LABEL = 100
 MAX_LENGTH_MEASURE = 64
 MAX_LENGTH_RECIPE = 256
+MAX_LENGTH_REPR = 200
 MAX_LENGTH_TAG = 32
 MAX_LENGTH_URL = 8
 MIN_COOKING_TIME = 1
+PANTRY_INDEX_TTL = 300
+PARTITION_BATCH_SIZE = 10000
+PARTITION_COUNT = 16
+PURGE_BATCH_SIZE = 500
+RANK_BATCH_SIZE = 500
+RANK_FAVORITE_WEIGHT = 1
+RANK_POPULAR_HALF_LIFE_DAYS = 30
+RANK_SHOPPING_CART_WEIGHT = 2
+RANK_TRENDING_HALF_LIFE_DAYS = 1
+SHOPPING_CART_TOTALS_BATCH_SIZE = 1000
+SIMILARITY_BANDS = 16
+SIMILARITY_MAX_CANDIDATES = 500
+SIMILARITY_PERMUTATIONS = 64
+SIMILARITY_SEED = 20240816
+TAG_MAP_TTL = 600
 TITLE_CUT = 25
+TRANSFER_BATCH_SIZE = 1000
+VIEW_COUNTER_MAX_RECIPES = 10000
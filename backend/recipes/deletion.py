@@ -0,0 +1,247 @@
+"""
+Отложенное удаление рецептов и пользователей.
+
+Каскад от популярного рецепта или активного автора затрагивает миллионы
+строк избранного, списков покупок, ингредиентов и подписок, а в одной
+транзакции такое удаление держит блокировки секундами. Поэтому запрос
+на удаление только скрывает объект (is_hidden) и ставит DeletionTask,
+а связанные строки пакетами удаляет команда purge_deleted.
+
+Каждый пакет удаляется отдельной короткой транзакцией одним DELETE, без
+сигналов на каждую строку. То, что сделали бы сигналы, делается раз за
+пакет: рейтинги рецептов помечаются к пересчету, из статистики авторов
+вычитаются сгруппированные числа, версии состояния пользователей
+увеличиваются одним UPDATE, а шина получает одно событие. Сами рецепт и
+пользователь удаляются через ORM, и их файлы освобождаются после фиксации.
+Прерванное удаление продолжается с того же места.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from foodgram_backend.compression import response_cache
+from foodgram_backend.counts import count_cache
+from foodgram_backend.invalidation import bus
+
+from .author_stats import AUTHOR_LOOKUPS, STATS_FIELDS, add_deltas
+from .constants import MAX_LENGTH_REPR, PURGE_BATCH_SIZE
+from .models import (AuthorDailyStats, AuthorStatsDelta, DeletionTask,
+                     Favorite, IngredientInRecipe, Recipe, RecipeRank,
+                     ShoppingCart, ShoppingCartTotal)
+from .pantry import forget_recipe
+from .shopping_cart import apply_deltas, recipe_amounts
+from api.viewer_state import bump_viewer_state
+from users.models import Subscription, User
+
+logger = logging.getLogger(__name__)
+
+
+def schedule(model, instance):
+    DeletionTask.objects.create(model=model, object_id=instance.pk,
+                                object_repr=str(instance)[:MAX_LENGTH_REPR])
+
+
+@transaction.atomic
+def hide_recipe(recipe):
+    """Скрывает рецепт и ставит его в очередь на удаление."""
+    if recipe.is_hidden:
+        return
+    recipe.is_hidden = True
+    recipe.save(update_fields=['is_hidden'])
+    forget_recipe(recipe.id)
+    schedule(DeletionTask.RECIPE, recipe)
+
+
+@transaction.atomic
+def hide_user(user):
+    """Скрывает пользователя с его рецептами и ставит в очередь."""
+    if user.is_hidden:
+        return
+    user.is_hidden = True
+    user.is_active = False
+    user.save(update_fields=['is_hidden', 'is_active'])
+    recipe_ids = list(Recipe.objects.filter(
+        author=user, is_hidden=False).values_list('id', flat=True))
+    # Рецептов может быть много, поэтому без save() и его сигналов:
+    # кэши сбрасываются здесь же.
+    Recipe.objects.filter(id__in=recipe_ids).update(is_hidden=True)
+    count_cache.invalidate_model(Recipe)
+    response_cache.invalidate_model(Recipe)
+    transaction.on_commit(lambda: response_cache.invalidate_model(Recipe))
+    for recipe_id in recipe_ids:
+        forget_recipe(recipe_id)
+        bus.publish_on_commit(Recipe._meta.label_lower, recipe_id)
+    schedule(DeletionTask.USER, user)
+
+
+def relation_fields(model):
+    fields = ['pk', 'user_id', 'created', AUTHOR_LOOKUPS[model]]
+    if model is not Subscription:
+        fields.append('recipe_id')
+    return fields
+
+
+def release_relations(model, rows):
+    """Поправки за пакет удаленных связей вместо сигналов каждой строки."""
+    recipe_ids = {row['recipe_id'] for row in rows if 'recipe_id' in row}
+    if recipe_ids:
+        RecipeRank.objects.filter(recipe_id__in=recipe_ids).update(
+            is_dirty=True)
+    # Статистику скрытых авторов удалит purge_user, ее не поправляем.
+    author_ids = {row[AUTHOR_LOOKUPS[model]] for row in rows}
+    hidden_ids = set(User.objects.filter(
+        pk__in=author_ids, is_hidden=True).values_list('pk', flat=True))
+    removed = Counter(
+        (row[AUTHOR_LOOKUPS[model]], timezone.localdate(row['created']))
+        for row in rows if row['created'] is not None
+        and row[AUTHOR_LOOKUPS[model]] not in hidden_ids)
+    add_deltas({key: {STATS_FIELDS[model]: -count}
+                for key, count in removed.items()})
+    bump_viewer_state({row['user_id'] for row in rows})
+    count_cache.invalidate_model(model)
+    bus.publish_on_commit(model._meta.label_lower, rows[-1]['pk'])
+
+
+def raw_delete(model, pks):
+    return model.objects.filter(pk__in=pks)._raw_delete(
+        model.objects.db)
+
+
+def delete_batches(queryset, batch_size):
+    """
+    Удаляет строки пакетами; итератор по числу удаленных строк запроса,
+    без мелких каскадов. У избранного, списков покупок и подписок
+    поправки, которые делали бы их сигналы, делаются раз за пакет.
+    """
+    model = queryset.model
+    while True:
+        with transaction.atomic():
+            if model in AUTHOR_LOOKUPS:
+                rows = list(queryset.select_for_update(of=('self',))
+                            .order_by('pk')
+                            .values(*relation_fields(model))[:batch_size])
+                pks = [row['pk'] for row in rows]
+            else:
+                pks = list(queryset.order_by('pk').values_list(
+                    'pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            if model in (Recipe, User):
+                _, deleted = model.objects.filter(pk__in=pks).delete()
+                deleted = deleted.get(model._meta.label, 0)
+            else:
+                deleted = raw_delete(model, pks)
+            if model in AUTHOR_LOOKUPS:
+                release_relations(model, rows)
+        yield deleted
+
+
+def delete_cart_batches(recipe_id, batch_size):
+    """Убирает рецепт из списков покупок вместе с его долей в итогах."""
+    deltas = {ingredient_id: -amount for ingredient_id, amount
+              in recipe_amounts(recipe_id).items()}
+    while True:
+        with transaction.atomic():
+            rows = list(ShoppingCart.objects.select_for_update(
+                of=('self',)).filter(recipe_id=recipe_id).order_by(
+                    'pk').values(*relation_fields(ShoppingCart))[:batch_size])
+            if not rows:
+                return
+            apply_deltas([row['user_id'] for row in rows], deltas)
+            raw_delete(ShoppingCart, [row['pk'] for row in rows])
+            release_relations(ShoppingCart, rows)
+        yield len(rows)
+
+
+def purge_recipe(recipe_id, batch_size=PURGE_BATCH_SIZE):
+    # Ингредиенты удаляются после списков покупок: по ним считаются
+    # поправки итогов.
+    yield from delete_cart_batches(recipe_id, batch_size)
+    yield from delete_batches(Favorite.objects.filter(recipe_id=recipe_id),
+                              batch_size)
+    yield from delete_batches(
+        IngredientInRecipe.objects.filter(recipe_id=recipe_id), batch_size)
+    yield from delete_batches(Recipe.objects.filter(pk=recipe_id),
+                              batch_size)
+
+
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE):
+    for recipe_id in list(Recipe.objects.filter(author_id=user_id)
+                          .values_list('id', flat=True)):
+        yield from purge_recipe(recipe_id, batch_size)
+    for queryset in (
+        ShoppingCart.objects.filter(user_id=user_id),
+        ShoppingCartTotal.objects.filter(user_id=user_id),
+        Favorite.objects.filter(user_id=user_id),
+        Subscription.objects.filter(Q(user_id=user_id)
+                                    | Q(author_id=user_id)),
+        AuthorStatsDelta.objects.filter(author_id=user_id),
+        AuthorDailyStats.objects.filter(author_id=user_id),
+        User.objects.filter(pk=user_id),
+    ):
+        yield from delete_batches(queryset, batch_size)
+
+
+def recipe_rows(recipe_ids):
+    return sum(model.objects.filter(recipe_id__in=recipe_ids).count()
+               for model in (Favorite, IngredientInRecipe, ShoppingCart)
+               ) + len(recipe_ids)
+
+
+def planned_rows(task):
+    """Число строк, которые предстоит удалить, без мелких каскадов."""
+    if task.model == DeletionTask.RECIPE:
+        return recipe_rows([task.object_id])
+    user_id = task.object_id
+    return recipe_rows(list(Recipe.objects.filter(
+        author_id=user_id).values_list('id', flat=True))) + sum(
+        queryset.count() for queryset in (
+            ShoppingCart.objects.filter(user_id=user_id),
+            ShoppingCartTotal.objects.filter(user_id=user_id),
+            Favorite.objects.filter(user_id=user_id),
+            Subscription.objects.filter(Q(user_id=user_id)
+                                        | Q(author_id=user_id)),
+            AuthorStatsDelta.objects.filter(author_id=user_id),
+            AuthorDailyStats.objects.filter(author_id=user_id),
+        )) + 1
+
+
+PURGES = {
+    DeletionTask.RECIPE: purge_recipe,
+    DeletionTask.USER: purge_user,
+}
+
+
+def run_task(task, batch_size=PURGE_BATCH_SIZE, pause=0):
+    if task.total_rows is None:
+        task.total_rows = planned_rows(task)
+        task.save(update_fields=['total_rows'])
+    for deleted in PURGES[task.model](task.object_id, batch_size):
+        DeletionTask.objects.filter(pk=task.pk).update(
+            deleted_rows=F('deleted_rows') + deleted)
+        if pause:
+            time.sleep(pause)
+    DeletionTask.objects.filter(pk=task.pk).update(
+        finished_at=timezone.now(), error='')
+
+
+def run_pending(batch_size=PURGE_BATCH_SIZE, pause=0):
+    """
+    Выполняет незавершенные удаления по очереди, возвращает число
+    завершенных. Удаление с ошибкой остается в очереди с ее текстом.
+    """
+    finished = 0
+    for task in DeletionTask.objects.filter(
+            finished_at__isnull=True).order_by('pk'):
+        try:
+            run_task(task, batch_size, pause)
+        except Exception as error:
+            logger.exception('Не удалось удалить %s', task.object_repr)
+            DeletionTask.objects.filter(pk=task.pk).update(
+                error=f'{type(error).__name__}: {error}')
+            continue
+        finished += 1
+    return finished
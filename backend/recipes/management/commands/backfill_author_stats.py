@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand
+
+from recipes.author_stats import rebuild_stats
+from recipes.constants import AUTHOR_STATS_BATCH_SIZE
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Проставляет даты избранному, спискам покупок и подпискам '
+            'и пересчитывает дневную статистику авторов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=AUTHOR_STATS_BATCH_SIZE,
+                            help='Авторов в одной транзакции.')
+        parser.add_argument('--author', type=int, action='append',
+                            dest='authors',
+                            help='Пересчитать только этих авторов.')
+
+    def author_batches(self, options):
+        """Авторы пакетами по диапазонам id, без долгого курсора."""
+        if options['authors']:
+            authors = sorted(set(options['authors']))
+            for start in range(0, len(authors), options['batch_size']):
+                yield authors[start:start + options['batch_size']]
+            return
+        last_id = 0
+        while batch := list(User.objects.filter(pk__gt=last_id).order_by(
+                'pk').values_list('pk', flat=True)[:options['batch_size']]):
+            yield batch
+            last_id = batch[-1]
+
+    def handle(self, *args, **options):
+        authors = filled = 0
+        for batch in self.author_batches(options):
+            filled += rebuild_stats(batch)
+            authors += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Статистика пересчитана для авторов: {authors}, '
+            f'проставлено дат: {filled}'))
@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.similarity import LSHIndex, hasher
+
+DEFAULT_SIZES = [1000, 4000, 16000, 64000]
+INGREDIENTS_COUNT = 2000
+QUERIES_COUNT = 100
+RESULTS_LIMIT = 6
+SIMILARITY_THRESHOLD = 0.5
+
+
+def generate_recipes(count, rng):
+    """Генерирует вариации базовых блюд с заменой части ингредиентов."""
+    dishes = [rng.sample(range(INGREDIENTS_COUNT), rng.randint(6, 14))
+              for _ in range(max(count // 20, 1))]
+    recipes = []
+    for _ in range(count):
+        ingredients = set(rng.choice(dishes))
+        for _ in range(rng.randint(0, 2)):
+            ingredients.discard(rng.choice(sorted(ingredients)))
+            ingredients.add(rng.randrange(INGREDIENTS_COUNT))
+        recipes.append(ingredients)
+    return recipes
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+
+def exact_neighbors(recipes, key):
+    similarity = [jaccard(recipes[key], other) for other in recipes]
+    nearest = sorted(range(len(recipes)), key=lambda other: -similarity[other])
+    return [other for other in nearest[:RESULTS_LIMIT + 1]
+            if similarity[other] >= SIMILARITY_THRESHOLD]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время поиска похожих рецептов через LSH '
+            'и полным перебором')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int,
+                            default=DEFAULT_SIZES)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"рецептов":>10} {"LSH, мс":>10} {"перебор, мс":>12} '
+            f'{"кандидатов":>11} {"полнота":>8}')
+        for size in options['sizes']:
+            self.benchmark(size, random.Random(options['seed']))
+
+    def benchmark(self, size, rng):
+        recipes = generate_recipes(size, rng)
+        index = LSHIndex()
+        signatures = [hasher.signature(ingredients)
+                      for ingredients in recipes]
+        for key, signature in enumerate(signatures):
+            index.add(key, signature)
+        queries = rng.sample(range(size), min(QUERIES_COUNT, size))
+
+        started = time.perf_counter()
+        lsh_results = [index.query(signatures[key], RESULTS_LIMIT + 1)
+                       for key in queries]
+        lsh_time = (time.perf_counter() - started) / len(queries)
+
+        started = time.perf_counter()
+        exact_results = [exact_neighbors(recipes, key) for key in queries]
+        exact_time = (time.perf_counter() - started) / len(queries)
+
+        candidates = sum(len(index.candidates(signatures[key]))
+                         for key in queries) / len(queries)
+        found = sum(
+            len({key for key, _ in lsh} & set(exact))
+            for lsh, exact in zip(lsh_results, exact_results)
+        )
+        recall = found / sum(len(exact) for exact in exact_results)
+        self.stdout.write(
+            f'{size:>10} {lsh_time * 1000:>10.3f} {exact_time * 1000:>12.3f} '
+            f'{candidates:>11.0f} {recall:>8.2f}')
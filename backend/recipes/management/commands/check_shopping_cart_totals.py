@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.models import ShoppingCart, ShoppingCartTotal
+from recipes.shopping_cart import (expected_totals, rebuild_totals,
+                                   stored_totals)
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Сверяет итоги списков покупок с содержимым списков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Пересчитать расходящиеся итоги.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list('user_id', flat=True)
+                .distinct())
+            | set(ShoppingCartTotal.objects.values_list('user_id', flat=True)
+                  .distinct()))
+        broken = []
+        for start in range(0, len(user_ids), options['batch_size']):
+            batch = user_ids[start:start + options['batch_size']]
+            expected = expected_totals(batch)
+            stored = stored_totals(batch)
+            broken.extend(sorted({
+                user_id for user_id, _ in expected.keys() ^ stored.keys()
+            } | {
+                key[0] for key in expected.keys() & stored.keys()
+                if expected[key] != stored[key]
+            }))
+        if not broken:
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги совпадают, проверено пользователей: {len(user_ids)}'))
+            return
+        self.stdout.write(self.style.WARNING(
+            f'Итоги расходятся у пользователей: {broken}'))
+        if not options['fix']:
+            raise CommandError('Найдены расхождения, запустите с --fix.')
+        for start in range(0, len(broken), options['batch_size']):
+            rebuild_totals(broken[start:start + options['batch_size']])
+        self.stdout.write(self.style.SUCCESS('Итоги пересчитаны'))
@@ -0,0 +1,40 @@
+import gzip
+import sys
+from collections import Counter
+from contextlib import nullcontext
+
+from django.core.management import BaseCommand
+
+from recipes.constants import TRANSFER_BATCH_SIZE
+from recipes.transfer import dump_record, export_records, snapshot
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, рецепты, избранное, списки покупок '
+            'и подписки в файл JSON Lines')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o',
+                            help='Файл выгрузки, для .gz — со сжатием. '
+                                 'По умолчанию — стандартный вывод.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=TRANSFER_BATCH_SIZE,
+                            help='Строк в одном чтении из курсора.')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if path is None:
+            output = nullcontext(sys.stdout)
+        elif path.endswith('.gz'):
+            output = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            output = open(path, 'w', encoding='utf-8')
+        exported = Counter()
+        with output as stream, snapshot():
+            for record in export_records(options['chunk_size']):
+                stream.write(dump_record(record) + '\n')
+                exported[record['model']] += 1
+        # Без файла выгрузка занимает стандартный вывод.
+        report = self.stdout if path else self.stderr
+        report.write(self.style.SUCCESS('Выгружено: ' + ', '.join(
+            f'{model} {count}' for model, count in exported.items())))
@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+
+from django.core.management import BaseCommand, CommandError, call_command
+
+from recipes.constants import TRANSFER_BATCH_SIZE
+from recipes.ranking import refresh_ranks
+from recipes.transfer import Importer, TransferError
+
+
+class Command(BaseCommand):
+    help = ('Загружает файл JSON Lines, созданный export_recipes. '
+            'Существующие объекты не перезаписываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки, .jsonl или .gz.')
+        parser.add_argument('--batch-size', type=int,
+                            default=TRANSFER_BATCH_SIZE,
+                            help='Записей в одной транзакции.')
+        parser.add_argument('--checkpoint',
+                            help='Файл контрольной точки, по умолчанию '
+                                 'рядом с файлом выгрузки.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить с контрольной точки.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        offset = self.read_checkpoint(path, checkpoint, options['resume'])
+        if offset:
+            self.stdout.write(self.style.NOTICE(
+                f'Продолжение с позиции {offset}'))
+        importer = Importer(options['batch_size'])
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rb') as stream:
+                importer.load(
+                    stream, offset,
+                    lambda position: self.save_checkpoint(
+                        path, checkpoint, position))
+        except (TransferError, ValueError, KeyError, TypeError) as error:
+            raise CommandError(
+                f'Загрузка остановлена: {error!r}. Загруженные пакеты '
+                f'сохранены, продолжение: --resume') from error
+        refresh_ranks()
+        # Авторы из пакетов прошлого запуска неизвестны: после --resume
+        # статистика пересчитывается целиком.
+        if offset:
+            call_command('backfill_author_stats', stdout=self.stdout)
+        elif importer.authors:
+            call_command('backfill_author_stats',
+                         authors=sorted(importer.authors),
+                         stdout=self.stdout)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS('Загружено: ' + ', '.join(
+            f'{model} {count}' for model, count
+            in importer.loaded.items())))
+        if +importer.skipped:
+            self.stdout.write(self.style.WARNING('Пропущено: ' + ', '.join(
+                f'{model} {count}' for model, count
+                in (+importer.skipped).items())))
+
+    @staticmethod
+    def read_checkpoint(path, checkpoint, resume):
+        if not os.path.exists(checkpoint):
+            if resume:
+                raise CommandError(f'Контрольная точка не найдена: '
+                                   f'{checkpoint}')
+            return 0
+        if not resume:
+            raise CommandError(
+                f'Найдена контрольная точка {checkpoint}: продолжите '
+                f'загрузку с --resume или удалите файл')
+        with open(checkpoint, encoding='utf-8') as file:
+            state = json.load(file)
+        if state['source'] != os.path.abspath(path):
+            raise CommandError(f'Контрольная точка относится к файлу '
+                               f'{state["source"]}')
+        return state['offset']
+
+    @staticmethod
+    def save_checkpoint(path, checkpoint, offset):
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({'source': os.path.abspath(path), 'offset': offset},
+                      file)
+        os.replace(temporary, checkpoint)
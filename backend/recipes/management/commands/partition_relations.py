@@ -0,0 +1,53 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.constants import PARTITION_BATCH_SIZE, PARTITION_COUNT
+from recipes.partitioning import (PARTITION_KEYS, PartitioningError, copy_rows,
+                                  create_copy, is_partitioned, swap)
+
+
+class Command(BaseCommand):
+    help = ('Переводит таблицы избранного, списков покупок и ингредиентов '
+            'рецептов на хеш-секционирование без остановки записи')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', choices=sorted(PARTITION_KEYS),
+                            action='append',
+                            help='Таблица для переноса; по умолчанию все.')
+        parser.add_argument('--partitions', type=int,
+                            default=PARTITION_COUNT,
+                            help='Число секций.')
+        parser.add_argument('--batch-size', type=int,
+                            default=PARTITION_BATCH_SIZE,
+                            help='Диапазон id, переносимый за транзакцию.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между пакетами, секунд.')
+        parser.add_argument('--lock-timeout', default='5s',
+                            help='Сколько ждать эксклюзивной блокировки '
+                                 'при замене таблицы.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование доступно только в '
+                               'PostgreSQL.')
+        for table in options['table'] or sorted(PARTITION_KEYS):
+            if is_partitioned(table):
+                self.stdout.write(f'{table}: уже секционирована.')
+                continue
+            try:
+                self.partition(table, options)
+            except PartitioningError as error:
+                raise CommandError(str(error))
+
+    def partition(self, table, options):
+        create_copy(table, PARTITION_KEYS[table], options['partitions'])
+        copied = 0
+        for rows in copy_rows(table, options['batch_size']):
+            copied += rows
+            self.stdout.write(f'{table}: перенесено строк: {copied}')
+            time.sleep(options['pause'])
+        swap(table, options['lock_timeout'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{table}: секционирована, перенесено строк: {copied}.'))
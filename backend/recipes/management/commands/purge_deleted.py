@@ -0,0 +1,30 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.constants import PURGE_BATCH_SIZE
+from recipes.deletion import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Удаляет скрытые рецепты и пользователей со связанными данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=PURGE_BATCH_SIZE,
+                            help='Строк в одной транзакции.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между пакетами в секундах.')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Проверять очередь удаления каждые N секунд.')
+
+    def handle(self, *args, **options):
+        while True:
+            finished = run_pending(options['batch_size'], options['pause'])
+            if finished or not options['interval']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Завершено удалений: {finished}'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
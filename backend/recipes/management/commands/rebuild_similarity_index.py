@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe, RecipeBucket, RecipeSignature
+from recipes.similarity import index_recipes
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Перестроение индекса'))
+        RecipeBucket.objects.all().delete()
+        RecipeSignature.objects.all().delete()
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True)
+        indexed = 0
+        batch = []
+        for recipe_id in recipe_ids.iterator():
+            batch.append(recipe_id)
+            if len(batch) == options['batch_size']:
+                indexed += index_recipes(batch)
+                batch = []
+        if batch:
+            indexed += index_recipes(batch)
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано рецептов: {indexed}'))
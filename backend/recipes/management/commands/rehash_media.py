@@ -0,0 +1,41 @@
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import transaction
+from foodgram_backend.storage import file_fields, is_hashed
+
+
+class Command(BaseCommand):
+    help = ('Переименовывает загруженные ранее медиафайлы по хешу '
+            'содержимого и удаляет дубликаты')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать файлы для переноса.')
+
+    def handle(self, *args, **options):
+        renamed = missing = 0
+        for model, field in file_fields():
+            names = (model._default_manager.exclude(**{field: ''})
+                     .exclude(**{f'{field}__isnull': True})
+                     .order_by().values_list(field, flat=True).distinct())
+            for name in list(names):
+                if is_hashed(name):
+                    continue
+                if not default_storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f'Файл не найден: {name}')
+                    continue
+                renamed += 1
+                if not options['dry_run']:
+                    self.rehash(model, field, name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {renamed}, не найдено: {missing}.'))
+
+    @staticmethod
+    @transaction.atomic
+    def rehash(model, field, name):
+        with default_storage.open(name) as file:
+            hashed_name = default_storage.save(name, file)
+        model._default_manager.filter(**{field: name}).update(
+            **{field: hashed_name})
+        default_storage.delete(name)
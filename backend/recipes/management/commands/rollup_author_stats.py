@@ -0,0 +1,28 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.author_stats import rollup
+from recipes.constants import AUTHOR_STATS_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Сводит накопленные изменения в дневную статистику авторов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=AUTHOR_STATS_BATCH_SIZE,
+                            help='Изменений в одной транзакции.')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Повторять сводку каждые N секунд.')
+
+    def handle(self, *args, **options):
+        while True:
+            rolled = rollup(options['batch_size'])
+            if rolled or not options['interval']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Сведено изменений: {rolled}'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,130 @@
+import io
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from PIL import Image
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.ranking import create_missing_ranks, refresh_ranks
+from recipes.shopping_cart import rebuild_totals
+from users.models import Subscription, User
+
+BATCH_SIZE = 5000
+SEED_PASSWORD = 'seed-password'
+SEED_TAGS = ('breakfast', 'lunch', 'dinner', 'dessert', 'snack')
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу данных синтетическими пользователями и рецептами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в списке покупок пользователя.')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = get_random_string(6).lower()
+        with transaction.atomic():
+            tag_ids = self.ensure_tags()
+            ingredient_ids = self.ensure_ingredients()
+            user_ids = self.create_users(prefix, options['users'])
+            recipe_ids = self.create_recipes(prefix, rng, user_ids,
+                                             options['recipes'])
+            self.link_recipes(rng, recipe_ids, tag_ids, ingredient_ids)
+            self.create_relations(rng, user_ids, recipe_ids, options)
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            rebuild_totals(user_ids[start:start + BATCH_SIZE])
+        create_missing_ranks()
+        refresh_ranks(full=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}. '
+            f'Пароль пользователей: {SEED_PASSWORD}'))
+
+    @staticmethod
+    def bulk_create(model, objects):
+        return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+    def ensure_tags(self):
+        self.bulk_create(Tag, [Tag(name=slug, slug=slug)
+                               for slug in SEED_TAGS
+                               if not Tag.objects.filter(slug=slug).exists()])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            self.bulk_create(Ingredient, [
+                Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+                for number in range(1000)
+            ])
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, prefix, count):
+        password = make_password(SEED_PASSWORD)
+        users = self.bulk_create(User, [
+            User(email=f'{prefix}{number}@example.com',
+                 username=f'{prefix}{number}',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for number in range(count)
+        ])
+        return [user.id for user in users]
+
+    def create_recipes(self, prefix, rng, user_ids, count):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'orange').save(buffer, 'PNG')
+        image = default_storage.save(f'recipes/{prefix}.png',
+                                     ContentFile(buffer.getvalue()))
+        recipes = self.bulk_create(Recipe, [
+            Recipe(author_id=rng.choice(user_ids),
+                   name=f'Рецепт {number}', text='Описание',
+                   cooking_time=rng.randint(5, 180), image=image,
+                   short_url=get_random_string(8))
+            for number in range(count)
+        ])
+        return [recipe.id for recipe in recipes]
+
+    def link_recipes(self, rng, recipe_ids, tag_ids, ingredient_ids):
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, min(rng.randint(1, 2),
+                                                  len(tag_ids)))
+        ])
+        self.bulk_create(IngredientInRecipe, [
+            IngredientInRecipe(recipe_id=recipe_id,
+                               ingredient_id=ingredient_id,
+                               amount=rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, min(rng.randint(3, 12), len(ingredient_ids)))
+        ])
+
+    def create_relations(self, rng, user_ids, recipe_ids, options):
+        for model, per_user in ((Favorite, options['favorites']),
+                                (ShoppingCart, options['carts'])):
+            self.bulk_create(model, [
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rng.sample(
+                    recipe_ids, min(per_user, len(recipe_ids)))
+            ])
+        self.bulk_create(Subscription, [
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(
+                user_ids, min(options['subscriptions'], len(user_ids)))
+            if author_id != user_id
+        ])
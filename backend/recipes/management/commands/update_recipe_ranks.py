@@ -0,0 +1,28 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.ranking import refresh_ranks
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги популярности рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать рейтинги всех рецептов.')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Повторять пересчет каждые N секунд.')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            refreshed = refresh_ranks(full=full)
+            self.stdout.write(
+                self.style.SUCCESS(f'Пересчитано рейтингов: {refreshed}'))
+            if not options['interval']:
+                return
+            full = False
+            time.sleep(options['interval'])
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.14 on 2026-10-19 09:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_recipe_ranks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRank = apps.get_model('recipes', 'RecipeRank')
+    RecipeRank.objects.bulk_create(
+        RecipeRank(recipe_id=recipe_id)
+        for recipe_id in Recipe.objects.values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRank',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rank', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('favorites_count', models.PositiveIntegerField(default=0, verbose_name='Добавлено в избранное')),
+                ('shopping_carts_count', models.PositiveIntegerField(default=0, verbose_name='Добавлено в списки покупок')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность за последние дни')),
+                ('is_dirty', models.BooleanField(default=True, verbose_name='Требует пересчета')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата пересчета')),
+            ],
+            options={
+                'verbose_name': 'рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+                'indexes': [models.Index(fields=['-popular'], name='rank_popular_idx'), models.Index(fields=['-trending'], name='rank_trending_idx'), models.Index(condition=models.Q(('is_dirty', True)), fields=['is_dirty'], name='rank_dirty_idx')],
+            },
+        ),
+        migrations.RunPython(create_recipe_ranks,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-19 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reciperank',
+            name='rank_popular_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reciperank',
+            name='rank_trending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperank',
+            index=models.Index(fields=['-popular', '-recipe'], name='rank_popular_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperank',
+            index=models.Index(fields=['-trending', '-recipe'], name='rank_trending_recipe_idx'),
+        ),
+    ]
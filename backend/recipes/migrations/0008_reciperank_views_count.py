@@ -0,0 +1,22 @@
+# Generated by Django 4.2.14 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_shoppingcarttotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reciperank',
+            name='views_count',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Просмотры'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperank',
+            index=models.Index(fields=['-views_count', '-recipe'], name='rank_views_recipe_idx'),
+        ),
+    ]
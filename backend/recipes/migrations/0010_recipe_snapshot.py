@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-19 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Готовое представление'),
+        ),
+    ]
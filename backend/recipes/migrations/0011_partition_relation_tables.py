@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations
+
+TABLES = ('recipes_favorite', 'recipes_ingredientinrecipe',
+          'recipes_shoppingcart')
+
+
+def partition_empty_tables(apps, schema_editor):
+    """
+    Секционирует пустые таблицы при RELATION_PARTITIONS > 0. Заполненные
+    таблицы переносятся командой partition_relations без остановки записи.
+    """
+    if (schema_editor.connection.vendor != 'postgresql'
+            or not settings.RELATION_PARTITIONS):
+        return
+    from recipes.partitioning import is_partitioned, partition_table
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            if is_partitioned(table):
+                continue
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {table})')
+            if not cursor.fetchone()[0]:
+                partition_table(table, settings.RELATION_PARTITIONS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_empty_tables,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.14 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_relation_created_authordailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('recipes.recipe', 'Рецепт'), ('users.user', 'Пользователь')], max_length=100, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Идентификатор объекта')),
+                ('object_repr', models.CharField(max_length=200, verbose_name='Объект')),
+                ('requested_at', models.DateTimeField(auto_now_add=True, verbose_name='Запрошено')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('total_rows', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Строк к удалению')),
+                ('deleted_rows', models.PositiveBigIntegerField(default=0, verbose_name='Удалено строк')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'удаление',
+                'verbose_name_plural': 'Удаления',
+                'ordering': ('-requested_at',),
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='is_hidden',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Скрыт до удаления'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('is_hidden', True)), fields=['id'], name='recipe_hidden_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletiontask',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True)), fields=['id'], name='deletion_task_pending_idx'),
+        ),
+    ]
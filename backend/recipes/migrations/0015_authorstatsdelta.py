@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-19 11:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0014_media_reference_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStatsDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('favorites', models.IntegerField(default=0, verbose_name='Добавления в избранное')),
+                ('shopping_carts', models.IntegerField(default=0, verbose_name='Добавления в списки покупок')),
+                ('subscribers', models.IntegerField(default=0, verbose_name='Новые подписчики')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_deltas', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'изменение статистики автора',
+                'verbose_name_plural': 'Изменения статистики авторов',
+                'indexes': [models.Index(fields=['author', 'day'], name='stats_delta_author_day_idx')],
+            },
+        ),
+    ]
@@ -1,11 +1,13 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 
-from .constants import (MAX_LENGTH_INGREDIENT, MAX_LENGTH_MEASURE,
-                        MAX_LENGTH_RECIPE, MAX_LENGTH_TAG, MAX_LENGTH_URL,
-                        MIN_COOKING_TIME, TITLE_CUT)
+from .constants import (MAX_LENGTH_INGREDIENT, MAX_LENGTH_LABEL,
+                        MAX_LENGTH_MEASURE, MAX_LENGTH_RECIPE, MAX_LENGTH_REPR,
+                        MAX_LENGTH_TAG, MAX_LENGTH_URL, MIN_COOKING_TIME,
+                        TITLE_CUT)
 
 User = get_user_model()
 
@@ -78,12 +80,24 @@ class Recipe(models.Model):
                                  max_length=MAX_LENGTH_URL,
                                  unique=True,
                                  blank=True)
+    snapshot = models.JSONField('Готовое представление', null=True,
+                                blank=True, editable=False)
+    is_hidden = models.BooleanField('Скрыт до удаления', default=False,
+                                    editable=False)
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_hidden=True),
+                         name='recipe_hidden_idx'),
+            models.Index(fields=['image'], name='recipe_image_idx'),
+        ]
 
     def __str__(self):
         return self.name[:TITLE_CUT]
@@ -129,6 +143,9 @@ class Favorite(models.Model):
                                on_delete=models.CASCADE,
                                related_name='favorites',
                                verbose_name='Рецепты в избранном')
+    created = models.DateTimeField('Дата добавления',
+                                   default=timezone.now, null=True,
+                                   editable=False)
 
     class Meta:
         verbose_name = 'избранное'
@@ -154,6 +171,9 @@ class ShoppingCart(models.Model):
                                on_delete=models.CASCADE,
                                related_name='shopping_carts',
                                verbose_name='Рецепты в списке покупок')
+    created = models.DateTimeField('Дата добавления',
+                                   default=timezone.now, null=True,
+                                   editable=False)
 
     class Meta:
         verbose_name = 'список покупок'
@@ -166,3 +186,196 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'Список покупок {self.user}: {self.recipe}'
+
+
+class RecipeRank(models.Model):
+    """Модель рейтинга популярности рецепта."""
+
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='rank',
+                                  verbose_name='Рецепт')
+    favorites_count = models.PositiveIntegerField('Добавлено в избранное',
+                                                  default=0)
+    shopping_carts_count = models.PositiveIntegerField(
+        'Добавлено в списки покупок', default=0)
+    popular = models.FloatField('Популярность', default=0)
+    trending = models.FloatField('Популярность за последние дни',
+                                 default=0)
+    views_count = models.PositiveBigIntegerField('Просмотры', default=0)
+    is_dirty = models.BooleanField('Требует пересчета', default=True)
+    updated_at = models.DateTimeField('Дата пересчета', auto_now=True)
+
+    class Meta:
+        verbose_name = 'рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(fields=['-popular', '-recipe'],
+                         name='rank_popular_recipe_idx'),
+            models.Index(fields=['-trending', '-recipe'],
+                         name='rank_trending_recipe_idx'),
+            models.Index(fields=['-views_count', '-recipe'],
+                         name='rank_views_recipe_idx'),
+            models.Index(fields=['is_dirty'],
+                         condition=models.Q(is_dirty=True),
+                         name='rank_dirty_idx'),
+        ]
+
+    def __str__(self):
+        return f'Рейтинг {self.recipe_id}: {self.popular:.2f}'
+
+
+class RecipeSignature(models.Model):
+    """Модель MinHash-сигнатуры набора ингредиентов рецепта."""
+
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='signature',
+                                  verbose_name='Рецепт')
+    signature = models.BinaryField('Сигнатура')
+
+    class Meta:
+        verbose_name = 'сигнатура рецепта'
+        verbose_name_plural = 'Сигнатуры рецептов'
+
+    def __str__(self):
+        return f'Сигнатура {self.recipe_id}'
+
+
+class RecipeBucket(models.Model):
+    """Модель LSH-корзины рецепта."""
+
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='buckets',
+                               verbose_name='Рецепт')
+    band = models.PositiveSmallIntegerField('Полоса')
+    bucket = models.BigIntegerField('Корзина')
+
+    class Meta:
+        verbose_name = 'LSH-корзина рецепта'
+        verbose_name_plural = 'LSH-корзины рецептов'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'band'],
+                                    name='unique_recipe_band')
+        ]
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='bucket_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.band}/{self.bucket}'
+
+
+class ShoppingCartTotal(models.Model):
+    """Модель суммарного количества ингредиента в списке покупок."""
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='shopping_cart_totals',
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient,
+                                   on_delete=models.CASCADE,
+                                   related_name='shopping_cart_totals',
+                                   verbose_name='Ингредиент')
+    total_amount = models.PositiveIntegerField('Количество', default=0)
+
+    class Meta:
+        verbose_name = 'итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_cart_total')
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.total_amount} {self.ingredient}'
+
+
+class AuthorDailyStats(models.Model):
+    """Модель дневной статистики автора."""
+
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='daily_stats',
+                               verbose_name='Автор')
+    day = models.DateField('День')
+    favorites = models.PositiveIntegerField('Добавления в избранное',
+                                            default=0)
+    shopping_carts = models.PositiveIntegerField(
+        'Добавления в списки покупок', default=0)
+    subscribers = models.PositiveIntegerField('Новые подписчики', default=0)
+
+    class Meta:
+        verbose_name = 'дневная статистика автора'
+        verbose_name_plural = 'Дневная статистика авторов'
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'day'],
+                                    name='unique_author_daily_stats')
+        ]
+
+    def __str__(self):
+        return f'{self.author} за {self.day}'
+
+
+class AuthorStatsDelta(models.Model):
+    """Модель изменения дневной статистики автора, еще не сведенного."""
+
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='stats_deltas',
+                               verbose_name='Автор')
+    day = models.DateField('День')
+    favorites = models.IntegerField('Добавления в избранное', default=0)
+    shopping_carts = models.IntegerField('Добавления в списки покупок',
+                                         default=0)
+    subscribers = models.IntegerField('Новые подписчики', default=0)
+
+    class Meta:
+        verbose_name = 'изменение статистики автора'
+        verbose_name_plural = 'Изменения статистики авторов'
+        indexes = [
+            models.Index(fields=['author', 'day'],
+                         name='stats_delta_author_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.author} за {self.day}'
+
+
+class DeletionTask(models.Model):
+    """Модель отложенного удаления скрытого объекта."""
+
+    RECIPE = 'recipes.recipe'
+    USER = 'users.user'
+    MODEL_CHOICES = (
+        (RECIPE, 'Рецепт'),
+        (USER, 'Пользователь'),
+    )
+
+    model = models.CharField('Тип объекта', max_length=MAX_LENGTH_LABEL,
+                             choices=MODEL_CHOICES)
+    object_id = models.PositiveBigIntegerField('Идентификатор объекта')
+    object_repr = models.CharField('Объект', max_length=MAX_LENGTH_REPR)
+    requested_at = models.DateTimeField('Запрошено', auto_now_add=True)
+    finished_at = models.DateTimeField('Завершено', null=True, blank=True)
+    total_rows = models.PositiveBigIntegerField('Строк к удалению',
+                                                null=True, blank=True)
+    deleted_rows = models.PositiveBigIntegerField('Удалено строк',
+                                                  default=0)
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'удаление'
+        verbose_name_plural = 'Удаления'
+        ordering = ('-requested_at',)
+        indexes = [
+            models.Index(fields=['id'],
+                         condition=models.Q(finished_at__isnull=True),
+                         name='deletion_task_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'Удаление {self.object_repr}'
@@ -0,0 +1,190 @@
+"""
+Инвертированный индекс ингредиентов для поиска «что приготовить».
+
+Индекс хранится в памяти процесса: для каждого ингредиента и тега —
+сжатая битовая карта идентификаторов рецептов, для каждого рецепта —
+число ингредиентов и время приготовления. Изменения рецептов применяются
+к индексу после фиксации транзакции. Изменения из других процессов
+приходят через шину инвалидации, а раз в PANTRY_INDEX_TTL секунд индекс
+на всякий случай строится заново в фоновом потоке; до замены запросы ищут
+по прежнему индексу.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import close_old_connections, transaction
+from pyroaring import BitMap
+
+from .constants import PANTRY_INDEX_TTL
+from .models import IngredientInRecipe, Recipe
+
+logger = logging.getLogger(__name__)
+
+
+class PantryIndex:
+
+    def __init__(self, ttl=PANTRY_INDEX_TTL):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.built_at = None
+        self.ingredients = {}
+        self.tags = {}
+        self.sizes = {}
+        self.cooking_times = {}
+        self.changed = None
+        self.refresh_pid = None
+
+    def build(self):
+        with self.lock:
+            self.changed = set()
+        ingredients = defaultdict(BitMap)
+        tags = defaultdict(BitMap)
+        sizes = Counter()
+        links = IngredientInRecipe.objects.filter(
+            recipe__is_hidden=False).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in links.iterator():
+            ingredients[ingredient_id].add(recipe_id)
+            sizes[recipe_id] += 1
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe__is_hidden=False).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in recipe_tags.iterator():
+            tags[tag_id].add(recipe_id)
+        cooking_times = dict(
+            Recipe.objects.filter(is_hidden=False).values_list(
+                'id', 'cooking_time').iterator())
+        with self.lock:
+            self.ingredients = dict(ingredients)
+            self.tags = dict(tags)
+            self.sizes = dict(sizes)
+            self.cooking_times = cooking_times
+            self.built_at = time.monotonic()
+            changed, self.changed = self.changed, None
+        # Изменения, пришедшие во время чтения, могли не попасть в индекс.
+        if changed:
+            self.reload_recipes(changed)
+
+    def ensure_fresh(self):
+        if self.built_at is None:
+            self.build()
+        elif time.monotonic() - self.built_at > self.ttl:
+            with self.lock:
+                if self.refresh_pid == os.getpid():
+                    return
+                self.refresh_pid = os.getpid()
+            threading.Thread(target=self.refresh, name='pantry-index',
+                             daemon=True).start()
+
+    def refresh(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс ингредиентов')
+        finally:
+            self.refresh_pid = None
+            close_old_connections()
+
+    def remove_recipe(self, recipe_id):
+        with self.lock:
+            if self.changed is not None:
+                self.changed.add(recipe_id)
+            for bitmaps in (self.ingredients, self.tags):
+                for bitmap in bitmaps.values():
+                    bitmap.discard(recipe_id)
+            self.sizes.pop(recipe_id, None)
+            self.cooking_times.pop(recipe_id, None)
+
+    def update_recipe(self, recipe_id, ingredient_ids, tag_ids,
+                      cooking_time):
+        with self.lock:
+            self.remove_recipe(recipe_id)
+            for ingredient_id in ingredient_ids:
+                self.ingredients.setdefault(ingredient_id,
+                                            BitMap()).add(recipe_id)
+            for tag_id in tag_ids:
+                self.tags.setdefault(tag_id, BitMap()).add(recipe_id)
+            self.sizes[recipe_id] = len(ingredient_ids)
+            self.cooking_times[recipe_id] = cooking_time
+
+    def invalidate(self):
+        """Индекс устарел: следующий поиск перестроит его в фоне."""
+        if self.built_at is not None:
+            self.built_at = float('-inf')
+
+    def reload_recipes(self, recipe_ids):
+        """Перечитывает из базы данных рецепты, изменённые в другом месте."""
+        if self.built_at is None:
+            return
+        if recipe_ids is None:
+            self.invalidate()
+            return
+        ingredients = defaultdict(list)
+        tags = defaultdict(list)
+        links = IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in links:
+            ingredients[recipe_id].append(ingredient_id)
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in recipe_tags:
+            tags[recipe_id].append(tag_id)
+        cooking_times = dict(Recipe.objects.filter(
+            id__in=recipe_ids, is_hidden=False
+        ).values_list('id', 'cooking_time'))
+        with self.lock:
+            for recipe_id in recipe_ids:
+                if recipe_id in cooking_times:
+                    self.update_recipe(recipe_id, ingredients[recipe_id],
+                                       tags[recipe_id],
+                                       cooking_times[recipe_id])
+                else:
+                    self.remove_recipe(recipe_id)
+
+    def search(self, ingredient_ids, tag_ids=None, max_cooking_time=None):
+        """
+        Возвращает список (рецепт, найдено, всего) по убыванию доли
+        имеющихся ингредиентов и возрастанию числа недостающих.
+        """
+        self.ensure_fresh()
+        with self.lock:
+            bitmaps = [self.ingredients[ingredient_id]
+                       for ingredient_id in set(ingredient_ids)
+                       if ingredient_id in self.ingredients]
+            if not bitmaps:
+                return []
+            candidates = BitMap.union(*bitmaps)
+            if tag_ids is not None:
+                candidates &= BitMap.union(
+                    BitMap(), *(self.tags.get(tag_id, BitMap())
+                                for tag_id in tag_ids))
+            matched = Counter()
+            for bitmap in bitmaps:
+                matched.update(bitmap & candidates)
+            results = []
+            for recipe_id, count in matched.items():
+                size = self.sizes.get(recipe_id)
+                cooking_time = self.cooking_times.get(recipe_id)
+                if size is None or cooking_time is None:
+                    continue
+                if (max_cooking_time is None
+                        or cooking_time <= max_cooking_time):
+                    results.append((recipe_id, count, size))
+        results.sort(key=lambda result: (-result[1] / result[2],
+                                         result[2] - result[1],
+                                         -result[0]))
+        return results
+
+
+pantry_index = PantryIndex()
+
+
+def sync_recipe(recipe, ingredient_ids, tag_ids):
+    transaction.on_commit(lambda: pantry_index.update_recipe(
+        recipe.id, list(ingredient_ids), list(tag_ids),
+        recipe.cooking_time))
+
+
+def forget_recipe(recipe_id):
+    transaction.on_commit(lambda: pantry_index.remove_recipe(recipe_id))
@@ -0,0 +1,223 @@
+"""
+Хеш-секционирование таблиц связей в PostgreSQL.
+
+Избранное и списки покупок секционируются по user_id, ингредиенты
+рецептов — по recipe_id: запросы API к этим таблицам содержат ключ
+секционирования, и планировщик читает только нужные секции.
+
+Таблица переводится без остановки записи. Рядом создается секционированная
+копия с теми же ограничениями и индексами, триггер на исходной таблице
+повторяет в ней каждое изменение, а существующие строки переносятся
+пакетами по диапазонам id. В конце под эксклюзивной блокировкой исходная
+таблица удаляется, а копия получает ее имя, имена ограничений и индексов
+и текущее значение последовательности id. Прерванный перенос можно
+запустить заново: он продолжится с уже созданной копией.
+
+PostgreSQL требует, чтобы первичный ключ и уникальные ограничения
+секционированной таблицы включали ключ секционирования, поэтому первичный
+ключ становится (id, ключ). id по-прежнему выдается одной
+последовательностью и остается уникальным.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .constants import PARTITION_BATCH_SIZE
+
+PARTITION_KEYS = {
+    'recipes_favorite': 'user_id',
+    'recipes_ingredientinrecipe': 'recipe_id',
+    'recipes_shoppingcart': 'user_id',
+}
+COPY_SUFFIX = '__partitioned'
+INDEX_DEFINITION = re.compile(
+    r'^CREATE (?P<unique>UNIQUE )?INDEX \S+ ON (ONLY )?\S+ (?P<rest>.*)$')
+
+
+class PartitioningError(Exception):
+    """Таблицу нельзя секционировать без ручного вмешательства."""
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def copy_name(name):
+    return name[:63 - len(COPY_SUFFIX)] + COPY_SUFFIX
+
+
+def fetch_value(cursor, sql, params=()):
+    cursor.execute(sql, params)
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        return fetch_value(
+            cursor, 'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+            [table]) == 'p'
+
+
+def constraints(cursor, table):
+    """Первичный ключ, уникальные и внешние ключи: имя → (тип, SQL)."""
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) "
+        "FROM pg_constraint WHERE conrelid = %s::regclass "
+        "AND contype IN ('p', 'u', 'f')", [table])
+    return {name: (kind, definition)
+            for name, kind, definition in cursor.fetchall()}
+
+
+def indexes(cursor, table):
+    """Индексы, не созданные ограничениями: имя → SQL."""
+    cursor.execute(
+        'SELECT index_class.relname, pg_get_indexdef(index_class.oid) '
+        'FROM pg_index JOIN pg_class AS index_class '
+        'ON index_class.oid = pg_index.indexrelid '
+        'WHERE pg_index.indrelid = %s::regclass AND NOT EXISTS ('
+        '    SELECT 1 FROM pg_constraint '
+        '    WHERE conindid = pg_index.indexrelid '
+        '    AND conrelid = pg_index.indrelid)', [table])
+    return dict(cursor.fetchall())
+
+
+def columns(definition):
+    return {column.strip().strip('"') for column in
+            definition[definition.index('(') + 1:
+                       definition.index(')')].split(',')}
+
+
+def check_table(cursor, table, key):
+    referencing = fetch_value(
+        cursor, 'SELECT string_agg(conrelid::regclass::text, %s) '
+        'FROM pg_constraint WHERE confrelid = %s::regclass',
+        [', ', table])
+    if referencing:
+        raise PartitioningError(
+            f'На таблицу {table} ссылаются внешние ключи: {referencing}.')
+    for name, (kind, definition) in constraints(cursor, table).items():
+        if kind == 'u' and key not in columns(definition):
+            raise PartitioningError(
+                f'Ограничение {name} не включает ключ {key}.')
+    for name, definition in indexes(cursor, table).items():
+        match = INDEX_DEFINITION.match(definition)
+        if match is None:
+            raise PartitioningError(f'Не удалось разобрать индекс {name}.')
+        if match['unique'] and key not in columns(match['rest']):
+            raise PartitioningError(
+                f'Уникальный индекс {name} не включает ключ {key}.')
+
+
+def create_copy(table, key, partitions):
+    """Создает секционированную копию таблицы и триггер синхронизации."""
+    copy = copy_name(table)
+    sequence = copy_name(f'{table}_id_seq')
+    with transaction.atomic(), connection.cursor() as cursor:
+        if fetch_value(cursor, 'SELECT to_regclass(%s)', [copy]):
+            return
+        check_table(cursor, table, key)
+        cursor.execute(
+            f'CREATE TABLE {quote(copy)} (LIKE {quote(table)} '
+            f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+            f'PARTITION BY HASH ({quote(key)})')
+        for remainder in range(partitions):
+            cursor.execute(
+                f'CREATE TABLE {quote(f"{table}_p{remainder}")} '
+                f'PARTITION OF {quote(copy)} FOR VALUES WITH '
+                f'(MODULUS {partitions}, REMAINDER {remainder})')
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} '
+                       f'OWNED BY {quote(copy)}.id')
+        cursor.execute(f'ALTER TABLE {quote(copy)} ALTER COLUMN id '
+                       f'SET DEFAULT nextval(%s::regclass)', [sequence])
+        for name, (kind, definition) in constraints(cursor, table).items():
+            if kind == 'p':
+                definition = f'PRIMARY KEY (id, {quote(key)})'
+            cursor.execute(f'ALTER TABLE {quote(copy)} ADD CONSTRAINT '
+                           f'{quote(copy_name(name))} {definition}')
+        for name, definition in indexes(cursor, table).items():
+            match = INDEX_DEFINITION.match(definition)
+            cursor.execute(
+                f'CREATE {match["unique"] or ""}INDEX {quote(copy_name(name))}'
+                f' ON {quote(copy)} {match["rest"]}')
+        cursor.execute(
+            f'CREATE FUNCTION {quote(copy)}() RETURNS trigger '
+            f'LANGUAGE plpgsql AS $$ BEGIN '
+            f"IF TG_OP IN ('DELETE', 'UPDATE') THEN "
+            f'DELETE FROM {quote(copy)} '
+            f'WHERE id = OLD.id AND {quote(key)} = OLD.{quote(key)}; '
+            f'END IF; '
+            f"IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f'INSERT INTO {quote(copy)} SELECT (NEW).* '
+            f'ON CONFLICT DO NOTHING; '
+            f'END IF; '
+            f'RETURN NULL; END $$')
+        cursor.execute(
+            f'CREATE TRIGGER {quote(copy)} AFTER INSERT OR UPDATE OR DELETE '
+            f'ON {quote(table)} FOR EACH ROW EXECUTE FUNCTION {quote(copy)}()')
+
+
+def copy_rows(table, batch_size=PARTITION_BATCH_SIZE):
+    """
+    Переносит строки, записанные до создания триггера, пакетами по id.
+
+    Строки пакета блокируются FOR SHARE: удаление, начатое во время
+    переноса, дождется его окончания и удалит строку и из копии.
+    Возвращает итератор по числу перенесенных строк в каждом пакете.
+    """
+    copy = copy_name(table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(id), max(id) FROM {quote(table)}')
+        first, last = cursor.fetchone()
+    if first is None:
+        return
+    for start in range(first, last + 1, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH batch AS (SELECT * FROM {quote(table)} '
+                f'WHERE id >= %s AND id < %s FOR SHARE) '
+                f'INSERT INTO {quote(copy)} SELECT * FROM batch '
+                f'ON CONFLICT DO NOTHING',
+                [start, min(start + batch_size, last + 1)])
+            copied = cursor.rowcount
+        yield copied
+
+
+def swap(table, lock_timeout='5s'):
+    """Заменяет таблицу ее секционированной копией."""
+    copy = copy_name(table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT set_config(%s, %s, true)',
+                       ['lock_timeout', lock_timeout])
+        cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+        renames = constraints(cursor, table)
+        index_names = indexes(cursor, table)
+        old_sequence = fetch_value(
+            cursor, 'SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+        sequence_name = f'{table}_id_seq'
+        if old_sequence:
+            cursor.execute(f'SELECT last_value, is_called FROM {old_sequence}')
+            cursor.execute('SELECT setval(%s::regclass, %s, %s)',
+                           [copy_name(sequence_name), *cursor.fetchone()])
+            sequence_name = fetch_value(
+                cursor, 'SELECT relname FROM pg_class '
+                'WHERE oid = %s::regclass', [old_sequence])
+        cursor.execute(f'DROP TABLE {quote(table)}')
+        cursor.execute(f'DROP FUNCTION {quote(copy)}()')
+        cursor.execute(f'ALTER TABLE {quote(copy)} RENAME TO {quote(table)}')
+        cursor.execute(f'ALTER SEQUENCE {quote(copy_name(f"{table}_id_seq"))}'
+                       f' RENAME TO {quote(sequence_name)}')
+        for name in renames:
+            cursor.execute(f'ALTER TABLE {quote(table)} RENAME CONSTRAINT '
+                           f'{quote(copy_name(name))} TO {quote(name)}')
+        for name in index_names:
+            cursor.execute(f'ALTER INDEX {quote(copy_name(name))} '
+                           f'RENAME TO {quote(name)}')
+
+
+def partition_table(table, partitions, batch_size=PARTITION_BATCH_SIZE,
+                    lock_timeout='5s'):
+    create_copy(table, PARTITION_KEYS[table], partitions)
+    copied = sum(copy_rows(table, batch_size))
+    swap(table, lock_timeout)
+    return copied
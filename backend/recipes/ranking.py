@@ -0,0 +1,114 @@
+"""
+Рейтинг популярности рецептов с экспоненциальным затуханием.
+
+Оценка хранится в логарифмической форме относительно общей точки отсчета:
+score = ln(sum(w * exp(rate * (t - RANK_EPOCH)))). Порядок по такой оценке
+совпадает с порядком по затухшей к текущему моменту сумме, поэтому при
+течении времени строки не нужно пересчитывать — только рецепты, у которых
+изменилось число добавлений в избранное и списки покупок.
+"""
+import math
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .constants import (RANK_BATCH_SIZE, RANK_FAVORITE_WEIGHT,
+                        RANK_POPULAR_HALF_LIFE_DAYS, RANK_SHOPPING_CART_WEIGHT,
+                        RANK_TRENDING_HALF_LIFE_DAYS)
+from .models import Favorite, Recipe, RecipeRank, ShoppingCart
+
+RANK_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+SECONDS_IN_DAY = 24 * 60 * 60
+
+
+def decay_rate(half_life_days):
+    return math.log(2) / (half_life_days * SECONDS_IN_DAY)
+
+
+def log_add(first, second):
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def decayed_score(score, old_weight, new_weight, rate, now):
+    """Возвращает новую оценку после изменения суммарного веса рецепта."""
+    if new_weight <= 0:
+        return 0.0
+    if old_weight <= 0:
+        return (math.log(new_weight)
+                + rate * (now - RANK_EPOCH).total_seconds())
+    if new_weight > old_weight:
+        return log_add(score,
+                       math.log(new_weight - old_weight)
+                       + rate * (now - RANK_EPOCH).total_seconds())
+    # Удаленные добавления считаются равномерно распределенными по времени,
+    # поэтому оценка уменьшается пропорционально их доле.
+    return score + math.log(new_weight / old_weight)
+
+
+def weight(favorites_count, shopping_carts_count):
+    return (favorites_count * RANK_FAVORITE_WEIGHT
+            + shopping_carts_count * RANK_SHOPPING_CART_WEIGHT)
+
+
+def mark_dirty(recipe_id):
+    RecipeRank.objects.filter(recipe_id=recipe_id).update(is_dirty=True)
+
+
+def create_missing_ranks():
+    missing = Recipe.objects.filter(rank__isnull=True).values_list(
+        'id', flat=True)
+    created = RecipeRank.objects.bulk_create(
+        [RecipeRank(recipe_id=recipe_id) for recipe_id in missing],
+        ignore_conflicts=True)
+    return len(created)
+
+
+def _count_by_recipe(model, recipe_ids):
+    return dict(model.objects.filter(recipe_id__in=recipe_ids)
+                .values('recipe_id').annotate(total=Count('id'))
+                .values_list('recipe_id', 'total'))
+
+
+@transaction.atomic
+def refresh_batch(recipe_ids, now):
+    ranks = list(RecipeRank.objects.select_for_update()
+                 .filter(recipe_id__in=recipe_ids))
+    favorites = _count_by_recipe(Favorite, recipe_ids)
+    shopping_carts = _count_by_recipe(ShoppingCart, recipe_ids)
+    popular_rate = decay_rate(RANK_POPULAR_HALF_LIFE_DAYS)
+    trending_rate = decay_rate(RANK_TRENDING_HALF_LIFE_DAYS)
+    for rank in ranks:
+        old_weight = weight(rank.favorites_count, rank.shopping_carts_count)
+        rank.favorites_count = favorites.get(rank.recipe_id, 0)
+        rank.shopping_carts_count = shopping_carts.get(rank.recipe_id, 0)
+        new_weight = weight(rank.favorites_count, rank.shopping_carts_count)
+        rank.popular = decayed_score(rank.popular, old_weight, new_weight,
+                                     popular_rate, now)
+        rank.trending = decayed_score(rank.trending, old_weight, new_weight,
+                                      trending_rate, now)
+        rank.is_dirty = False
+        rank.updated_at = now
+    RecipeRank.objects.bulk_update(
+        ranks, ['favorites_count', 'shopping_carts_count', 'popular',
+                'trending', 'is_dirty', 'updated_at'])
+    return len(ranks)
+
+
+def refresh_ranks(full=False, batch_size=RANK_BATCH_SIZE):
+    """Пересчитывает рейтинги рецептов, помеченных как измененные."""
+    if full:
+        create_missing_ranks()
+        RecipeRank.objects.update(is_dirty=True)
+    now = timezone.now()
+    refreshed = 0
+    while True:
+        recipe_ids = list(RecipeRank.objects.filter(is_dirty=True)
+                          .order_by('recipe_id')
+                          .values_list('recipe_id', flat=True)[:batch_size])
+        if not recipe_ids:
+            return refreshed
+        refreshed += refresh_batch(recipe_ids, now)
@@ -0,0 +1,138 @@
+"""
+Поддержка итогов списков покупок в актуальном состоянии.
+
+Итоги хранятся в ShoppingCartTotal и меняются на разницу количеств при
+добавлении рецепта в список покупок, удалении из него и изменении
+ингредиентов рецепта, который уже лежит в чьих-то списках.
+
+Строка рецепта блокируется до чтения его количеств (lock_recipe), так что
+добавление в список и одновременная правка ингредиентов не расходятся.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+
+from .constants import SHOPPING_CART_TOTALS_BATCH_SIZE
+from .models import IngredientInRecipe, Recipe, ShoppingCart, ShoppingCartTotal
+
+
+def lock_recipe(recipe_id):
+    """
+    Блокирует рецепт до конца транзакции. NO KEY UPDATE не мешает вставке
+    строк, ссылающихся на рецепт, но выстраивает в очередь чтение его
+    количеств для итогов.
+    """
+    list(Recipe.objects.select_for_update(no_key=True)
+         .filter(pk=recipe_id).values_list('pk'))
+
+
+def recipe_amounts(recipe_id):
+    return dict(IngredientInRecipe.objects.filter(recipe_id=recipe_id)
+                .values_list('ingredient_id', 'amount'))
+
+
+@transaction.atomic
+def apply_deltas(user_ids, deltas):
+    """Прибавляет к итогам пользователей изменения количеств."""
+    deltas = {ingredient_id: delta for ingredient_id, delta in deltas.items()
+              if delta}
+    if not user_ids or not deltas:
+        return
+    ShoppingCartTotal.objects.bulk_create(
+        [ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True)
+    for ingredient_id, delta in deltas.items():
+        ShoppingCartTotal.objects.filter(
+            user_id__in=user_ids, ingredient_id=ingredient_id
+        ).update(total_amount=Greatest(F('total_amount') + delta, Value(0)))
+    ShoppingCartTotal.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas, total_amount=0
+    ).delete()
+
+
+@transaction.atomic
+def add_recipe(user_id, recipe_id):
+    lock_recipe(recipe_id)
+    apply_deltas([user_id], recipe_amounts(recipe_id))
+
+
+@transaction.atomic
+def remove_recipe(user_id, recipe_id):
+    lock_recipe(recipe_id)
+    apply_deltas([user_id], {ingredient_id: -amount for ingredient_id, amount
+                             in recipe_amounts(recipe_id).items()})
+
+
+def carted_user_ids(recipe_id):
+    return (ShoppingCart.objects.filter(recipe_id=recipe_id)
+            .order_by('user_id').values_list('user_id', flat=True))
+
+
+def apply_to_carts(recipe_id, deltas):
+    user_ids = []
+    for user_id in carted_user_ids(recipe_id).iterator():
+        user_ids.append(user_id)
+        if len(user_ids) == SHOPPING_CART_TOTALS_BATCH_SIZE:
+            apply_deltas(user_ids, deltas)
+            user_ids = []
+    apply_deltas(user_ids, deltas)
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """
+    Пересчитывает итоги всех, у кого рецепт в списке покупок. Вызывающий
+    блокирует рецепт через lock_recipe до чтения old_amounts.
+    """
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    apply_to_carts(recipe_id, deltas)
+
+
+def remove_recipe_from_carts(recipe_id):
+    apply_to_carts(recipe_id, {ingredient_id: -amount for ingredient_id, amount
+                               in recipe_amounts(recipe_id).items()})
+
+
+def hidden_amounts(user_id):
+    """
+    Доли скрытых рецептов в итогах пользователя. Из итогов их вычитает
+    purge_deleted, а до тех пор они не должны попадать в список покупок.
+    """
+    return dict(IngredientInRecipe.objects.filter(
+        recipe__shopping_carts__user_id=user_id, recipe__is_hidden=True
+    ).values_list('ingredient_id').annotate(total=Sum('amount')).order_by())
+
+
+def expected_totals(user_ids):
+    """Считает итоги заново по спискам покупок пользователей."""
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in IngredientInRecipe.objects.filter(
+            recipe__shopping_carts__user_id__in=user_ids
+        ).values_list(
+            'recipe__shopping_carts__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+    }
+
+
+def stored_totals(user_ids):
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in ShoppingCartTotal.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'ingredient_id', 'total_amount')
+    }
+
+
+@transaction.atomic
+def rebuild_totals(user_ids):
+    ShoppingCartTotal.objects.filter(user_id__in=user_ids).delete()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                          total_amount=total)
+        for (user_id, ingredient_id), total
+        in expected_totals(user_ids).items())
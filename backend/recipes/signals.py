@@ -0,0 +1,159 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import FileField
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from foodgram_backend.compression import response_cache
+from foodgram_backend.counts import count_cache
+from foodgram_backend.invalidation import bus
+
+from . import author_stats
+from .caches import tag_map
+from .models import Favorite, Ingredient, Recipe, RecipeRank, ShoppingCart, Tag
+from .pantry import forget_recipe, pantry_index
+from .ranking import mark_dirty
+from users.models import Subscription, User
+
+CACHED_RESPONSE_MODELS = (Ingredient, Recipe, Tag, User)
+COUNTED_MODELS = (Favorite, Recipe, ShoppingCart, Subscription, User)
+
+bus.register(Tag._meta.label_lower, lambda pks: tag_map.invalidate())
+bus.register(Recipe._meta.label_lower, pantry_index.reload_recipes)
+for model in COUNTED_MODELS:
+    bus.register(model._meta.label_lower,
+                 lambda pks, model=model: count_cache.invalidate_model(model))
+for model in CACHED_RESPONSE_MODELS:
+    bus.register(
+        model._meta.label_lower,
+        lambda pks, model=model: response_cache.invalidate_model(model))
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_rank(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        RecipeRank.objects.get_or_create(recipe=instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def mark_recipe_rank_dirty(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_dirty(instance.recipe_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def count_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        author_stats.record(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def uncount_author_stats(sender, instance, **kwargs):
+    author_stats.record(instance, -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_pantry(sender, instance, **kwargs):
+    forget_recipe(instance.id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_map(sender, **kwargs):
+    tag_map.invalidate()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=User)
+def invalidate_counts(sender, **kwargs):
+    count_cache.invalidate_model(sender)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=User)
+def invalidate_cached_responses(sender, **kwargs):
+    # Повторно после фиксации: ответ, собранный параллельным запросом
+    # по старым данным, мог попасть в кэш уже после первого сброса.
+    response_cache.invalidate_model(sender)
+    transaction.on_commit(lambda: response_cache.invalidate_model(sender))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tag_counts(sender, action, **kwargs):
+    if action.startswith('post_'):
+        count_cache.invalidate_model(sender)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def publish_invalidation(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bus.publish_on_commit(sender._meta.label_lower, instance.pk)
+
+
+def stored_file_fields(model, update_fields=None):
+    return [field.name for field in model._meta.concrete_fields
+            if isinstance(field, FileField)
+            and (update_fields is None or field.name in update_fields)]
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_replaced_files(sender, instance, raw=False, update_fields=None,
+                            **kwargs):
+    fields = stored_file_fields(sender, update_fields)
+    instance._replaced_files = []
+    if raw or instance._state.adding or not fields:
+        return
+    old = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+    instance._replaced_files = [
+        old[field] for field in fields
+        if old.get(field) and old[field] != getattr(instance, field).name]
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def release_replaced_files(sender, instance, **kwargs):
+    for name in getattr(instance, '_replaced_files', ()):
+        default_storage.delete(name)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_deleted_files(sender, instance, **kwargs):
+    for field in stored_file_fields(sender):
+        file = getattr(instance, field)
+        file.storage.delete(file.name)
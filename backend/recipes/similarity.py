@@ -0,0 +1,168 @@
+"""
+Поиск похожих рецептов по набору ингредиентов.
+
+Для каждого рецепта считается MinHash-сигнатура, которая разбивается на
+полосы (LSH). Кандидатами считаются рецепты, совпавшие с исходным хотя бы
+в одной полосе, а сходство по Жаккару оценивается по доле совпавших
+значений сигнатуры.
+"""
+import hashlib
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Q
+import numpy as np
+
+from .constants import (SIMILARITY_BANDS, SIMILARITY_MAX_CANDIDATES,
+                        SIMILARITY_PERMUTATIONS, SIMILARITY_SEED)
+from .models import IngredientInRecipe, RecipeBucket, RecipeSignature
+
+MERSENNE_PRIME = (1 << 31) - 1
+SIGNATURE_DTYPE = np.uint32
+
+
+class MinHasher:
+    """Вычисляет MinHash-сигнатуры наборов целочисленных идентификаторов."""
+
+    def __init__(self, num_perm=SIMILARITY_PERMUTATIONS,
+                 seed=SIMILARITY_SEED):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, ids):
+        ids = np.fromiter(ids, dtype=np.uint64)
+        if not ids.size:
+            return np.full(self.a.size, MERSENNE_PRIME, dtype=SIGNATURE_DTYPE)
+        hashes = (np.outer(self.a, ids) + self.b[:, None]) % MERSENNE_PRIME
+        return hashes.min(axis=1).astype(SIGNATURE_DTYPE)
+
+
+def band_buckets(signature, bands=SIMILARITY_BANDS):
+    """Возвращает пары (полоса, корзина) для сигнатуры."""
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(row.tobytes(), digest_size=8).digest(),
+            'big', signed=True))
+        for band, row in enumerate(signature.reshape(bands, -1))
+    ]
+
+
+def to_bytes(signature):
+    return signature.astype(SIGNATURE_DTYPE).tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(bytes(data), dtype=SIGNATURE_DTYPE)
+
+
+def estimate_similarity(signature, signatures):
+    """Оценивает сходство по Жаккару с каждой строкой матрицы сигнатур."""
+    return (signatures == signature).mean(axis=1)
+
+
+class LSHIndex:
+    """LSH-индекс в памяти, используется для замеров производительности."""
+
+    def __init__(self, bands=SIMILARITY_BANDS):
+        self.bands = bands
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for band_bucket in band_buckets(signature, self.bands):
+            self.buckets[band_bucket].add(key)
+
+    def candidates(self, signature):
+        candidates = set()
+        for band_bucket in band_buckets(signature, self.bands):
+            candidates |= self.buckets.get(band_bucket, set())
+        return candidates
+
+    def query(self, signature, limit):
+        candidates = self.candidates(signature)
+        return rank_candidates(
+            signature, list(candidates),
+            [self.signatures[key] for key in candidates], limit)
+
+
+def rank_candidates(signature, keys, signatures, limit):
+    if not keys:
+        return []
+    similarity = estimate_similarity(signature, np.vstack(signatures))
+    order = np.argsort(-similarity, kind='stable')[:limit]
+    return [(keys[i], float(similarity[i])) for i in order
+            if similarity[i] > 0]
+
+
+hasher = MinHasher()
+
+
+def index_recipe(recipe_id, ingredient_ids):
+    """Обновляет сигнатуру и LSH-корзины рецепта."""
+    signature = hasher.signature(ingredient_ids)
+    with transaction.atomic():
+        RecipeSignature.objects.update_or_create(
+            recipe_id=recipe_id, defaults={'signature': to_bytes(signature)})
+        RecipeBucket.objects.filter(recipe_id=recipe_id).delete()
+        RecipeBucket.objects.bulk_create(
+            RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+            for band, bucket in band_buckets(signature))
+    return signature
+
+
+@transaction.atomic
+def index_recipes(recipe_ids):
+    """Переиндексирует пакет рецептов, возвращает их число."""
+    links = (IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+             .order_by('recipe_id')
+             .values_list('recipe_id', 'ingredient_id'))
+    ingredients = {
+        recipe_id: [ingredient_id for _, ingredient_id in group]
+        for recipe_id, group in groupby(links, key=lambda link: link[0])
+    }
+    RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+    signatures = []
+    buckets = []
+    for recipe_id in recipe_ids:
+        signature = hasher.signature(ingredients.get(recipe_id, []))
+        signatures.append(RecipeSignature(
+            recipe_id=recipe_id, signature=to_bytes(signature)))
+        buckets.extend(
+            RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+            for band, bucket in band_buckets(signature))
+    RecipeSignature.objects.bulk_create(signatures)
+    RecipeBucket.objects.bulk_create(buckets)
+    return len(signatures)
+
+
+def get_signature(recipe_id):
+    stored = (RecipeSignature.objects.filter(recipe_id=recipe_id)
+              .values_list('signature', flat=True).first())
+    if stored is not None:
+        return from_bytes(stored)
+    return index_recipe(
+        recipe_id,
+        IngredientInRecipe.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', flat=True))
+
+
+def similar_recipe_ids(recipe_id, limit):
+    """Возвращает идентификаторы похожих рецептов и оценки сходства."""
+    signature = get_signature(recipe_id)
+    lookup = Q()
+    for band, bucket in band_buckets(signature):
+        lookup |= Q(band=band, bucket=bucket)
+    candidates = list(
+        RecipeBucket.objects.filter(lookup).exclude(recipe_id=recipe_id)
+        .values_list('recipe_id', flat=True)
+        .distinct()[:SIMILARITY_MAX_CANDIDATES])
+    signatures = dict(RecipeSignature.objects.filter(
+        recipe_id__in=candidates).values_list('recipe_id', 'signature'))
+    keys = list(signatures)
+    return rank_candidates(signature, keys,
+                           [from_bytes(signatures[key]) for key in keys],
+                           limit)
@@ -0,0 +1,394 @@
+"""
+Перенос рецептов между окружениями в формате JSON Lines.
+
+Каждая строка файла — одна запись {"model": ..., ...}. Записи идут
+разделами в порядке зависимостей: теги, ингредиенты, пользователи,
+рецепты с тегами и ингредиентами, избранное, списки покупок, подписки.
+Записи ссылаются друг на друга естественными ключами, а не id:
+пользователь — email, рецепт — short_url, тег — slug, ингредиент —
+название. Загрузке не нужна таблица соответствия id, память ограничена
+одним пакетом, а повторная загрузка пакета ничего не меняет — поэтому
+прерванную загрузку можно продолжить с последнего сохраненного пакета.
+
+Изображения и аватары передаются именами файлов в хранилище, сами файлы
+переносятся копированием каталога media. Пароли переносятся хешами,
+права администраторов не переносятся. Скрытые до удаления объекты не
+выгружаются.
+
+Загрузка пишет строки через bulk_create, без save() и сигналов: индекс
+похожих рецептов, рейтинги, итоги списков покупок и версии кэшированного
+состояния пользователей обновляются по пакетам, а статистику затронутых
+авторов после загрузки пересчитывает backfill_author_stats.
+"""
+import json
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+from foodgram_backend.invalidation import bus
+
+from .constants import TRANSFER_BATCH_SIZE
+from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                     RecipeRank, ShoppingCart, Tag)
+from .shopping_cart import rebuild_totals
+from .similarity import index_recipes
+from api.viewer_state import bump_viewer_state
+from users.models import Subscription, User
+
+FORMAT = 'foodgram'
+FORMAT_VERSION = 1
+
+
+class TransferError(Exception):
+    """Файл не подходит для загрузки."""
+
+
+class RecordEncoder(DjangoJSONEncoder):
+    """Даты с микросекундами: DjangoJSONEncoder округляет до миллисекунд."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def dump_record(record):
+    return json.dumps(record, cls=RecordEncoder, ensure_ascii=False,
+                      separators=(',', ':'))
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def snapshot():
+    """
+    Транзакция, в которой все разделы выгрузки читаются из одного снимка
+    базы: на PostgreSQL — REPEATABLE READ, иначе связь могла бы сослаться
+    на рецепт, созданный после выгрузки рецептов.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL '
+                               'REPEATABLE READ READ ONLY')
+        yield
+
+
+def export_recipes(recipes, chunk_size):
+    for batch in batches(recipes.iterator(chunk_size=chunk_size),
+                         chunk_size):
+        recipe_ids = [recipe['id'] for recipe in batch]
+        tags = defaultdict(list)
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+        ).order_by('pk').values_list('recipe_id', 'tag__slug'):
+            tags[recipe_id].append(slug)
+        ingredients = defaultdict(list)
+        for recipe_id, name, amount in IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+        ).order_by('pk').values_list('recipe_id', 'ingredient__name',
+                                     'amount'):
+            ingredients[recipe_id].append([name, amount])
+        for recipe in batch:
+            recipe_id = recipe.pop('id')
+            recipe['author'] = recipe.pop('author_email')
+            yield {'model': 'recipe', **recipe, 'tags': tags[recipe_id],
+                   'ingredients': ingredients[recipe_id]}
+
+
+def export_records(chunk_size=TRANSFER_BATCH_SIZE):
+    """
+    Записи для выгрузки. Запросы читаются итераторами, на PostgreSQL —
+    серверными курсорами, поэтому в памяти не больше chunk_size строк.
+    """
+    yield {'model': FORMAT, 'version': FORMAT_VERSION}
+    for tag in Tag.objects.order_by('pk').values(
+            'name', 'slug').iterator(chunk_size=chunk_size):
+        yield {'model': 'tag', **tag}
+    for ingredient in Ingredient.objects.order_by('pk').values(
+            'name', 'measurement_unit').iterator(chunk_size=chunk_size):
+        yield {'model': 'ingredient', **ingredient}
+    for user in User.objects.filter(is_hidden=False).order_by('pk').values(
+            'email', 'username', 'first_name', 'last_name', 'password',
+            'avatar', 'is_active', 'date_joined'
+    ).iterator(chunk_size=chunk_size):
+        yield {'model': 'user', **user}
+    yield from export_recipes(
+        Recipe.objects.filter(is_hidden=False).order_by('pk').values(
+            'id', 'short_url', 'name', 'text', 'cooking_time', 'image',
+            'pub_date', author_email=F('author__email')),
+        chunk_size)
+    for name, model in (('favorite', Favorite),
+                        ('shopping_cart', ShoppingCart)):
+        for user, recipe, created in model.objects.filter(
+                user__is_hidden=False, recipe__is_hidden=False
+        ).order_by('user_id', 'pk').values_list(
+            'user__email', 'recipe__short_url', 'created'
+        ).iterator(chunk_size=chunk_size):
+            yield {'model': name, 'user': user, 'recipe': recipe,
+                   'created': created}
+    for user, author, created in Subscription.objects.filter(
+            user__is_hidden=False, author__is_hidden=False
+    ).order_by('user_id', 'pk').values_list(
+        'user__email', 'author__email', 'created'
+    ).iterator(chunk_size=chunk_size):
+        yield {'model': 'subscription', 'user': user, 'author': author,
+               'created': created}
+
+
+def read_records(stream, offset=0):
+    """Записи файла с позициями их концов, начиная с offset."""
+    stream.seek(offset)
+    while line := stream.readline():
+        if line.strip():
+            yield json.loads(line), stream.tell()
+
+
+def parse_date(value):
+    return parse_datetime(value) if value else None
+
+
+def user_ids(emails):
+    return dict(User.objects.filter(email__in=emails).values_list(
+        'email', 'id'))
+
+
+def recipe_ids(short_urls):
+    return dict(Recipe.objects.filter(short_url__in=short_urls).values_list(
+        'short_url', 'id'))
+
+
+def publish(model, pks):
+    for pk in pks:
+        bus.publish_on_commit(model._meta.label_lower, pk)
+
+
+class Importer:
+    """
+    Загружает записи пакетами по batch_size записей одного раздела,
+    каждый пакет — в своей транзакции. Конфликты с уже существующими
+    строками пропускаются: существующие объекты не перезаписываются.
+    """
+
+    def __init__(self, batch_size=TRANSFER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.loaded = Counter()
+        self.skipped = Counter()
+        self.tag_ids = None
+        # Авторы, чью статистику нужно пересчитать после загрузки.
+        self.authors = set()
+
+    def load(self, stream, offset=0, checkpoint=None):
+        """
+        Загружает файл с позиции offset. После каждого пакета вызывает
+        checkpoint(позиция), с которой загрузку можно продолжить.
+        """
+        model = None
+        batch = []
+        end = offset
+        for record, position in read_records(stream, offset):
+            if end == 0 and record.get('model') != FORMAT:
+                raise TransferError('Файл не является выгрузкой рецептов')
+            if batch and (record.get('model') != model
+                          or len(batch) == self.batch_size):
+                self.load_batch(model, batch)
+                if checkpoint is not None:
+                    checkpoint(end)
+                batch = []
+            model = record.get('model')
+            batch.append(record)
+            end = position
+        if batch:
+            self.load_batch(model, batch)
+            if checkpoint is not None:
+                checkpoint(end)
+
+    def load_batch(self, model, records):
+        loader = self.loaders.get(model)
+        if loader is None:
+            raise TransferError(f'Неизвестный тип записи: {model}')
+        with transaction.atomic():
+            loaded = loader(self, records)
+        self.loaded[model] += loaded
+        self.skipped[model] += len(records) - loaded
+
+    def load_header(self, records):
+        for record in records:
+            if record.get('version') != FORMAT_VERSION:
+                raise TransferError(
+                    f'Неподдерживаемая версия формата: '
+                    f'{record.get("version")}')
+        return len(records)
+
+    def load_tags(self, records):
+        Tag.objects.bulk_create(
+            [Tag(name=record['name'], slug=record['slug'])
+             for record in records], ignore_conflicts=True)
+        stored = dict(Tag.objects.filter(
+            slug__in=[record['slug'] for record in records]
+        ).values_list('slug', 'id'))
+        self.tag_ids = None
+        publish(Tag, stored.values())
+        return len(stored)
+
+    def load_ingredients(self, records):
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=record['name'],
+                        measurement_unit=record['measurement_unit'])
+             for record in records], ignore_conflicts=True)
+        stored = dict(Ingredient.objects.filter(
+            name__in=[record['name'] for record in records]
+        ).values_list('name', 'id'))
+        publish(Ingredient, stored.values())
+        return len(stored)
+
+    def load_users(self, records):
+        User.objects.bulk_create(
+            [User(email=record['email'], username=record['username'],
+                  first_name=record['first_name'],
+                  last_name=record['last_name'],
+                  password=record['password'],
+                  avatar=record['avatar'] or None,
+                  is_active=record['is_active'],
+                  date_joined=parse_date(record['date_joined']))
+             for record in records], ignore_conflicts=True)
+        # Пользователь, чье имя уже занято другим email, не создается.
+        stored = user_ids([record['email'] for record in records])
+        publish(User, stored.values())
+        return len(stored)
+
+    def load_recipes(self, records):
+        authors = user_ids({record['author'] for record in records})
+        records = [record for record in records
+                   if record['short_url'] and record['author']
+                   in authors]
+        short_urls = [record['short_url'] for record in records]
+        existing = set(Recipe.objects.filter(
+            short_url__in=short_urls).values_list('short_url', flat=True))
+        Recipe.objects.bulk_create(
+            [Recipe(author_id=authors[record['author']],
+                    short_url=record['short_url'], name=record['name'],
+                    text=record['text'],
+                    cooking_time=record['cooking_time'],
+                    image=record['image']) for record in records
+             if record['short_url'] not in existing],
+            ignore_conflicts=True)
+        stored = {
+            short_url: (recipe_id, author_id)
+            for short_url, recipe_id, author_id in Recipe.objects.filter(
+                short_url__in=short_urls
+            ).values_list('short_url', 'id', 'author_id')
+        }
+        loaded = 0
+        recipes = {}
+        for record in records:
+            recipe_id, author_id = stored.get(record['short_url'],
+                                              (None, None))
+            # Рецепт другого автора с тем же short_url чужой, не трогаем.
+            if author_id != authors[record['author']]:
+                continue
+            loaded += 1
+            # Существующий рецепт не перезаписывается: ни дата, ни
+            # ингредиенты, от которых зависят итоги списков покупок.
+            if record['short_url'] not in existing:
+                recipes[recipe_id] = record
+        # bulk_create проставляет pub_date (auto_now_add) текущим временем.
+        Recipe.objects.bulk_update(
+            [Recipe(pk=recipe_id,
+                    pub_date=parse_date(record['pub_date']))
+             for recipe_id, record in recipes.items()], ['pub_date'])
+        self.link_recipes(recipes)
+        RecipeRank.objects.bulk_create(
+            [RecipeRank(recipe_id=recipe_id) for recipe_id in recipes],
+            ignore_conflicts=True)
+        index_recipes(list(recipes))
+        publish(Recipe, recipes)
+        return loaded
+
+    def link_recipes(self, recipes):
+        if self.tag_ids is None:
+            self.tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        ingredient_ids = dict(Ingredient.objects.filter(name__in={
+            name for record in recipes.values()
+            for name, _ in record['ingredients']
+        }).values_list('name', 'id'))
+        Recipe.tags.through.objects.bulk_create(
+            [Recipe.tags.through(recipe_id=recipe_id,
+                                 tag_id=self.tag_ids[slug])
+             for recipe_id, record in recipes.items()
+             for slug in record['tags'] if slug in self.tag_ids],
+            ignore_conflicts=True)
+        IngredientInRecipe.objects.bulk_create(
+            [IngredientInRecipe(recipe_id=recipe_id,
+                                ingredient_id=ingredient_ids[name],
+                                amount=amount)
+             for recipe_id, record in recipes.items()
+             for name, amount in record['ingredients']
+             if name in ingredient_ids],
+            ignore_conflicts=True)
+
+    def load_relations(self, model, records):
+        users = user_ids({record['user'] for record in records})
+        recipes = recipe_ids({record['recipe'] for record in records})
+        relations = [
+            model(user_id=users[record['user']],
+                  recipe_id=recipes[record['recipe']],
+                  created=parse_date(record['created']))
+            for record in records
+            if record['user'] in users and record['recipe'] in recipes
+        ]
+        model.objects.bulk_create(relations, ignore_conflicts=True)
+        linked = {relation.recipe_id for relation in relations}
+        RecipeRank.objects.filter(recipe_id__in=linked).update(
+            is_dirty=True)
+        self.authors.update(Recipe.objects.filter(
+            pk__in=linked).values_list('author_id', flat=True))
+        bump_viewer_state({relation.user_id for relation in relations})
+        return len(relations)
+
+    def load_favorites(self, records):
+        return self.load_relations(Favorite, records)
+
+    def load_shopping_carts(self, records):
+        loaded = self.load_relations(ShoppingCart, records)
+        rebuild_totals(list(user_ids({record['user']
+                                      for record in records}).values()))
+        return loaded
+
+    def load_subscriptions(self, records):
+        users = user_ids({record[field] for record in records
+                          for field in ('user', 'author')})
+        subscriptions = [
+            Subscription(user_id=users[record['user']],
+                         author_id=users[record['author']],
+                         created=parse_date(record['created']))
+            for record in records
+            if record['user'] in users and record['author'] in users
+        ]
+        Subscription.objects.bulk_create(subscriptions,
+                                         ignore_conflicts=True)
+        self.authors.update(subscription.author_id
+                            for subscription in subscriptions)
+        bump_viewer_state({subscription.user_id
+                           for subscription in subscriptions})
+        return len(subscriptions)
+
+    loaders = {
+        FORMAT: load_header,
+        'tag': load_tags,
+        'ingredient': load_ingredients,
+        'user': load_users,
+        'recipe': load_recipes,
+        'favorite': load_favorites,
+        'shopping_cart': load_shopping_carts,
+        'subscription': load_subscriptions,
+    }
@@ -0,0 +1,127 @@
+"""
+Отложенная запись счетчика просмотров рецептов.
+
+Просмотры копятся в памяти процесса и раз в VIEW_COUNTER_FLUSH_INTERVAL
+секунд записываются в базу данных одним пакетным INSERT ... ON CONFLICT
+DO UPDATE. Буфер ограничен VIEW_COUNTER_MAX_RECIPES рецептами: при
+переполнении запись запускается досрочно, а если база данных
+недоступна, просмотры новых рецептов отбрасываются. При штатной остановке
+процесса буфер сбрасывается, при аварийной теряются просмотры не более чем
+за один интервал.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Case, F, Value, When
+
+from .constants import VIEW_COUNTER_MAX_RECIPES
+from .models import Recipe, RecipeRank
+
+logger = logging.getLogger(__name__)
+
+
+def write_views(deltas):
+    """
+    Прибавляет просмотры к счетчикам рецептов одним запросом. Рецептам без
+    строки рейтинга она создается; просмотры удаленных рецептов
+    отбрасываются.
+    """
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(RecipeRank._meta.db_table)
+        recipes = connection.ops.quote_name(Recipe._meta.db_table)
+        values = ', '.join(['(%s, %s)'] * len(deltas))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (recipe_id, views_count, '
+                f'favorites_count, shopping_carts_count, popular, trending, '
+                f'is_dirty, updated_at) '
+                f'SELECT delta.recipe_id, delta.views, 0, 0, 0, 0, TRUE, '
+                f'NOW() FROM (VALUES {values}) AS delta (recipe_id, views) '
+                f'WHERE EXISTS (SELECT 1 FROM {recipes} AS recipe '
+                f'WHERE recipe.id = delta.recipe_id) '
+                f'ON CONFLICT (recipe_id) DO UPDATE '
+                f'SET views_count = {table}.views_count '
+                f'+ EXCLUDED.views_count',
+                [item for pair in deltas.items() for item in pair])
+        return
+    with transaction.atomic():
+        recipe_ids = Recipe.objects.filter(pk__in=deltas).values_list(
+            'pk', flat=True)
+        RecipeRank.objects.bulk_create(
+            [RecipeRank(recipe_id=recipe_id) for recipe_id in recipe_ids],
+            ignore_conflicts=True)
+        RecipeRank.objects.filter(recipe_id__in=deltas).update(
+            views_count=F('views_count') + Case(
+                *(When(recipe_id=recipe_id, then=Value(views))
+                  for recipe_id, views in deltas.items()),
+                default=Value(0)))
+
+
+class ViewCounter:
+
+    def __init__(self, max_recipes=VIEW_COUNTER_MAX_RECIPES):
+        self.max_recipes = max_recipes
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.dropped = 0
+        self.wakeup = threading.Event()
+        self.pid = None
+
+    def increment(self, recipe_id):
+        self.ensure_started()
+        with self.lock:
+            if (recipe_id not in self.pending
+                    and len(self.pending) >= self.max_recipes):
+                self.dropped += 1
+                self.wakeup.set()
+                return
+            self.pending[recipe_id] += 1
+            if len(self.pending) >= self.max_recipes:
+                self.wakeup.set()
+
+    def ensure_started(self):
+        """Запускает поток записи; после fork — заново в каждом процессе."""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.pending = Counter()
+            threading.Thread(target=self.run, name='view-counter',
+                             daemon=True).start()
+            atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(settings.VIEW_COUNTER_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            deltas, self.pending = self.pending, Counter()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            logger.warning('Буфер просмотров переполнен, потеряно: %s',
+                           dropped)
+        if not deltas:
+            return
+        try:
+            write_views(deltas)
+        except Exception:
+            logger.exception('Не удалось записать просмотры рецептов')
+            with self.lock:
+                for recipe_id, views in deltas.items():
+                    if (recipe_id in self.pending
+                            or len(self.pending) < self.max_recipes):
+                        self.pending[recipe_id] += views
+
+
+view_counter = ViewCounter()
@@ -1,19 +1,30 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DefaultUserAdmin
+from foodgram_backend.counts import EstimatedCountPaginator
 
 from .models import Subscription, User
+from recipes.admin import DeferredDeletionAdmin
+from recipes.deletion import hide_user
 
 admin.site.empty_value_display = '---'
 
 
 @admin.register(User)
-class UserAdmin(DefaultUserAdmin):
-    list_display = ('email', 'username', 'first_name', 'last_name', 'is_staff')
-    search_fields = ('email', 'username')
+class UserAdmin(DeferredDeletionAdmin, DefaultUserAdmin):
+    list_display = ('email', 'username', 'first_name', 'last_name', 'is_staff',
+                    'is_hidden')
+    search_fields = ('^email', '^username')
     ordering = ('email',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    hide = staticmethod(hide_user)
 
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
-    search_fields = ('user__username', 'author__username')
+    list_select_related = ('user', 'author')
+    search_fields = ('=user__username', '=author__username')
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-19 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='viewer_state_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия избранного, покупок и подписок'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Существующим подпискам дата не проставляется: поле добавляется без
+    значения по умолчанию в базе, а даты заполняет backfill_author_stats.
+    """
+
+    dependencies = [
+        ('users', '0004_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='created',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Дата подписки'),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, null=True, verbose_name='Дата подписки'),
+        ),
+    ]
@@ -1,7 +1,10 @@
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models
+from django.utils import timezone
+from foodgram_backend.hashing import rehasher
 
 from users.constants import (INVALID_USERNAME, MAX_LENGTH_EMAIL,
                              MAX_LENGTH_FIRST_NAME, MAX_LENGTH_LAST_NAME,
@@ -30,15 +33,30 @@ class User(AbstractUser):
     avatar = models.ImageField('Аватар',
                                upload_to='avatars/',
                                null=True, blank=True)
+    viewer_state_version = models.PositiveIntegerField(
+        'Версия избранного, покупок и подписок', default=0, editable=False)
+    is_hidden = models.BooleanField('Скрыт до удаления', default=False,
+                                    editable=False)
 
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ('username',)
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(is_hidden=True),
+                         name='user_hidden_idx'),
+            models.Index(fields=['avatar'], name='user_avatar_idx'),
+        ]
 
     def __str__(self):
         return self.username
 
+    def check_password(self, raw_password):
+        """Устаревший хеш обновляется в фоне, а не во время входа."""
+        return check_password(
+            raw_password, self.password,
+            lambda raw_password: rehasher.schedule(self, raw_password))
+
     def clean(self):
         if self.username == INVALID_USERNAME:
             raise ValidationError('Недопустимое имя пользователя.')
@@ -56,6 +74,9 @@ class Subscription(models.Model):
                                on_delete=models.CASCADE,
                                related_name='subscribers',
                                verbose_name='Подписки')
+    created = models.DateTimeField('Дата подписки',
+                                   default=timezone.now, null=True,
+                                   editable=False)
 
     class Meta:
         verbose_name = 'подписка'
@@ -64,6 +85,10 @@ class Subscription(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_subscription')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='subscription_author_user_idx'),
+        ]
         ordering = ('user',)
 
     def __str__(self):
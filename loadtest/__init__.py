@@ -0,0 +1 @@
+"""Нагрузочное тестирование API по запросам postman-коллекции."""
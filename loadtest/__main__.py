@@ -0,0 +1,78 @@
+"""
+Запуск: python -m loadtest --concurrency 20 --duration 60 --output run.json
+
+Без --rate нагрузка замкнутая: каждый из --concurrency пользователей
+начинает следующий сценарий сразу после предыдущего. С --rate сценарии
+стартуют с заданной средней частотой в секунду независимо от скорости
+ответов сервера.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from .client import HTTPError
+from .collection import Collection
+from .report import format_comparison, format_table
+from .runner import Runner, SetupError
+
+DEFAULT_COLLECTION = (Path(__file__).resolve().parent.parent
+                      / 'postman_collection'
+                      / 'foodgram.postman_collection.json')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog='python -m loadtest',
+        description='Нагрузка на API сценариями из postman-коллекции.')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                        help='Адрес сервера.')
+    parser.add_argument('--collection', default=DEFAULT_COLLECTION,
+                        help='Путь к postman-коллекции.')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='Длительность нагрузки, секунд.')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='Число виртуальных пользователей.')
+    parser.add_argument('--rate', type=float,
+                        help='Частота запуска сценариев в секунду; '
+                             '--concurrency ограничивает их одновременное '
+                             'число.')
+    parser.add_argument('--seed', type=int,
+                        help='Зерно генератора для повторяемых прогонов.')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Таймаут одного запроса, секунд.')
+    parser.add_argument('--output', help='Файл для отчета в JSON.')
+    parser.add_argument('--compare',
+                        help='Отчет прошлого прогона для сравнения.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    runner = Runner(Collection(args.collection), args.base_url, args.seed,
+                    args.timeout)
+    try:
+        duration = asyncio.run(
+            runner.run(args.concurrency, args.duration, args.rate))
+    except (HTTPError, SetupError) as error:
+        sys.exit(f'Подготовка не удалась: {error}')
+    report = runner.stats.summary(duration, {
+        'base_url': args.base_url,
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'duration': args.duration,
+        'seed': args.seed,
+    })
+    content = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(content + '\n', encoding='utf-8')
+    else:
+        print(content)
+    print(format_table(report), file=sys.stderr)
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        print(format_comparison(report, baseline), file=sys.stderr)
+
+
+main()
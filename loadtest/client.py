@@ -0,0 +1,100 @@
+"""Минимальный асинхронный HTTP/1.1-клиент на asyncio с keep-alive."""
+import asyncio
+from urllib.parse import urlsplit
+
+
+class HTTPError(Exception):
+    """Соединение оборвалось или ответ не удалось разобрать."""
+
+
+class Response:
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class HTTPClient:
+    """Одно соединение с сервером; запросы через него идут по очереди."""
+
+    def __init__(self, base_url, timeout=30):
+        url = urlsplit(base_url)
+        self.ssl = url.scheme == 'https'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.ssl else 80)
+        self.host_header = url.netloc
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl or None)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        reused = self.writer is not None
+        try:
+            return await asyncio.wait_for(
+                self._request(method, path, headers or {}, body),
+                self.timeout)
+        except (OSError, asyncio.IncompleteReadError, HTTPError) as error:
+            self.close()
+            if not reused:
+                raise HTTPError(str(error) or repr(error)) from error
+        # Сервер мог закрыть простаивающее соединение — пробуем заново.
+        try:
+            return await asyncio.wait_for(
+                self._request(method, path, headers or {}, body),
+                self.timeout)
+        except (OSError, asyncio.IncompleteReadError) as error:
+            self.close()
+            raise HTTPError(str(error) or repr(error)) from error
+
+    async def _request(self, method, path, headers, body):
+        if self.writer is None:
+            await self.connect()
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host_header}',
+                 f'Content-Length: {len(body)}']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HTTPError('Сервер закрыл соединение')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError) as error:
+            raise HTTPError(f'Некорректный ответ: {status_line!r}') from error
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding') == 'chunked':
+            body = await self.read_chunked()
+        elif 'content-length' in response_headers:
+            body = await self.reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            body = await self.reader.read()
+            self.close()
+            return Response(status, response_headers, body)
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return Response(status, response_headers, body)
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if not size:
+                await self.reader.readline()
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
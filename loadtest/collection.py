@@ -0,0 +1,80 @@
+"""Разбор postman-коллекции и подстановка переменных в запросы."""
+import json
+import re
+from urllib.parse import quote
+
+VARIABLE = re.compile(r'{{\s*(\w+)\s*}}')
+BODY_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+def render(template, variables, escape=str):
+    return VARIABLE.sub(
+        lambda match: escape(str(variables[match.group(1)])), template)
+
+
+def quote_value(value):
+    return quote(value, safe='')
+
+
+class RequestTemplate:
+
+    def __init__(self, name, method, url, body, auth):
+        self.name = name
+        self.method = method
+        self.path = url.replace('{{baseUrl}}', '')
+        self.body = body if method in BODY_METHODS else ''
+        self.auth = auth
+
+    @property
+    def endpoint(self):
+        """Ключ для статистики: метод и путь без значений переменных."""
+        return self.method + ' ' + VARIABLE.sub(r'{\1}', self.path)
+
+    def render(self, variables):
+        headers = {'Accept': 'application/json'}
+        if self.auth is not None:
+            name, value = self.auth
+            headers[name] = render(value, variables)
+        body = render(self.body, variables).encode()
+        if body:
+            headers['Content-Type'] = 'application/json'
+        path = render(self.path, variables, quote_value)
+        return self.method, path, headers, body
+
+
+def parse_auth(auth):
+    """Заголовок авторизации из описания postman или None."""
+    if auth['type'] != 'apikey':
+        return None
+    fields = {field['key']: field['value'] for field in auth['apikey']}
+    return fields['key'], fields['value']
+
+
+class Collection:
+
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+        self.variables = {variable['key']: variable['value']
+                          for variable in data.get('variable', [])}
+        self.requests = {}
+        self.collect(data['item'], {'type': 'noauth'})
+
+    def collect(self, items, parent_auth):
+        for item in items:
+            auth = item.get('auth') or parent_auth
+            if 'item' in item:
+                self.collect(item['item'], auth)
+                continue
+            if item['name'] in self.requests:
+                continue
+            request = item['request']
+            auth = request.get('auth') or auth
+            url = request['url']
+            self.requests[item['name']] = RequestTemplate(
+                item['name'], request['method'],
+                url['raw'] if isinstance(url, dict) else url,
+                request.get('body', {}).get('raw', ''), parse_auth(auth))
+
+    def __getitem__(self, name):
+        return self.requests[name]
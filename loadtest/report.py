@@ -0,0 +1,98 @@
+"""Сбор задержек и итоговый отчет в JSON."""
+import math
+from collections import Counter, defaultdict
+
+
+def percentile(ordered, share):
+    """Процентиль по рангу для отсортированного списка."""
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def latency_summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        'p50': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99': round(percentile(ordered, 0.99) * 1000, 2),
+        'max': round(ordered[-1] * 1000, 2),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+class Stats:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.statuses = defaultdict(Counter)
+        self.scenarios = Counter()
+        self.dropped = 0
+
+    def record(self, endpoint, status, seconds):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+        if status is None or status >= 400:
+            self.errors[endpoint] += 1
+
+    def summary(self, duration, settings):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                'requests': len(latencies),
+                'errors': self.errors[endpoint],
+                'error_rate': round(self.errors[endpoint] / len(latencies), 4),
+                'throughput': round(len(latencies) / duration, 2),
+                'statuses': dict(self.statuses[endpoint]),
+                'latency_ms': latency_summary(latencies),
+            }
+        all_latencies = [latency for latencies in self.latencies.values()
+                         for latency in latencies]
+        total = len(all_latencies)
+        errors = sum(self.errors.values())
+        return {
+            'settings': settings,
+            'duration': round(duration, 2),
+            'total': {
+                'requests': total,
+                'errors': errors,
+                'error_rate': round(errors / total, 4) if total else 0,
+                'throughput': round(total / duration, 2),
+                'dropped_arrivals': self.dropped,
+                'latency_ms': (latency_summary(all_latencies)
+                               if all_latencies else None),
+            },
+            'scenarios': dict(self.scenarios),
+            'endpoints': endpoints,
+        }
+
+
+def format_table(report):
+    lines = [f'{"эндпоинт":<58} {"запросов":>8} {"ошибок":>7} '
+             f'{"p50":>8} {"p95":>8} {"p99":>8}']
+    rows = list(report['endpoints'].items())
+    if report['total']['latency_ms']:
+        rows.append(('ВСЕГО', report['total']))
+    for endpoint, stats in rows:
+        latency = stats['latency_ms']
+        lines.append(f'{endpoint[:58]:<58} {stats["requests"]:>8} '
+                     f'{stats["errors"]:>7} {latency["p50"]:>8} '
+                     f'{latency["p95"]:>8} {latency["p99"]:>8}')
+    return '\n'.join(lines)
+
+
+def format_comparison(report, baseline):
+    """Изменение p95 и доли ошибок относительно прошлого прогона."""
+    lines = [f'{"эндпоинт":<58} {"p95 было":>9} {"p95 стало":>9} '
+             f'{"ошибок было":>11} {"стало":>7}']
+    for endpoint, stats in report['endpoints'].items():
+        previous = baseline['endpoints'].get(endpoint)
+        if previous is None:
+            continue
+        lines.append(f'{endpoint[:58]:<58} '
+                     f'{previous["latency_ms"]["p95"]:>9} '
+                     f'{stats["latency_ms"]["p95"]:>9} '
+                     f'{previous["error_rate"]:>11.2%} '
+                     f'{stats["error_rate"]:>7.2%}')
+    return '\n'.join(lines)
@@ -0,0 +1,230 @@
+"""Подготовка пользователей и данных, прогон сценариев под нагрузкой."""
+import asyncio
+import json
+import random
+import secrets
+import time
+
+from .client import HTTPClient, HTTPError
+from .report import Stats
+from .scenarios import SCENARIOS
+
+USER_PREFIX = 'load-'
+USER_PASSWORD = 'Load-test-Pa$$w0rd'
+RECIPE_PAGES = 10
+SETUP_RETRIES = 10
+SETUP_MAX_RETRY_AFTER = 10
+
+
+class SetupError(Exception):
+    """Сервер не готов к нагрузке: нет данных или пользователей."""
+
+
+class Session:
+    """Виртуальный пользователь: свое соединение и свои переменные."""
+
+    def __init__(self, client, variables):
+        self.client = client
+        self.variables = variables
+
+
+class Pools:
+    """Существующие объекты, из которых выбираются переменные запросов."""
+
+    def __init__(self, tags, ingredients, recipe_ids):
+        self.tags = tags
+        self.ingredients = ingredients
+        self.recipe_ids = recipe_ids
+
+    def pick(self, rng):
+        first_tag, second_tag, third_tag = (
+            rng.choice(self.tags) for _ in range(3))
+        first_ingredient, second_ingredient = (
+            rng.choice(self.ingredients) for _ in range(2))
+        return {
+            'firstRecipeId': rng.choice(self.recipe_ids),
+            'firstTagId': first_tag['id'],
+            'secondTagId': second_tag['id'],
+            'thirdTagId': third_tag['id'],
+            'secondTagSlug': second_tag['slug'],
+            'thirdTagSlug': third_tag['slug'],
+            'firstIndredientId': first_ingredient['id'],
+            'secondIndredientId': second_ingredient['id'],
+            'ingredientNameFirstLatter': first_ingredient['name'][:1],
+        }
+
+
+async def get_json(client, path):
+    response = await client.request('GET', path,
+                                    {'Accept': 'application/json'})
+    if response.status != 200:
+        raise SetupError(f'GET {path}: ответ {response.status}')
+    return json.loads(response.body)
+
+
+async def discover(client):
+    tags = await get_json(client, '/api/tags/')
+    ingredients = await get_json(client, '/api/ingredients/')
+    recipe_ids = []
+    for page in range(1, RECIPE_PAGES + 1):
+        data = await get_json(client, f'/api/recipes/?limit=100&page={page}')
+        recipe_ids.extend(recipe['id'] for recipe in data['results'])
+        if not data['next']:
+            break
+    if not (tags and ingredients and recipe_ids):
+        raise SetupError('Для нагрузки нужны хотя бы один тег, ингредиент '
+                         'и рецепт.')
+    return Pools(tags, ingredients, recipe_ids)
+
+
+async def sign_up(collection, client, username):
+    """Регистрирует пользователя запросами коллекции, возвращает токен."""
+    variables = dict(collection.variables,
+                     email=json.dumps(f'{username}@example.com'),
+                     username=json.dumps(username),
+                     password=json.dumps(USER_PASSWORD))
+    for name in ('create_first_user', 'get_token_for_first_user'):
+        response = await request_with_retries(
+            client, *collection[name].render(variables))
+        if response.status >= 300:
+            raise SetupError(f'{name}: ответ {response.status} '
+                             f'{response.body[:200]!r}')
+    return json.loads(response.body)['auth_token']
+
+
+async def request_with_retries(client, *request):
+    """
+    Повторяет запрос, пока сервер просит подождать недолго: занятый пул
+    хеширования паролей отвечает 429 с Retry-After в секунды. Ограничение
+    частоты регистраций и входов ждать бессмысленно, его поднимают
+    переменными окружения сервера (см. README).
+    """
+    for _ in range(SETUP_RETRIES):
+        response = await client.request(*request)
+        retry_after = response.headers.get('retry-after', '')
+        if (response.status not in (429, 503) or not retry_after.isdigit()
+                or int(retry_after) > SETUP_MAX_RETRY_AFTER):
+            return response
+        await asyncio.sleep(int(retry_after))
+    return response
+
+
+async def create_sessions(collection, base_url, count, timeout):
+    run = secrets.token_hex(4)
+    sessions = [Session(HTTPClient(base_url, timeout),
+                        dict(collection.variables)) for _ in range(count)]
+
+    async def prepare(number, session):
+        token = await sign_up(collection, session.client,
+                              f'{USER_PREFIX}{run}-{number}')
+        session.variables['userToken'] = token
+        session.variables['secondUserToken'] = token
+
+    await asyncio.gather(*(prepare(number, session)
+                           for number, session in enumerate(sessions)))
+    return sessions
+
+
+class Runner:
+
+    def __init__(self, collection, base_url, seed=None, timeout=30):
+        self.collection = collection
+        self.base_url = base_url
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.stats = Stats()
+        self.pools = None
+
+    async def setup(self, users):
+        client = HTTPClient(self.base_url, self.timeout)
+        try:
+            self.pools = await discover(client)
+        finally:
+            client.close()
+        return await create_sessions(self.collection, self.base_url, users,
+                                     self.timeout)
+
+    def choose_scenario(self):
+        return self.rng.choices(
+            SCENARIOS, [scenario.weight for scenario in SCENARIOS])[0]
+
+    async def run_scenario(self, session, scenario):
+        session.variables.update(self.pools.pick(self.rng))
+        for step in scenario.steps:
+            template = self.collection[step.request]
+            method, path, headers, body = template.render(session.variables)
+            if step.anonymous:
+                headers.pop('Authorization', None)
+            started = time.perf_counter()
+            try:
+                response = await session.client.request(
+                    method, path, headers, body)
+            except HTTPError:
+                self.stats.record(template.endpoint, None,
+                                  time.perf_counter() - started)
+                return
+            self.stats.record(template.endpoint, response.status,
+                              time.perf_counter() - started)
+            if step.capture:
+                if response.status >= 300:
+                    return
+                session.variables[step.capture] = (
+                    json.loads(response.body)['id'])
+        self.stats.scenarios[scenario.name] += 1
+
+    async def closed_loop(self, sessions, duration):
+        """Каждый пользователь начинает новый сценарий сразу после прошлого."""
+        deadline = time.perf_counter() + duration
+
+        async def worker(session):
+            while time.perf_counter() < deadline:
+                await self.run_scenario(session, self.choose_scenario())
+
+        await asyncio.gather(*(worker(session) for session in sessions))
+
+    async def open_loop(self, sessions, duration, rate):
+        """
+        Сценарии стартуют пуассоновским потоком с заданной частотой.
+
+        Одновременно выполняется не больше сценариев, чем пользователей;
+        прибытия сверх этого не откладываются, а считаются отброшенными,
+        чтобы медленный сервер не снижал фактическую нагрузку незаметно.
+        """
+        idle = asyncio.Queue()
+        for session in sessions:
+            idle.put_nowait(session)
+        tasks = set()
+
+        async def start(session):
+            try:
+                await self.run_scenario(session, self.choose_scenario())
+            finally:
+                idle.put_nowait(session)
+
+        deadline = time.perf_counter() + duration
+        arrival = time.perf_counter()
+        while True:
+            arrival += self.rng.expovariate(rate)
+            if arrival >= deadline:
+                break
+            await asyncio.sleep(max(arrival - time.perf_counter(), 0))
+            if idle.empty():
+                self.stats.dropped += 1
+                continue
+            task = asyncio.create_task(start(idle.get_nowait()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    async def run(self, users, duration, rate=None):
+        sessions = await self.setup(users)
+        started = time.perf_counter()
+        try:
+            if rate:
+                await self.open_loop(sessions, duration, rate)
+            else:
+                await self.closed_loop(sessions, duration)
+        finally:
+            for session in sessions:
+                session.client.close()
+        return time.perf_counter() - started
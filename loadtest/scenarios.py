@@ -0,0 +1,44 @@
+"""Взвешенные сценарии поведения пользователей из запросов коллекции."""
+
+
+class Step:
+
+    def __init__(self, request, capture=None, anonymous=False):
+        self.request = request
+        self.capture = capture
+        self.anonymous = anonymous
+
+
+class Scenario:
+
+    def __init__(self, name, weight, steps):
+        self.name = name
+        self.weight = weight
+        self.steps = steps
+
+
+SCENARIOS = (
+    Scenario('anonymous_browsing', 6, [
+        Step('get_recipes_list // No Auth'),
+        Step('get_recipes_list_with_two_tags_param // User', anonymous=True),
+        Step('get_recipe_detail // No Auth'),
+        Step('get_recipe_short_link // No Auth'),
+        Step('get_tag_list // No Auth'),
+        Step('get_ingredients_list_with_name_filter // User', anonymous=True),
+    ]),
+    Scenario('favoriting', 3, [
+        Step('get_recipes_list // User'),
+        Step('add_to_favorite // User'),
+        Step('get_recipes_list_with_is_favorited_param // User'),
+        Step('remove_from_favorite // User'),
+    ]),
+    Scenario('shopping_cart_download', 2, [
+        Step('add_to_shopping_cart // User'),
+        Step('download_shopping_cart // User'),
+        Step('remove_from_shopping_cart // User'),
+    ]),
+    Scenario('recipe_creation', 1, [
+        Step('create_fifth_recipe // User', capture='fifthRecipeId'),
+        Step('delete_fifth_recipe // Second User'),
+    ]),
+)